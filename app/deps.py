@@ -1,5 +1,12 @@
 import os
+from typing import Annotated
+from fastapi import Depends
 from fastapi.templating import Jinja2Templates
+from sqlmodel import Session
+from .storage import request_session
 
 BASE_DIR = os.path.dirname(__file__)
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+
+# Request-scoped session: declare ``s: DbSession`` on a route
+DbSession = Annotated[Session, Depends(request_session)]
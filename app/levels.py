@@ -99,3 +99,17 @@ def level_label(drill_type: DrillTypeEnum, level: int) -> str:
 def get_preset(drill_type: DrillTypeEnum, level: int) -> dict:
     lvl = LEVELS[drill_type][clamp_level(drill_type, level)-1]
     return lvl.params.copy()
+
+# ----------------- Level-up transition (shared by finish_drill and the simulator) -----------------
+TARGET_FACTOR = 1.5   # next level's time target = best time at the old level × this, capped at TMAX
+
+def next_level(drill_type: DrillTypeEnum, level: int) -> int:
+    """Level after a level-up; level 1 skips straight past a recap level."""
+    nxt = clamp_level(drill_type, level + 1)
+    if level == 1 and "recap" in level_label(drill_type, nxt).lower():
+        nxt = clamp_level(drill_type, nxt + 1)
+    return nxt
+
+def next_target_sec(level: int, prev_best_sec: float, factor: float = TARGET_FACTOR) -> int:
+    _, _, _, _, TMAX = thresholds_for_level(level)
+    return int(round(min(TMAX, prev_best_sec * factor)))
@@ -2,7 +2,9 @@
 from __future__ import annotations
 import random
 from collections import defaultdict
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, NamedTuple
+
+import numpy as np
 
 from .models import DrillTypeEnum
 
@@ -75,6 +77,119 @@ def generate_from_preset(drill_type: DrillTypeEnum, preset: Dict[str, Any]) -> T
 
     raise ValueError("Unsupported drill type")
 
+# ----------------- Vectorised batch generation -----------------
+class ProblemBatch(NamedTuple):
+    """Parallel int arrays; for division ``a`` is the dividend and ``b`` the divisor."""
+    a: np.ndarray
+    b: np.ndarray
+    answer: np.ndarray
+
+def _np_rand(rng: np.random.Generator, lo: int, hi: int, n: int) -> np.ndarray:
+    if lo > hi: lo, hi = hi, lo
+    return rng.integers(lo, hi + 1, size=n)
+
+def _np_choose_with_bias(rng, full_list, focus, weight_focus: float, n: int) -> np.ndarray:
+    full = rng.choice(np.asarray(full_list), size=n)
+    if not focus:
+        return full
+    use_focus = rng.random(n) < weight_focus
+    return np.where(use_focus, rng.choice(np.asarray(focus), size=n), full)
+
+def _swap_half(rng, a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    swap = rng.random(a.size) < 0.5
+    return np.where(swap, b, a), np.where(swap, a, b)
+
+def _draw_batch(rng: np.random.Generator, drill_type: DrillTypeEnum, preset: Dict[str, Any], n: int) -> ProblemBatch:
+    """Same per-problem distribution as generate_from_preset, n at a time."""
+    if drill_type == DrillTypeEnum.multiplication:
+        a = _np_rand(rng, preset["a_min"], preset["a_max"], n)
+        b = _np_choose_with_bias(rng, list(preset["b_set"]), list(preset.get("recap_focus", [])),
+                                 float(preset.get("recap_weight", 0.6)), n)
+        if preset.get("bias_hard"):
+            hard = rng.random(n) < 0.5
+            a = np.where(hard, np.maximum(a, _np_rand(rng, max(preset["a_min"], 6), preset["a_max"], n)), a)
+            b = np.where(hard & (b < 7), rng.choice(np.arange(7, 13), size=n), b)
+        a, b = _swap_half(rng, a, b)
+        return ProblemBatch(a, b, a * b)
+
+    if drill_type == DrillTypeEnum.addition:
+        lo, hi = preset["min"], preset["max"]
+        a, b = _np_rand(rng, lo, hi, n), _np_rand(rng, lo, hi, n)
+        carry = rng.random(n) < preset.get("carry_bias", 0.0)
+        top = max(10, hi)
+        a[carry] = np.maximum(10, _np_rand(rng, 10, top, int(carry.sum())))
+        b[carry] = np.maximum(10, _np_rand(rng, 10, top, int(carry.sum())))
+        # Rejection loop from the scalar version: each round, rows still without a
+        # carry digit resample with p=0.8 and otherwise stop.
+        idx = np.flatnonzero(carry & ((a % 10) + (b % 10) < 10))
+        while idx.size:
+            idx = idx[rng.random(idx.size) < 0.8]
+            a[idx] = _np_rand(rng, 10, top, idx.size)
+            b[idx] = _np_rand(rng, 10, top, idx.size)
+            idx = idx[(a[idx] % 10) + (b[idx] % 10) < 10]
+        a, b = _swap_half(rng, a, b)
+        return ProblemBatch(a, b, a + b)
+
+    if drill_type == DrillTypeEnum.subtraction:
+        lo, hi = preset["min"], preset["max"]
+        x, y = _np_rand(rng, lo, hi, n), _np_rand(rng, lo, hi, n)
+        a, b = np.maximum(x, y), np.minimum(x, y)
+        borrow = (rng.random(n) < preset.get("borrow_bias", 0.0)) & (a >= 10) & (b >= 10)
+        idx = np.flatnonzero(borrow & ((a % 10) >= (b % 10)))
+        while idx.size:
+            idx = idx[rng.random(idx.size) < 0.8]
+            x, y = _np_rand(rng, max(10, lo), hi, idx.size), _np_rand(rng, max(10, lo), hi, idx.size)
+            a[idx], b[idx] = np.maximum(x, y), np.minimum(x, y)
+            idx = idx[(a[idx] % 10) >= (b[idx] % 10)]
+        return ProblemBatch(a, b, a - b)
+
+    if drill_type == DrillTypeEnum.division:
+        d = _np_choose_with_bias(rng, list(preset["divisor_set"]), list(preset.get("recap_focus", [])),
+                                 float(preset.get("recap_weight", 0.6)), n)
+        q = _np_rand(rng, preset["q_min"], preset["q_max"], n)
+        return ProblemBatch(d * q, d, q)
+
+    raise ValueError("Unsupported drill type")
+
+def _pair_keys(drill_type: DrillTypeEnum, batch: ProblemBatch) -> np.ndarray:
+    """One int per problem; equal keys mean 'same fact' (commutative ops ignore order)."""
+    a, b = batch.a.astype(np.int64), batch.b.astype(np.int64)
+    if drill_type in (DrillTypeEnum.multiplication, DrillTypeEnum.addition):
+        a, b = np.minimum(a, b), np.maximum(a, b)
+    return (a << 32) | b
+
+def generate_batch(drill_type: DrillTypeEnum, preset: Dict[str, Any], n: int,
+                   seed: int | None = None, avoid_repeats: bool = True, max_rounds: int = 16) -> ProblemBatch:
+    """Generate n problems at once with a NumPy Generator (deterministic for a seed).
+
+    With avoid_repeats, a problem equal to its predecessor (or its commutative
+    twin) is redrawn, mirroring the ok_against_avoid check on /next. Tiny presets
+    may keep a few repeats after max_rounds, as /next does after 16 tries.
+    """
+    rng = np.random.default_rng(seed)
+    batch = _draw_batch(rng, drill_type, preset, n)
+    if not avoid_repeats or n < 2:
+        return batch
+    a, b, ans = batch.a.copy(), batch.b.copy(), batch.answer.copy()
+    for _ in range(max_rounds):
+        keys = _pair_keys(drill_type, ProblemBatch(a, b, ans))
+        dup = np.flatnonzero(keys[1:] == keys[:-1]) + 1
+        if dup.size == 0:
+            break
+        fresh = _draw_batch(rng, drill_type, preset, dup.size)
+        a[dup], b[dup], ans[dup] = fresh.a, fresh.b, fresh.answer
+    return ProblemBatch(a, b, ans)
+
+_OP_SYMBOL = {
+    DrillTypeEnum.addition: "+", DrillTypeEnum.subtraction: "−",
+    DrillTypeEnum.multiplication: "×", DrillTypeEnum.division: "÷",
+}
+
+def batch_prompts(drill_type: DrillTypeEnum, batch: ProblemBatch) -> List[str]:
+    """Prompts in the same format generate_from_preset uses (e.g. for worksheets)."""
+    op = _OP_SYMBOL[drill_type]
+    return [f"{a} {op} {b}" for a, b in zip(batch.a.tolist(), batch.b.tolist())]
+
 # ----------------- Metrics -----------------
 def compute_first_try_metrics(qlog: List[dict]) -> dict:
     attempts_by_prompt: Dict[str, List[dict]] = defaultdict(list)
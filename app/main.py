@@ -1,11 +1,18 @@
 from __future__ import annotations
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .deps import templates  # noqa: F401  (ensure templates directory exists)
-from .storage import init_db
+from .storage import init_db, engine
 from .utils.admin_pwd import ensure_admin_password
+from .utils.compression import CompressionMiddleware
+from .utils.fragment_cache import fragments
+from .utils.profiler import ProfileMiddleware
+from .utils import slow_queries
+from .utils.backup import scheduler as backup_scheduler
 
 from .routers.auth import router as auth_router
 from .routers.dashboard import router as dashboard_router
@@ -13,11 +20,32 @@ from .routers.drills import router as drills_router
 from .routers.feeds import router as feeds_router
 from .routers.reports import router as reports_router
 from .routers.admin import router as admin_router
+from .routers.export import router as export_router
 
 APP_NAME = "Quickfire Math"
+# Responses smaller than this are sent uncompressed (not worth the CPU).
+COMPRESS_MIN_BYTES = int(os.getenv("APP_COMPRESS_MIN_BYTES", "800"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    fragments.clear()  # rendered HTML from a previous DB/app instance is meaningless
+    ensure_admin_password()  # prints admin password on boot
+    backup_scheduler.start()  # only when APP_BACKUP_INTERVAL_HOURS is set
+    try:
+        yield
+    finally:
+        backup_scheduler.stop()
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=APP_NAME)
+    # orjson for everything; explicit ORJSONResponse in routes also skips jsonable_encoder.
+    app = FastAPI(title=APP_NAME, default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+    # Slow query log: times every statement and tags it with the calling route
+    slow_queries.install(engine)
+    app.add_middleware(slow_queries.RouteContextMiddleware)
+    # Outermost: admin-only, per request (X-Profile: 1 header or qf_profile cookie)
+    app.add_middleware(ProfileMiddleware)
 
     # Static files
     base_dir = os.path.dirname(__file__)
@@ -30,11 +58,7 @@ def create_app() -> FastAPI:
     app.include_router(feeds_router)
     app.include_router(reports_router)
     app.include_router(admin_router)
-
-    @app.on_event("startup")
-    def on_startup():
-        init_db()
-        ensure_admin_password()  # prints admin password on boot
+    app.include_router(export_router)
 
     return app
 
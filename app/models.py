@@ -3,6 +3,7 @@ from typing import Optional
 from datetime import datetime
 from enum import Enum
 
+from sqlalchemy import Column, Index, LargeBinary, UniqueConstraint
 from sqlmodel import SQLModel, Field
 
 
@@ -15,14 +16,15 @@ class DrillTypeEnum(str, Enum):
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    display_name: str
+    display_name: str = Field(index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_active_at: Optional[datetime] = Field(default_factory=datetime.utcnow, index=True)  # last finished drill
 
 
 # NOTE: Settings are retained for backward compatibility but are no longer used for generation.
 class UserSettings(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
 
     add_enabled: bool = True
     add_min: int = 0
@@ -46,18 +48,26 @@ class UserSettings(SQLModel, table=True):
 
 
 class DrillResult(SQLModel, table=True):
+    # History pages seek on (user_id, created_at, id); the rowid tail of the index supplies id.
+    __table_args__ = (Index("ix_drillresult_user_created", "user_id", "created_at"),)
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
     drill_type: DrillTypeEnum
     settings_snapshot: str  # now: level label + summary
     question_count: int = 20
     elapsed_ms: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Seeded drills: the plan's (level, seed), see utils/drill_plan.py
+    level: Optional[int] = None
+    seed: Optional[int] = None
+    # Seeded drills, and unseeded ones with APP_PACK_QUESTIONS=1: all attempts in one
+    # compressed columnar blob (see utils/question_pack.py) instead of DrillQuestion rows.
+    packed_questions: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
 
 
 class DrillQuestion(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    drill_result_id: int = Field(foreign_key="drillresult.id")
+    drill_result_id: int = Field(foreign_key="drillresult.id", ondelete="CASCADE", index=True)
     drill_type: DrillTypeEnum
     a: int
     b: int
@@ -77,7 +87,7 @@ class AdminConfig(SQLModel, table=True):
 # NEW: per-user/type progress
 class UserProgress(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
     drill_type: DrillTypeEnum
     level: int = 1
     ewma_tpq_ms: Optional[float] = None  # avg time per first-try correct question
@@ -86,11 +96,48 @@ class UserProgress(SQLModel, table=True):
     best_time_ms: Optional[int] = None   # best total time for THIS level & type
     best_acc: Optional[float] = None     # best ACC for THIS level & type
     last_levelup_at: Optional[datetime] = None
+    # Bumped by every write; finish_drill updates only if it is unchanged since its read
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 
 # NEW: awards attached to a DrillResult
 class DrillAward(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    drill_result_id: int = Field(foreign_key="drillresult.id")
+    drill_result_id: int = Field(foreign_key="drillresult.id", ondelete="CASCADE")
     award_type: str   # 'star','pb_time','pb_acc','level_up'
     payload: str      # human text
+
+
+# Per-user drill counts per UTC hour (rollup of DrillResult for /stats and /activity)
+class ActivityRollup(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("user_id", "hour_utc", "drill_type"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
+    hour_utc: datetime   # created_at truncated to the hour
+    drill_type: DrillTypeEnum
+    drills: int = 0
+
+
+# Idempotency record for /finish: the first response for (user, key) is replayed to retries
+class FinishReceipt(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
+    key: str
+    drill_result_id: Optional[int] = Field(default=None, foreign_key="drillresult.id", ondelete="CASCADE")
+    response: bytes = Field(sa_column=Column(LargeBinary, nullable=False))  # JSON body as first sent
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Response-time sketch per user and fact (see utils/latency.py); x/y are the report axes
+class FactLatency(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("user_id", "drill_type", "x", "y"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
+    drill_type: DrillTypeEnum
+    x: int
+    y: int
+    attempts: int = 0    # correct answers ever recorded (the sketch itself decays)
+    sketch: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
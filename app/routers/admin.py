@@ -1,22 +1,34 @@
-from fastapi import APIRouter, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlmodel import select, delete
+from datetime import datetime
+from typing import List
+from fastapi import APIRouter, Request, Form, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse, FileResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
 from ..deps import templates
 from ..utils.session import is_admin
+from ..utils.user_delete import start_job, run_job, job_status, recent_jobs
+from ..utils.bulk_import import import_ndjson
+from ..utils.user_directory import search_users
+from ..utils import profiler, slow_queries, live, backup
 from ..storage import get_session
-from ..models import User, UserSettings, UserProgress, DrillResult, DrillQuestion, DrillAward, AdminConfig
+from ..models import AdminConfig
 
 router = APIRouter()
 
 @router.get("/admin", response_class=HTMLResponse)
 def admin_page(request: Request):
-    with get_session() as s:
-        users = list(s.exec(select(User).order_by(User.display_name)).all())
+    users, next_cursor = [], None
+    if is_admin(request):
+        with get_session() as s:
+            users, next_cursor = search_users(s, order="name")
     return templates.TemplateResponse("admin.html", {
         "request": request,
         "users": users,
+        "next_cursor": next_cursor,
         "hint": "Password is printed to the container logs on boot.",
         "authed": is_admin(request),
+        "jobs": recent_jobs() if is_admin(request) else [],
+        "imported": request.query_params.get("imported"),
         "app_name": "Quickfire Math",
     })
 
@@ -37,19 +49,125 @@ def admin_logout():
     return resp
 
 @router.post("/admin/delete_user")
-def admin_delete_user(request: Request, user_id: int = Form(...)):
+def admin_delete_user(request: Request, background: BackgroundTasks, user_id: List[int] = Form(...)):
+    """Delete one or many users (repeat ``user_id``) in a batched background job."""
     if not is_admin(request):
         raise HTTPException(403)
-    with get_session() as s:
-        s.exec(delete(DrillQuestion).where(DrillQuestion.drill_result_id.in_(
-            select(DrillResult.id).where(DrillResult.user_id == user_id)
-        )))
-        s.exec(delete(DrillAward).where(DrillAward.drill_result_id.in_(
-            select(DrillResult.id).where(DrillResult.user_id == user_id)
-        )))
-        s.exec(delete(DrillResult).where(DrillResult.user_id == user_id))
-        s.exec(delete(UserSettings).where(UserSettings.user_id == user_id))
-        s.exec(delete(UserProgress).where(UserProgress.user_id == user_id))
-        s.exec(delete(User).where(User.id == user_id))
-        s.commit()
-    return RedirectResponse("/admin", status_code=303)
+    job_id = start_job(user_id)
+    background.add_task(run_job, job_id)
+    return RedirectResponse(f"/admin?job={job_id}", status_code=303)
+
+@router.get("/admin/delete_jobs/{job_id}")
+def admin_delete_job(request: Request, job_id: int):
+    if not is_admin(request):
+        raise HTTPException(403)
+    status = job_status(job_id)
+    if not status:
+        raise HTTPException(404)
+    return ORJSONResponse(status)
+
+@router.post("/admin/import")
+def admin_import(request: Request, file: UploadFile = File(...), keep_ids: bool = Form(False)):
+    """Load an NDJSON export (optionally gzipped); ids are remapped unless keep_ids."""
+    if not is_admin(request):
+        raise HTTPException(403)
+    try:
+        counts = import_ndjson(file.file, remap=not keep_ids)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(400, f"import failed: {e}")
+    except IntegrityError:
+        raise HTTPException(409, "import failed: rows clash with existing data (ids kept?); nothing was imported")
+    return RedirectResponse(f"/admin?imported={sum(counts.values())}", status_code=303)
+
+@router.get("/admin/profiles", response_class=HTMLResponse)
+def admin_profiles(request: Request):
+    if not is_admin(request):
+        return RedirectResponse("/admin", status_code=303)
+    profiles = [{**p, "when": datetime.fromtimestamp(p["ts"] / 1000).strftime("%Y-%m-%d %H:%M:%S")}
+                for p in profiler.list_profiles()]
+    return templates.TemplateResponse("admin_profiles.html", {
+        "request": request, "profiles": profiles,
+        "enabled": request.cookies.get(profiler.COOKIE) == "1",
+        "interval_ms": profiler.INTERVAL_MS, "keep": profiler.KEEP,
+        "app_name": "Quickfire Math",
+    })
+
+@router.post("/admin/profiles/toggle")
+def admin_profiles_toggle(request: Request, on: bool = Form(...)):
+    if not is_admin(request):
+        raise HTTPException(403)
+    resp = RedirectResponse("/admin/profiles", status_code=303)
+    if on:
+        resp.set_cookie(profiler.COOKIE, "1", max_age=60*60, samesite="lax", httponly=True)
+    else:
+        resp.delete_cookie(profiler.COOKIE)
+    return resp
+
+@router.get("/admin/profiles/{name}")
+def admin_profile_file(request: Request, name: str):
+    """Speedscope JSON by file name or by the ``X-Profile-Id`` of the profiled response."""
+    if not is_admin(request):
+        raise HTTPException(403)
+    path = profiler.profile_path(name)
+    if not path:
+        raise HTTPException(404)
+    return FileResponse(path, media_type="application/json", filename=path.rsplit("/", 1)[-1])
+
+@router.get("/admin/slow_queries", response_class=HTMLResponse)
+def admin_slow_queries(request: Request):
+    if not is_admin(request):
+        return RedirectResponse("/admin", status_code=303)
+    return templates.TemplateResponse("admin_slow_queries.html", {
+        "request": request, "shapes": slow_queries.log.report(),
+        "threshold_ms": slow_queries.log.threshold_ms, "app_name": "Quickfire Math",
+    })
+
+@router.post("/admin/slow_queries/reset")
+def admin_slow_queries_reset(request: Request):
+    if not is_admin(request):
+        raise HTTPException(403)
+    slow_queries.log.reset()
+    return RedirectResponse("/admin/slow_queries", status_code=303)
+
+@router.get("/admin/backups", response_class=HTMLResponse)
+def admin_backups(request: Request):
+    if not is_admin(request):
+        return RedirectResponse("/admin", status_code=303)
+    return templates.TemplateResponse("admin_backups.html", {
+        "request": request, "backups": backup.list_backups(), "runs": backup.recent_runs(),
+        "running": backup.is_running(), "keep": backup.KEEP, "interval_hours": backup.scheduler.interval / 3600,
+        "app_name": "Quickfire Math",
+    })
+
+@router.post("/admin/backups/run")
+def admin_backups_run(request: Request, background: BackgroundTasks):
+    """Start a snapshot in the background; progress and metrics show on /admin/backups."""
+    if not is_admin(request):
+        raise HTTPException(403)
+    if backup.is_running():
+        raise HTTPException(409, "A backup is already running")
+    background.add_task(_run_backup_quietly)
+    return RedirectResponse("/admin/backups", status_code=303)
+
+def _run_backup_quietly() -> None:
+    try:
+        backup.run_backup()
+    except backup.BackupError:
+        pass   # recorded in recent_runs for the admin page
+
+@router.get("/admin/backups/{name}")
+def admin_backup_file(request: Request, name: str):
+    if not is_admin(request):
+        raise HTTPException(403)
+    path = backup.backup_path(name)
+    if not path:
+        raise HTTPException(404)
+    return FileResponse(path, media_type="application/gzip", filename=name)
+
+@router.get("/admin/live")
+async def admin_live(request: Request):
+    """Server-Sent Events: one ``drill`` event per finished drill, across all players."""
+    if not is_admin(request):
+        raise HTTPException(403)
+    return StreamingResponse(live.stream(request.is_disconnected), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,46 +1,44 @@
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import RedirectResponse, HTMLResponse
-from sqlmodel import select
+from typing import Optional
+from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi.responses import RedirectResponse, HTMLResponse, ORJSONResponse
 from ..deps import templates
 from ..storage import get_session
-from ..models import User, UserSettings, DrillTypeEnum, UserProgress, DrillResult, DrillAward
+from ..models import User, UserSettings, DrillTypeEnum, UserProgress
 from ..levels import thresholds_for_level
+from ..utils.fragment_cache import fragments, USERS_SCOPE
+from ..utils.user_directory import search_users, last_drills, PAGE_SIZE
 
 router = APIRouter()
+USER_GRID_MAX_AGE = 60  # seconds; finishes don't bump the grid, so its last-drill column ages out instead
+
+def _render_user_grid() -> str:
+    """First page of the directory (most recently active first); the rest loads on demand."""
+    with get_session() as s:
+        users, next_cursor = search_users(s, order="recent")
+        recent = last_drills(s, [u.id for u in users])
+    return templates.get_template("components/_user_grid.html").render(
+        users=users, recent=recent, next_cursor=next_cursor)
 
 @router.get("/", response_class=HTMLResponse)
 def login(request: Request):
+    user_grid = fragments.get_or_render("login_users", USERS_SCOPE, _render_user_grid,
+                                        max_age=USER_GRID_MAX_AGE)
+    return templates.TemplateResponse("login.html", {"request": request, "user_grid": user_grid, "app_name": "Quickfire Math"})
+
+@router.get("/users/search")
+def users_search(q: Optional[str] = None, cursor: Optional[str] = None, limit: int = PAGE_SIZE,
+                 order: str = "recent", recent: bool = False):
+    """Directory page as JSON: {items: [{id, display_name[, last]}], next_cursor}.
+    ``q`` prefix-matches every word of the name; ``recent`` adds each user's last drill."""
     with get_session() as s:
-        users = list(s.exec(select(User)).all())
-        # Gather a small "recent" summary for each user: last drill and star flag
-        recent = {}
-        for u in users:
-            last = s.exec(
-                select(DrillResult).where(DrillResult.user_id == u.id).order_by(DrillResult.created_at.desc())
-            ).first()
-            if not last:
-                recent[u.id] = None
-                continue
-            star = bool(s.exec(
-                select(DrillAward).where(DrillAward.drill_result_id == last.id, DrillAward.award_type == "star")
-            ).first())
-            # Parse level from settings_snapshot like "[L7] ..."
-            level_num = None
-            snap = last.settings_snapshot or ""
-            if snap.startswith("[L"):
-                try:
-                    level_num = int(snap.split("[")[1].split("]")[0].lstrip("L"))
-                except Exception:
-                    level_num = None
-            recent[u.id] = {
-                "type": last.drill_type.value,
-                "level": level_num,
-                "elapsed_ms": last.elapsed_ms,
-                "star": star,
-                "score": None,
-                "snapshot": snap,
-            }
-    return templates.TemplateResponse("login.html", {"request": request, "users": users, "recent": recent, "app_name": "Quickfire Math"})
+        try:
+            items, next_cursor = search_users(s, q=q, cursor=cursor, limit=limit, order=order)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if recent:
+            last = last_drills(s, [u.id for u in items])
+            items = [{"id": u.id, "display_name": u.display_name, "last": last.get(u.id)} for u in items]
+    return ORJSONResponse({"items": items, "next_cursor": next_cursor})
 
 @router.post("/login")
 def do_login(user_id: int = Form(...)):
@@ -62,6 +60,7 @@ def user_add(display_name: str = Form(...)):
             s.add(UserProgress(user_id=u.id, drill_type=dt, level=1, target_time_sec=TMAX))
         s.commit()
         new_id = u.id
+    fragments.bump(USERS_SCOPE)
     resp = RedirectResponse(url="/dashboard", status_code=303)
     resp.set_cookie("uid", str(new_id), max_age=60*60*24*365, samesite="lax")
     return resp
@@ -1,38 +1,73 @@
-from typing import Optional
+from typing import List, Optional, Union
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import orjson
 from fastapi import APIRouter, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from pydantic import BaseModel, Field as PydField
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
-from ..deps import templates
+from ..deps import templates, DbSession
 from ..utils.session import get_user_id
-from ..utils.progress import level_info
+from ..utils.progress import level_info, preset_cache
 from ..utils.stars import need_hint_text
 from ..utils.feedback import friendly_fail_message
+from ..utils.activity import record_drill
+from ..utils.user_directory import touch
+from ..utils.admission import check_rate, inflight, form_key
+from ..utils.live import bus, publish_on_commit
+from ..utils.latency import record_latencies
+from ..utils.question_pack import PACK_QUESTIONS, pack_questions
+from ..utils.drill_plan import new_seed, plan_problems, attempts_from_qlog
 from ..utils.next_problem import next_prompt_from_preset, ok_against_avoid
 from ..storage import get_session
-from ..models import DrillTypeEnum, DrillResult, DrillQuestion, UserProgress, DrillAward
-from ..levels import thresholds_for_level, clamp_level, level_label
+from ..models import User, DrillTypeEnum, DrillResult, DrillQuestion, UserProgress, DrillAward, FinishReceipt
+from ..levels import thresholds_for_level, clamp_level, level_label, next_level
 from ..logic import compute_first_try_metrics, star_decision, levelup_decision
 
 router = APIRouter()
 
+MAX_KEY_LEN = 64
+MAX_BULK = 200   # drills per /finish/bulk request
+CAS_RETRIES = 5  # progress compare-and-swap attempts per finish
+RECEIPT_TTL = timedelta(days=7)   # finish receipts kept this long for retries, then pruned
+_DRILL_TYPES = {dt.value: dt for dt in DrillTypeEnum}
+_NO_STORE = {"cache-control": "no-store"}
+
 @router.post("/start", response_class=HTMLResponse)
-def start_drill(request: Request, drill_type: DrillTypeEnum = Form(...)):
+def start_drill(request: Request, s: DbSession, drill_type: DrillTypeEnum = Form(...)):
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    lvl, lbl, preset = level_info(uid, drill_type)
-    p, ans, tts = next_prompt_from_preset(drill_type, preset)
+    pl = _plan_payload(s, uid, drill_type)
+    first = pl["plan"][0]
     return templates.TemplateResponse("drill.html", {
         "request": request, "drill_type": drill_type.value,
-        "target_count": 20, "first_prompt": p, "first_answer": ans, "first_tts": tts,
-        "settings_human": lbl, "level_num": int(lvl)
+        "target_count": 20, "first_prompt": first["prompt"], "first_answer": first["answer"],
+        "first_tts": first["tts"], "settings_human": pl["label"], "level_num": pl["level"],
+        "seed": pl["seed"], "plan": pl["plan"],
     })
 
+@router.get("/plan/{drill_type}")
+def drill_plan(request: Request, s: DbSession, drill_type: DrillTypeEnum):
+    """A fresh seeded plan for the user's level, prefetched so a drill can run offline."""
+    uid = get_user_id(request)
+    if not uid:
+        raise HTTPException(403)
+    return ORJSONResponse({"drill_type": drill_type.value, **_plan_payload(s, uid, drill_type)})
+
+def _plan_payload(s, uid: int, drill_type: DrillTypeEnum) -> dict:
+    lvl, lbl, _ = level_info(s, uid, drill_type)
+    seed = new_seed()
+    plan = plan_problems(drill_type, lvl, seed)
+    return {"level": int(lvl), "label": lbl, "seed": str(seed),
+            "plan": [{"prompt": q[0], "answer": q[1], "tts": q[2]} for q in plan]}
+
 @router.post("/next")
 def next_problem(
     request: Request,
+    s: DbSession,
     drill_type: DrillTypeEnum = Form(...),
     avoid_prompt: Optional[str] = Form(default=None),
     avoid_pair: Optional[str] = Form(default=None),
@@ -40,15 +75,53 @@ def next_problem(
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    _, _, preset = level_info(uid, drill_type)
+    check_rate(uid)
+    return ORJSONResponse(inflight.do(("next", uid, drill_type, avoid_prompt, avoid_pair),
+                                      lambda: _next_once(s, uid, drill_type, avoid_prompt, avoid_pair)))
+
+
+def _next_once(s, uid: int, drill_type: DrillTypeEnum, last: Optional[str], last_pair: Optional[str]) -> dict:
+    _, _, preset = level_info(s, uid, drill_type)
+    return _pick_next(drill_type, preset, last, last_pair)
 
-    last = avoid_prompt
-    last_pair = avoid_pair
+
+def _pick_next(drill_type: DrillTypeEnum, preset: dict, last: Optional[str], last_pair: Optional[str]) -> dict:
     for _ in range(16):
         p, ans, tts = next_prompt_from_preset(drill_type, preset)
         if ok_against_avoid(p, last, last_pair):
-            return JSONResponse({"prompt": p, "answer": ans, "tts": tts})
-    return JSONResponse({"prompt": p, "answer": ans, "tts": tts})
+            break
+    return {"prompt": p, "answer": ans, "tts": tts}
+
+@router.get("/next")
+def next_problem_fast(request: Request):
+    """Lean /next for the drill page: ``?drill_type=&avoid_prompt=&avoid_pair=``.
+    The page asks for one only when its seeded plan runs out.
+
+    No form parsing, no dependencies and no validation models. Rate limit and
+    single-flight key are the same as POST /next. The preset comes from
+    ``preset_cache``, and only a miss reads the database. The body is
+    serialised straight to bytes."""
+    uid = get_user_id(request)
+    if not uid:
+        raise HTTPException(403)
+    q = request.query_params
+    drill_type = _DRILL_TYPES.get(q.get("drill_type", ""))
+    if drill_type is None:
+        raise HTTPException(422, "Unknown drill_type")
+    check_rate(uid)
+    avoid_prompt, avoid_pair = q.get("avoid_prompt"), q.get("avoid_pair")
+    pick = inflight.do(("next", uid, drill_type, avoid_prompt, avoid_pair),
+                       lambda: _pick_next(drill_type, _cached_preset(uid, drill_type), avoid_prompt, avoid_pair))
+    return Response(orjson.dumps(pick), media_type="application/json", headers=_NO_STORE)
+
+
+def _cached_preset(uid: int, drill_type: DrillTypeEnum) -> dict:
+    preset = preset_cache.get(uid, drill_type)
+    if preset is None:
+        with get_session() as s:
+            preset = preset_cache.load(s, uid, drill_type)
+            s.commit()
+    return preset
 
 @router.post("/finish")
 def finish_drill(
@@ -59,107 +132,263 @@ def finish_drill(
     question_count: int = Form(20),
     score: int = Form(0),
     qlog: str = Form("[]"),
+    seed: Optional[int] = Form(None),
+    plan_level: Optional[int] = Form(None),
+    idem_key: Optional[str] = Form(None),
 ):
+    """Record a drill. With an idempotency key (form ``idem_key`` or the
+    ``Idempotency-Key`` header) retries get the original response back."""
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
+    check_rate(uid)
+    key = (idem_key or request.headers.get("Idempotency-Key") or "")[:MAX_KEY_LEN] or None
+    fields = (drill_type, elapsed_ms, settings_human, question_count, score, qlog, seed, plan_level)
+    flight = ("finish", uid, key or form_key(*fields))
+    body = inflight.do(flight, lambda: _finish_once(uid, key, *fields))
+    return Response(body, media_type="application/json")
 
-    with get_session() as s:
-        prog = s.exec(select(UserProgress).where(
-            UserProgress.user_id == uid, UserProgress.drill_type == drill_type
-        )).first()
-        if not prog:
-            _, _, _, _, TMAX = thresholds_for_level(1)
-            prog = UserProgress(user_id=uid, drill_type=drill_type, level=1, target_time_sec=TMAX)
-            s.add(prog); s.commit(); s.refresh(prog)
-
-        level_at = int(prog.level)
-        snapshot = f"[L{level_at}] {settings_human} • Score {score}/{question_count}"
-        rec = DrillResult(
-            user_id=uid, drill_type=drill_type,
-            settings_snapshot=snapshot, question_count=question_count, elapsed_ms=elapsed_ms,
-        )
-        s.add(rec); s.commit(); s.refresh(rec)
 
+def _finish_once(uid: int, key: Optional[str], *fields) -> bytes:
+    with get_session() as s:
+        if key:
+            done = _receipt(s, uid, key)
+            if done is not None:
+                return done
+        rec, payload = apply_finish(s, uid, *fields)
+        body = orjson.dumps(payload)
+        if key:
+            _prune_receipts(s, uid)
+            s.add(FinishReceipt(user_id=uid, key=key, drill_result_id=rec.id, response=body))
         try:
-            logs = json.loads(qlog)
-        except Exception:
-            logs = []
-        for e in logs:
+            s.commit()
+        except IntegrityError:
+            # Same key committed by another worker in the meantime: drop ours, replay theirs.
+            s.rollback()
+            done = _receipt(s, uid, key) if key else None
+            if done is None:
+                raise
+            return done
+    preset_cache.invalidate(uid)
+    return body
+
+
+class QueuedDrill(BaseModel):
+    """One drill finished offline; fields mirror the /finish form."""
+    idem_key: str = PydField(min_length=1, max_length=MAX_KEY_LEN)
+    created_at: datetime
+    drill_type: DrillTypeEnum
+    elapsed_ms: int
+    settings_human: str = ""
+    question_count: int = 20
+    score: int = 0
+    qlog: Union[str, list] = "[]"
+    seed: Optional[int] = None
+    plan_level: Optional[int] = None
+
+
+class BulkFinish(BaseModel):
+    drills: List[QueuedDrill] = PydField(max_length=MAX_BULK)
+
+
+@router.post("/finish/bulk")
+def finish_bulk(request: Request, body: BulkFinish):
+    """Sync drills queued on a device. They are applied oldest first through the
+    same rules as /finish, in one transaction; keys already seen replay their
+    stored response. Returns {"results": [{"idem_key", ...response}]} in request order."""
+    uid = get_user_id(request)
+    if not uid:
+        raise HTTPException(403)
+    check_rate(uid)
+    if not body.drills:
+        return ORJSONResponse({"results": []})
+    flight = ("finish_bulk", uid, form_key(*sorted(d.idem_key for d in body.drills)))
+    results = inflight.do(flight, lambda: _finish_bulk_once(uid, body.drills))
+    return ORJSONResponse({"results": [{"idem_key": d.idem_key, **results[d.idem_key]} for d in body.drills]})
+
+
+def _finish_bulk_once(uid: int, drills: List[QueuedDrill]) -> dict:
+    now = datetime.utcnow()
+    for attempt in range(2):
+        out: dict = {}
+        with get_session() as s:
+            _prune_receipts(s, uid)
+            for d in sorted(drills, key=lambda d: d.created_at):
+                if d.idem_key in out:
+                    continue
+                done = _receipt(s, uid, d.idem_key)
+                if done is None:
+                    created = min(_naive_utc(d.created_at), now)   # device clocks can run ahead
+                    qlog = d.qlog if isinstance(d.qlog, str) else json.dumps(d.qlog)
+                    rec, payload = apply_finish(s, uid, d.drill_type, d.elapsed_ms, d.settings_human,
+                                                d.question_count, d.score, qlog, d.seed, d.plan_level,
+                                                created_at=created)
+                    done = orjson.dumps(payload)
+                    s.add(FinishReceipt(user_id=uid, key=d.idem_key, drill_result_id=rec.id, response=done))
+                    s.flush()
+                out[d.idem_key] = orjson.loads(done)
             try:
-                started = datetime.fromisoformat(str(e.get("started_at")).replace("Z",""))
-            except Exception:
-                started = datetime.utcnow()
-            s.add(DrillQuestion(
-                drill_result_id=rec.id, drill_type=drill_type,
-                a=int(e.get("a", 0)), b=int(e.get("b", 0)), prompt=str(e.get("prompt","")),
-                correct_answer=int(e.get("correct_answer",0)), given_answer=int(e.get("given_answer",0)),
-                correct=bool(e.get("correct", False)), started_at=started, elapsed_ms=int(e.get("elapsed_ms",0)),
-            ))
-        s.commit()
-
-        metrics = compute_first_try_metrics(logs)
-
-        tts = getattr(prog, "target_time_sec", None)
-        if not tts:
-            _, _, _, _, TMAX = thresholds_for_level(prog.level)
-            tts = TMAX
+                s.commit()
+            except IntegrityError:
+                # Another request stored some of these keys first; redo against its receipts.
+                s.rollback()
+                if attempt:
+                    raise
+                continue
+        preset_cache.invalidate(uid)
+        return out
+
 
+def _naive_utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _prune_receipts(s, uid: int) -> None:
+    s.exec(delete(FinishReceipt).where(
+        FinishReceipt.user_id == uid, FinishReceipt.created_at < datetime.utcnow() - RECEIPT_TTL
+    ))
+
+
+def _receipt(s, uid: int, key: str) -> Optional[bytes]:
+    return s.exec(select(FinishReceipt.response).where(
+        FinishReceipt.user_id == uid, FinishReceipt.key == key
+    )).first()
+
+
+def apply_finish(s, uid: int, drill_type: DrillTypeEnum, elapsed_ms: int, settings_human: str,
+                 question_count: int, score: int, qlog: str, seed: Optional[int] = None,
+                 plan_level: Optional[int] = None, created_at: Optional[datetime] = None):
+    """Store one finished drill and apply the star/level-up rules; returns
+    (DrillResult, response payload). Everything goes into ``s``; the caller commits."""
+    try:
+        logs = json.loads(qlog)
+    except Exception:
+        logs = []
+    # Seeded drills keep their drawn questions packed on the result; others get
+    # DrillQuestion rows, or one packed blob with APP_PACK_QUESTIONS=1.
+    seeded = None
+    if seed is not None and plan_level is not None and isinstance(logs, list):
+        seeded = attempts_from_qlog(drill_type, clamp_level(drill_type, plan_level), seed, logs)
+        if seeded:
+            logs = seeded
+    metrics = compute_first_try_metrics(logs)
+    step = _advance_progress(s, uid, drill_type, elapsed_ms, metrics)
+    level_at = step["level_at"]
+
+    snapshot = f"[L{level_at}] {settings_human} • Score {score}/{question_count}"
+    rec = DrillResult(
+        user_id=uid, drill_type=drill_type,
+        settings_snapshot=snapshot, question_count=question_count, elapsed_ms=elapsed_ms,
+        level=level_at,
+    )
+    if created_at is not None:
+        rec.created_at = created_at
+    questions = seeded or [_question_fields(e) for e in logs]
+    if seeded:
+        rec.level, rec.seed = clamp_level(drill_type, plan_level), seed
+    if questions and (seeded or PACK_QUESTIONS):
+        rec.packed_questions = pack_questions(drill_type, questions)
+    s.add(rec)
+    s.flush()
+    record_drill(s, uid, drill_type, rec.created_at)
+    touch(s, uid, rec.created_at)
+
+    if rec.packed_questions is None:
+        for q in questions:
+            s.add(DrillQuestion(drill_result_id=rec.id, drill_type=drill_type, **q))
+
+    record_latencies(s, uid, drill_type, logs, rec.created_at)
+
+    star_bool = bool(step["star"])
+    fail_msg = "" if star_bool else friendly_fail_message(metrics, float(step["tts"]), step["why"], question_count)
+
+    for (t, text) in step["awards"]:
+        s.add(DrillAward(drill_result_id=rec.id, award_type=t, payload=text))
+    s.flush()
+    if bus.has_subscribers:
+        publish_on_commit(s, {
+            "user_id": uid, "name": s.exec(select(User.display_name).where(User.id == uid)).first(),
+            "ts": rec.created_at.isoformat(), "drill_type": drill_type.value, "level": level_at,
+            "star": star_bool, "level_up": step["level_up"], "new_level": step["new_level"],
+            "elapsed_ms": elapsed_ms, "acc": round(float(metrics["acc"]), 3),
+            "score": score, "question_count": question_count,
+        })
+
+    return rec, {
+        "ok": True,
+        "star": star_bool,
+        "level_up": step["level_up"],
+        "new_level": step["new_level"],
+        "new_level_label": step["new_level_label"],
+        "awards": [a for _, a in step["awards"]],
+        "fail_msg": fail_msg,
+        "need_hint": need_hint_text(step["sr_before"], step["star"]),
+    }
+
+
+def _question_fields(e: dict) -> dict:
+    try:
+        started = datetime.fromisoformat(str(e.get("started_at")).replace("Z",""))
+    except Exception:
+        started = datetime.utcnow()
+    return dict(
+        a=int(e.get("a", 0)), b=int(e.get("b", 0)), prompt=str(e.get("prompt","")),
+        correct_answer=int(e.get("correct_answer",0)), given_answer=int(e.get("given_answer",0)),
+        correct=bool(e.get("correct", False)), started_at=started, elapsed_ms=int(e.get("elapsed_ms",0)),
+    )
+
+
+def _read_progress(s, uid: int, drill_type: DrillTypeEnum):
+    """(id, level, stars_recent, best_time_ms, best_acc, version), creating the row if missing."""
+    cols = (UserProgress.id, UserProgress.level, UserProgress.stars_recent,
+            UserProgress.best_time_ms, UserProgress.best_acc, UserProgress.version)
+    where = (UserProgress.user_id == uid, UserProgress.drill_type == drill_type)
+    row = s.exec(select(*cols).where(*where)).first()
+    if row is None:
+        s.add(UserProgress(user_id=uid, drill_type=drill_type, level=1))
+        s.flush()
+        row = s.exec(select(*cols).where(*where)).first()
+    return row
+
+
+def _advance_progress(s, uid: int, drill_type: DrillTypeEnum, elapsed_ms: int, metrics: dict) -> dict:
+    """Run the star/level-up rules against the user's progress row and write it back
+    with compare-and-swap on ``version``. If another finish got there first, the
+    rules run again on the fresh row, up to CAS_RETRIES times. On SQLite the
+    missed UPDATE already holds the write lock, so the re-read cannot go stale
+    again and the second attempt normally lands."""
+    for _ in range(CAS_RETRIES):
+        pid, level, stars_recent, best_time_ms, best_acc, version = _read_progress(s, uid, drill_type)
+        _, _, _, _, tts = thresholds_for_level(level)
         star, exp = star_decision(metrics, elapsed_ms, float(tts))
 
         awards = []
         if star:
             awards.append(("star", "⭐ Star earned"))
-
-        if prog.best_time_ms is None or elapsed_ms < prog.best_time_ms:
-            prog.best_time_ms = elapsed_ms
+        if best_time_ms is None or elapsed_ms < best_time_ms:
+            best_time_ms = elapsed_ms
             awards.append(("pb_time", "🏁 New best time"))
-        if prog.best_acc is None or metrics["acc"] > (prog.best_acc or 0):
-            prog.best_acc = metrics["acc"]
+        if best_acc is None or metrics["acc"] > (best_acc or 0):
+            best_acc = metrics["acc"]
             awards.append(("pb_acc", "🎯 New best accuracy"))
 
-        sr_before = prog.stars_recent or ""
+        sr_before = stars_recent or ""
         did_level_up = levelup_decision(sr_before, star)
-        prog.stars_recent = (sr_before + ("1" if star else "0"))[-6:]
-
-        new_level_label = ""
+        values = {"stars_recent": (sr_before + ("1" if star else "0"))[-6:],
+                  "best_time_ms": best_time_ms, "best_acc": best_acc}
+        new_level, new_level_label = level, ""
         if did_level_up:
-            prev_best_sec = (prog.best_time_ms or elapsed_ms) / 1000.0
-            next_level = clamp_level(drill_type, prog.level + 1)
-            lbl_next = level_label(drill_type, next_level).lower()
-            if prog.level == 1 and "recap" in lbl_next:
-                next_level = clamp_level(drill_type, next_level + 1)
-            _, _, _, _, TMAX = thresholds_for_level(next_level)
-            next_target = min(TMAX, prev_best_sec * 1.5)
-            prog.level = next_level
-            prog.last_levelup_at = datetime.utcnow()
-            try:
-                prog.target_time_sec = int(round(next_target))
-            except Exception:
-                pass
-            new_level_label = level_label(drill_type, next_level)
-            prog.best_time_ms = None
-            prog.best_acc = None
-            prog.stars_recent = ""
+            new_level = next_level(drill_type, level)
+            new_level_label = level_label(drill_type, new_level)
+            values.update(level=new_level, last_levelup_at=datetime.utcnow(),
+                          best_time_ms=None, best_acc=None, stars_recent="")
             awards.append(("level_up", f"⬆️ Level up to {new_level_label}"))
 
-        new_level_val = int(prog.level)
-        star_bool = bool(star)
-        levelup_bool = bool(did_level_up)
-        fail_msg = "" if star_bool else friendly_fail_message(metrics, float(tts), exp.get("why",""), question_count)
-
-        s.add(prog); s.commit()
-        for (t, text) in awards:
-            s.add(DrillAward(drill_result_id=rec.id, award_type=t, payload=text))
-        s.commit()
-
-    return JSONResponse({
-        "ok": True,
-        "star": star_bool,
-        "level_up": levelup_bool,
-        "new_level": new_level_val,
-        "new_level_label": new_level_label,
-        "awards": [a for _, a in awards],
-        "fail_msg": fail_msg,
-        "need_hint": need_hint_text(sr_before, star),
-    })
+        res = s.exec(update(UserProgress)
+                     .where(UserProgress.id == pid, UserProgress.version == version)
+                     .values(**values, version=version + 1))
+        if res.rowcount == 1:
+            return {"level_at": int(level), "star": star, "why": exp.get("why", ""), "tts": tts,
+                    "awards": awards, "sr_before": sr_before, "level_up": bool(did_level_up),
+                    "new_level": int(new_level), "new_level_label": new_level_label}
+    raise HTTPException(409, "Progress changed while saving; please retry")
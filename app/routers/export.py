@@ -0,0 +1,215 @@
+"""Admin data export: streams tables as NDJSON or CSV with flat memory use.
+
+Rows are read in keyset pages (``id > last id LIMIT PAGE_ROWS``), each in its
+own short session, so no read transaction spans the download and a slow
+client never holds the SHARED lock that would block /finish commits.
+
+Questions are exported as rows whichever way they are stored: seeded drills
+and drills packed with APP_PACK_QUESTIONS are decoded (``unpack_questions``)
+into the ``questions`` dataset with no id, and their blobs are left out of
+``results``, so an export imports the same under either setting."""
+import base64
+import csv
+import io
+import zlib
+from datetime import datetime, date, time as dtime
+from enum import Enum
+from typing import Iterator, Optional
+import orjson
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from ..utils.session import is_admin
+from ..storage import get_session
+from ..models import User, UserProgress, DrillResult, DrillQuestion, DrillAward
+from ..utils.question_pack import unpack_questions
+
+router = APIRouter()
+
+PAGE_ROWS = 2000        # rows per page (one short read transaction each)
+PAGE_BLOBS = 200        # results per page when decoding seeded or packed questions
+CHUNK_BYTES = 64 * 1024  # bytes buffered before each write to the socket
+
+# name -> model, in an order that respects FKs (the "all" export and import rely on it)
+DATASETS = {
+    "users": User,
+    "progress": UserProgress,
+    "results": DrillResult,
+    "questions": DrillQuestion,
+    "awards": DrillAward,
+}
+
+
+def _plain(v):
+    if isinstance(v, Enum):
+        return v.value
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, bytes):
+        return base64.b64encode(v).decode()
+    return v
+
+
+def _orjson_default(v):
+    if isinstance(v, bytes):
+        return base64.b64encode(v).decode()
+    raise TypeError
+
+
+def _parse_day(v: Optional[str], end: bool) -> Optional[datetime]:
+    if not v:
+        return None
+    try:
+        d = date.fromisoformat(v[:10])
+    except ValueError:
+        raise HTTPException(400, f"bad date: {v}")
+    return datetime.combine(d, dtime.max if end else dtime.min)
+
+
+_BLOBS = ("packed_questions",)   # exported as questions rows instead
+
+
+def _columns(name: str) -> list:
+    return [c for c in DATASETS[name].__table__.columns if c.name not in _BLOBS]
+
+
+def _query(name: str, user_id: Optional[int], since: Optional[datetime], until: Optional[datetime]):
+    model = DATASETS[name]
+    q = select(*_columns(name)).order_by(model.id)
+    if name == "users":
+        if user_id is not None:
+            q = q.where(User.id == user_id)
+        ts = User.created_at
+    elif name == "progress":
+        if user_id is not None:
+            q = q.where(UserProgress.user_id == user_id)
+        ts = None
+    elif name == "results":
+        if user_id is not None:
+            q = q.where(DrillResult.user_id == user_id)
+        ts = DrillResult.created_at
+    else:
+        q = q.join(DrillResult, DrillResult.id == model.drill_result_id)
+        if user_id is not None:
+            q = q.where(DrillResult.user_id == user_id)
+        ts = DrillQuestion.started_at if name == "questions" else DrillResult.created_at
+    if ts is not None and since:
+        q = q.where(ts >= since)
+    if ts is not None and until:
+        q = q.where(ts <= until)
+    return q
+
+
+def _pages(stmt, id_col, size: int) -> Iterator[list]:
+    """Run ``stmt`` (ordered by ``id_col``, selecting it first) one keyset page at a time."""
+    last = None
+    while True:
+        page = stmt if last is None else stmt.where(id_col > last)
+        with get_session() as s:
+            rows = s.exec(page.limit(size)).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def iter_rows(name: str, user_id: Optional[int] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> Iterator[dict]:
+    """Yield one plain dict per row of dataset ``name``, page by page."""
+    cols = [c.name for c in _columns(name)]
+    for rows in _pages(_query(name, user_id, since, until), DATASETS[name].id, PAGE_ROWS):
+        for row in rows:
+            yield dict(zip(cols, row))
+    if name == "questions":
+        yield from _stored_questions(user_id, since, until)
+
+
+def _stored_questions(user_id: Optional[int], since: Optional[datetime],
+                      until: Optional[datetime]) -> Iterator[dict]:
+    """Questions of drills that keep their attempts packed on the result row."""
+    q = (select(DrillResult.id, DrillResult.drill_type, DrillResult.packed_questions)
+         .where(DrillResult.packed_questions.is_not(None))
+         .order_by(DrillResult.id))
+    if user_id is not None:
+        q = q.where(DrillResult.user_id == user_id)
+    for rid, dt, packed in (row for rows in _pages(q, DrillResult.id, PAGE_BLOBS) for row in rows):
+        for e in unpack_questions(dt, packed):
+            if (since and e["started_at"] < since) or (until and e["started_at"] > until):
+                continue
+            yield {"id": None, "drill_result_id": rid, "drill_type": dt, "a": e["a"], "b": e["b"],
+                   "prompt": e["prompt"], "correct_answer": e["correct_answer"],
+                   "given_answer": e["given_answer"], "correct": e["correct"],
+                   "started_at": e["started_at"], "elapsed_ms": e["elapsed_ms"]}
+
+
+def _ndjson_lines(names, tag: bool, **filters) -> Iterator[bytes]:
+    for name in names:
+        f = filters
+        if tag and name in ("users", "progress"):
+            # A full dump keeps every owner row so history from the range can be re-imported.
+            f = {**filters, "since": None, "until": None}
+        for rec in iter_rows(name, **f):
+            if tag:
+                rec = {"_table": name, **rec}
+            yield orjson.dumps(rec, default=_orjson_default) + b"\n"
+
+
+def _csv_lines(name: str, **filters) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow([c.name for c in _columns(name)])
+    for rec in iter_rows(name, **filters):
+        w.writerow([_plain(v) for v in rec.values()])
+        if buf.tell() >= CHUNK_BYTES:
+            yield buf.getvalue().encode()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def _chunked(lines: Iterator[bytes], gzip: bool) -> Iterator[bytes]:
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line); size += len(line)
+        if size >= CHUNK_BYTES:
+            data = b"".join(pending); pending, size = [], 0
+            out = comp.compress(data) + comp.flush(zlib.Z_SYNC_FLUSH) if comp else data
+            if out:
+                yield out
+    data = b"".join(pending)
+    yield comp.compress(data) + comp.flush(zlib.Z_FINISH) if comp else data
+
+
+@router.get("/admin/export/{dataset}")
+def admin_export(
+    request: Request,
+    dataset: str,
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """Stream ``dataset`` (or ``all``, NDJSON only, rows tagged with ``_table``)."""
+    if not is_admin(request):
+        raise HTTPException(403)
+    if dataset != "all" and dataset not in DATASETS:
+        raise HTTPException(404)
+    if format not in ("ndjson", "csv") or (format == "csv" and dataset == "all"):
+        raise HTTPException(400, "format must be ndjson, or csv for a single dataset")
+    filters = {"user_id": user_id, "since": _parse_day(since, False), "until": _parse_day(until, True)}
+
+    if format == "csv":
+        lines = _csv_lines(dataset, **filters)
+        media, ext = "text/csv", "csv"
+    else:
+        names = list(DATASETS) if dataset == "all" else [dataset]
+        lines = _ndjson_lines(names, tag=(dataset == "all"), **filters)
+        media, ext = "application/x-ndjson", "ndjson"
+    filename = f"quickfire-{dataset}.{ext}"
+    if gzip:
+        media, filename = "application/gzip", filename + ".gz"
+    return StreamingResponse(
+        _chunked(lines, gzip), media_type=media,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,29 +1,52 @@
+from typing import Optional
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from ..utils.session import get_user_id
-from ..utils.feed_builders import fetch_results_with_stars, build_feed_items, today_counts
+from ..utils.feed_builders import fetch_history_page, build_feed_items, today_counts, HISTORY_PAGE
 from ..utils.progress import progress_payload
+from ..utils.activity import activity_calendar
+from ..deps import DbSession
 
 router = APIRouter()
 
 @router.get("/feed")
-def feed(request: Request):
+def feed(request: Request, s: DbSession):
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    results, star_ids = fetch_results_with_stars(uid, limit=25)
-    return JSONResponse({"items": build_feed_items(results, star_ids)})
+    results, star_ids, nxt = fetch_history_page(s, uid, HISTORY_PAGE)
+    return ORJSONResponse({"items": build_feed_items(results, star_ids), "next_cursor": nxt})
+
+@router.get("/history")
+def history(request: Request, s: DbSession, cursor: Optional[str] = None, limit: int = HISTORY_PAGE):
+    """Older drills after ``cursor`` (the ``next_cursor`` of /feed or a previous page)."""
+    uid = get_user_id(request)
+    if not uid:
+        raise HTTPException(403)
+    try:
+        results, star_ids, nxt = fetch_history_page(s, uid, limit, cursor)
+    except ValueError:
+        raise HTTPException(400, "Bad cursor")
+    return ORJSONResponse({"items": build_feed_items(results, star_ids), "next_cursor": nxt})
 
 @router.get("/stats")
-def stats(request: Request, tz_offset: int = 0):
+def stats(request: Request, s: DbSession, tz_offset: int = 0):
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    return JSONResponse(today_counts(uid, tz_offset))
+    return ORJSONResponse(today_counts(s, uid, tz_offset))
 
 @router.get("/progress")
-def progress(request: Request):
+def progress(request: Request, s: DbSession):
+    uid = get_user_id(request)
+    if not uid:
+        raise HTTPException(403)
+    return ORJSONResponse(progress_payload(s, uid))
+
+@router.get("/activity")
+def activity(request: Request, s: DbSession, tz_offset: int = 0, days: int = 365):
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    return JSONResponse(progress_payload(uid))
+    days = max(1, min(days, 366 * 3))
+    return ORJSONResponse(activity_calendar(s, uid, tz_offset, days))
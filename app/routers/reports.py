@@ -1,83 +1,56 @@
-from typing import List, Tuple
-from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import JSONResponse
-from sqlmodel import select
+from fastapi.responses import ORJSONResponse
 from ..utils.session import get_user_id
-from ..storage import get_session
-from ..models import DrillQuestion, DrillResult, DrillTypeEnum
+from ..utils.report_engine import fact_report, compact_rows, resolve_axes, LAST_N
+from ..utils.latency import speed_report
+from ..deps import DbSession
+from ..models import DrillTypeEnum
 
 router = APIRouter()
 
-def _last5_error_rate(rows: List[Tuple[int,int,bool,datetime]], a_range, b_range):
-    bucket = {a:{b:[] for b in b_range} for a in a_range}
-    for a,b,ok,ts in rows:
-        if a in bucket and b in bucket[a]:
-            bucket[a][b].append((ts, ok))
-    grid = {a:{b:None for b in b_range} for a in a_range}
-    for a in a_range:
-        for b in b_range:
-            if not bucket[a][b]:
-                grid[a][b] = None
-            else:
-                bucket[a][b].sort(key=lambda t: t[0])
-                last = [ok for _,ok in bucket[a][b][-5:]]
-                wrong = last.count(False)
-                grid[a][b] = wrong / len(last)
-    return grid
-
-@router.get("/report/multiplication")
-def report_mul(request: Request):
-    uid = get_user_id(request)
-    if not uid:
-        raise HTTPException(403)
-    rows: List[Tuple[int,int,bool,datetime]] = []
-    with get_session() as s:
-        q = s.exec(
-            select(DrillQuestion.a, DrillQuestion.b, DrillQuestion.correct, DrillQuestion.started_at, DrillResult.user_id)
-            .join(DrillResult, DrillResult.id == DrillQuestion.drill_result_id)
-            .where(DrillResult.user_id == uid)
-            .where(DrillQuestion.drill_type == DrillTypeEnum.multiplication)
-        ).all()
-    for a, b, ok, ts, _uid in q:
-        rows.append((int(a), int(b), bool(ok), ts))
-    grid = _last5_error_rate(rows, range(1,13), range(1,13))
-    return JSONResponse({"labels_from": 1, "labels_to": 12, "grid": grid})
-
-@router.get("/report/addition")
-def report_add(request: Request):
+@router.get("/report/{drill_type}")
+def report(
+    request: Request,
+    s: DbSession,
+    drill_type: DrillTypeEnum,
+    compact: bool = False,
+    lo: Optional[int] = None,
+    hi: Optional[int] = None,
+    step: Optional[int] = None,
+    last_n: int = LAST_N,
+):
+    """Last-N error rate per fact. Range defaults to what the user's level covers;
+    ``step`` buckets large operand ranges (auto when omitted)."""
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    rng = 20
-    rows: List[Tuple[int,int,bool,datetime]] = []
-    with get_session() as s:
-        q = s.exec(
-            select(DrillQuestion.a, DrillQuestion.b, DrillQuestion.correct, DrillQuestion.started_at, DrillResult.user_id)
-            .join(DrillResult, DrillResult.id == DrillQuestion.drill_result_id)
-            .where(DrillResult.user_id == uid)
-            .where(DrillQuestion.drill_type == DrillTypeEnum.addition)
-        ).all()
-    for a, b, ok, ts, _uid in q:
-        rows.append((int(a), int(b), bool(ok), ts))
-    grid = _last5_error_rate(rows, range(0,rng+1), range(0,rng+1))
-    return JSONResponse({"labels_from": 0, "labels_to": rng, "grid": grid})
+    if (lo is not None and hi is not None and hi < lo) or (step is not None and step < 1) or last_n < 1:
+        raise HTTPException(400)
+    rep = fact_report(s, uid, drill_type, lo=lo, hi=hi, step=step, last_n=last_n)
+    if compact:
+        rep = {**rep, "layout": "rows", "grid": compact_rows(rep)}
+    return ORJSONResponse(rep)
 
-@router.get("/report/subtraction")
-def report_sub(request: Request):
+@router.get("/report/{drill_type}/speed")
+def speed(
+    request: Request,
+    s: DbSession,
+    drill_type: DrillTypeEnum,
+    compact: bool = False,
+    lo: Optional[int] = None,
+    hi: Optional[int] = None,
+    step: Optional[int] = None,
+):
+    """Recent response time per fact ({p50, p90, n}, ms) from the stored latency
+    sketches; same axes, range and bucketing as /report/{drill_type}."""
     uid = get_user_id(request)
     if not uid:
         raise HTTPException(403)
-    rng = 20
-    rows: List[Tuple[int,int,bool,datetime]] = []
-    with get_session() as s:
-        q = s.exec(
-            select(DrillQuestion.a, DrillQuestion.b, DrillQuestion.correct, DrillQuestion.started_at, DrillResult.user_id)
-            .join(DrillResult, DrillResult.id == DrillQuestion.drill_result_id)
-            .where(DrillResult.user_id == uid)
-            .where(DrillQuestion.drill_type == DrillTypeEnum.subtraction)
-        ).all()
-    for a, b, ok, ts, _uid in q:
-        rows.append((int(a), int(b), bool(ok), ts))
-    grid = _last5_error_rate(rows, range(0,rng+1), range(0,rng+1))
-    return JSONResponse({"labels_from": 0, "labels_to": rng, "grid": grid})
+    if (lo is not None and hi is not None and hi < lo) or (step is not None and step < 1):
+        raise HTTPException(400)
+    lo, hi, step = resolve_axes(s, uid, drill_type, lo, hi, step)
+    rep = speed_report(s, uid, drill_type, lo, hi, step)
+    if compact:
+        rep = {**rep, "layout": "rows", "grid": compact_rows(rep)}
+    return ORJSONResponse(rep)
@@ -35,33 +35,83 @@
   function setDigits(el,text){ if(el) el.innerHTML = digitsToHTML(text); }
 
   // -------- API helpers --------
-  async function apiNext(type, avoid, avoidPair){ const fd=new FormData(); fd.set("drill_type",type); if(avoid) fd.set("avoid_prompt", avoid); if(avoidPair) fd.set("avoid_pair", avoidPair); const r=await fetch("/next",{method:"POST",body:fd}); if(!r.ok) throw new Error("next failed"); return r.json(); }
+  async function apiNext(type, avoid, avoidPair){ const qs=new URLSearchParams({drill_type:type}); if(avoid) qs.set("avoid_prompt", avoid); if(avoidPair) qs.set("avoid_pair", avoidPair); const r=await fetch(`/next?${qs}`); if(!r.ok) throw new Error("next failed"); return r.json(); }
   async function apiFeed(){ const r=await fetch("/feed"); return r.ok? r.json(): {items:[]}; }
+  async function apiHistory(cursor){ const r=await fetch(`/history?cursor=${encodeURIComponent(cursor)}`); return r.ok? r.json(): {items:[]}; }
   async function apiStats(){ const tz=new Date().getTimezoneOffset(); const r=await fetch(`/stats?tz_offset=${encodeURIComponent(tz)}`); return r.ok? r.json(): null; }
   async function apiProg(){ const r=await fetch("/progress"); return r.ok? r.json(): null; }
-  async function apiReportMul(){ const r=await fetch("/report/multiplication"); return r.ok? r.json(): null; }
-  async function apiReportAdd(){ const r=await fetch("/report/addition"); return r.ok? r.json(): null; }
-  async function apiReportSub(){ const r=await fetch("/report/subtraction"); return r.ok? r.json(): null; }
+  async function apiReport(type){ const r=await fetch(`/report/${encodeURIComponent(type)}?compact=1`); return r.ok? r.json(): null; }
+
+  // -------- offline queue: finished drills wait in localStorage until /finish/bulk accepts them --------
+  const PENDING_KEY="qf-pending-finishes", PLAN_KEY=t=>`qf-plan-${t}`;
+  function loadJSON(k, dflt){ try{ const v=localStorage.getItem(k); return v? JSON.parse(v): dflt; }catch{ return dflt; } }
+  function saveJSON(k, v){ try{ if(v==null) localStorage.removeItem(k); else localStorage.setItem(k, JSON.stringify(v)); }catch{} }
+  function queueFinish(entry){ const q=loadJSON(PENDING_KEY, []); if(!q.some(e=>e.idem_key===entry.idem_key)) q.push(entry); saveJSON(PENDING_KEY, q); }
+  function pendingCount(){ return loadJSON(PENDING_KEY, []).length; }
+  let syncing=null;
+  function syncPending(){
+    if(syncing) return syncing;
+    syncing=(async()=>{
+      const q=loadJSON(PENDING_KEY, []); if(!q.length) return null;
+      try{
+        const r=await fetch("/finish/bulk",{method:"POST", headers:{"Content-Type":"application/json"}, body:JSON.stringify({drills:q.slice(0,200)})});
+        if(!r.ok) return null;
+        const pay=await r.json(); const done=new Set((pay.results||[]).map(x=>x.idem_key));
+        saveJSON(PENDING_KEY, loadJSON(PENDING_KEY, []).filter(e=>!done.has(e.idem_key)));
+        return pay;
+      }catch{ return null; }
+    })().finally(()=>{ syncing=null; });
+    return syncing;
+  }
+  // Plans are fetched one drill ahead so the next drill can start without the server.
+  // Resolves true when a fresh plan arrived (within timeoutMs, if given).
+  async function prefetchPlan(type, timeoutMs){
+    const ctl=new AbortController(), t=timeoutMs ? setTimeout(()=>ctl.abort(), timeoutMs) : null;
+    try{
+      const r=await fetch(`/plan/${encodeURIComponent(type)}`, {signal:ctl.signal});
+      if(r.ok){ saveJSON(PLAN_KEY(type), await r.json()); return true; }
+    }catch{}finally{ if(t) clearTimeout(t); }
+    return false;
+  }
+  function takePlan(type){ const p=loadJSON(PLAN_KEY(type), null); saveJSON(PLAN_KEY(type), null); return p; }
+  window.addEventListener("online", ()=>{ syncPending(); });
+  if(navigator.onLine !== false) setTimeout(syncPending, 0);
 
   // -------- feed + stats renderers --------
-  function renderFeed(container,items){
-    if(!container) return;
-    if(!items||!items.length){ container.innerHTML='<div class="news-empty">No drills yet — hit Start.</div>'; return; }
+  function feedItemHTML(d){
     const fmt = iso => new Date(iso).toLocaleString(undefined,{weekday:"long",hour:"2-digit",minute:"2-digit"});
-    container.innerHTML = items.map(d=>{
-      const mins=Math.floor(d.time_ms/60000), secs=Math.floor((d.time_ms/1000)%60);
-      const star = d.star ? ' <span title="Star earned">★</span>' : '';
-      const typeLabel = d.drill_type[0].toUpperCase()+d.drill_type.slice(1);
-      const lvl = d.level? ` • Level ${d.level}` : '';
-      const score = d.score ? d.score : '';
-      return `<div class="news-item">
+    const mins=Math.floor(d.time_ms/60000), secs=Math.floor((d.time_ms/1000)%60);
+    const star = d.star ? ' <span title="Star earned">★</span>' : '';
+    const typeLabel = d.drill_type[0].toUpperCase()+d.drill_type.slice(1);
+    const lvl = d.level? ` • Level ${d.level}` : '';
+    const score = d.score ? d.score : '';
+    return `<div class="news-item">
         <div class="news-time">${fmt(d.ts)}${star}</div>
         <div class="news-settings"><strong>${typeLabel}</strong>${lvl}</div>
         <div class="news-note">${d.label}</div>
         <div class="news-score">Score ${score}</div>
         <div class="news-result">${mins} min ${secs} secs</div>
       </div>`;
-    }).join("");
+  }
+  // nextCursor comes from /feed or /history; the #feed-more button pages through older drills.
+  function renderFeed(container,items,nextCursor,append){
+    if(!container) return;
+    if(!append && (!items||!items.length)){ container.innerHTML='<div class="news-empty">No drills yet — hit Start.</div>'; feedMore(container,null); return; }
+    const html=(items||[]).map(feedItemHTML).join("");
+    if(append) container.insertAdjacentHTML("beforeend", html); else container.innerHTML=html;
+    feedMore(container,nextCursor);
+  }
+  function feedMore(container,cursor){
+    const btn=document.getElementById("feed-more"); if(!btn) return;
+    btn.hidden=!cursor; btn.dataset.cursor=cursor||"";
+    if(btn.dataset.bound) return;
+    btn.dataset.bound="1";
+    btn.addEventListener("click", async ()=>{
+      const c=btn.dataset.cursor; if(!c) return;
+      btn.disabled=true;
+      try{ const f=await apiHistory(c); renderFeed(container, f.items, f.next_cursor, true); }
+      finally{ btn.disabled=false; }
+    });
   }
   function renderStats(listEl,s){ if(!listEl||!s) return; listEl.innerHTML = `
       <li>Total: <strong>${s.total}</strong></li>
@@ -76,7 +126,8 @@
 
   // Expose minimal API used by page scripts
   window.QF = { fmtTime, ding, winSound, starSound, levelUpSound, say, digitsToHTML, setDigits, starDots, unlockMediaOnce,
-    apiNext, apiFeed, apiStats, apiProg, apiReportMul, apiReportAdd, apiReportSub,
+    apiNext, apiFeed, apiHistory, apiStats, apiProg, apiReport,
+    queueFinish, pendingCount, syncPending, prefetchPlan, takePlan,
     renderFeed, renderStats, renderProgressOnCards };
 
   // -------- theme toggle --------
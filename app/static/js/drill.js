@@ -28,6 +28,8 @@
   function renderEq(prompt){ const p=parsePrompt(prompt); if(!p) return; QF.setDigits(document.getElementById("num-a"), p.a); QF.setDigits(document.getElementById("num-b"), p.b); const op=document.getElementById("op"); if(op) op.textContent=p.op; }
   function insertWithin(arr,item,minAhead=3,maxAhead=5){ const pos=Math.min(arr.length, Math.floor(Math.random()*(maxAhead-minAhead+1))+minAhead); arr.splice(pos,0,item); }
 
+  const PLAN_PROBE_MS=3000;
+
   function initDrill(){
     const drill=window.DRILL; if(!drill) return;
     const ansEl=document.getElementById("answer"), formEl=document.getElementById("answer-form"), qDoneEl=document.getElementById("q-done"), timerEl=document.getElementById("timer");
@@ -36,9 +38,14 @@
     const overlay=document.getElementById("overlay"), overlayContent=document.getElementById("overlay-content");
 
     QF.apiStats().then(s=>QF.renderStats(document.getElementById("stats-list"),s));
-    QF.apiFeed().then(f=>QF.renderFeed(document.getElementById("feed-list"), f.items));
+    QF.apiFeed().then(f=>QF.renderFeed(document.getElementById("feed-list"), f.items, f.next_cursor));
 
-    let queue=[{prompt:drill.first.prompt, answer:drill.first.answer, tts:drill.first.tts}];
+    // Seeded drills come with their whole problem plan; items carry their plan index `i`
+    let plan = Array.isArray(drill.plan) && drill.plan.length ? drill.plan : null;
+    let planIdx = plan ? 1 : 0;
+    const newKey = ()=> (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    let finishKey = newKey();
+    let queue=[plan ? {...plan[0], i:0} : {prompt:drill.first.prompt, answer:drill.first.answer, tts:drill.first.tts}];
     let done=0, misses=0, running=true, start=performance.now(); let lastPrompt=null;
     let currentStart=new Date(); const qlog=[]; let lastTimer="";
 
@@ -52,7 +59,15 @@
       while(queue.length<6 && done+queue.length<drill.target){
         const avoid = queue.length? queue[queue.length-1].prompt : lastPrompt;
         const avoidPair = (queue.length? queue[queue.length-1].prompt : lastPrompt) ? commKey(queue.length? queue[queue.length-1].prompt : lastPrompt) : null;
-        const nxt = await QF.apiNext(drill.type, avoid, avoidPair);
+        if(plan && planIdx<plan.length){
+          const i=planIdx++, nxt=plan[i];
+          if((avoid && nxt.prompt===avoid) || (avoidPair && commKey(nxt.prompt)===avoidPair)) continue;
+          queue.push({...nxt, i});
+          continue;
+        }
+        // No plan, or it ran out: ask the server (items without `i` make /finish store the drill unseeded)
+        let nxt;
+        try{ nxt = await QF.apiNext(drill.type, avoid, avoidPair); }catch(e){ return; }
         if((avoid && nxt.prompt===avoid) || (avoidPair && commKey(nxt.prompt)===avoidPair)) continue;
         queue.push({prompt:nxt.prompt, answer:nxt.answer, tts:nxt.tts});
       }
@@ -69,8 +84,28 @@
       fd.set("question_count", String(drill.target));
       fd.set("score", String(correctFirstTry));
       fd.set("qlog", JSON.stringify(qlog));
-      const res=await fetch("/finish",{method:"POST", body:fd});
-      let pay={}; try{ pay=await res.json(); }catch{}
+      if(plan && drill.seed){ fd.set("seed", drill.seed); fd.set("plan_level", String(drill.level)); }
+      // One key per drill: a retried POST gets the original result instead of a second record
+      fd.set("idem_key", finishKey);
+      let pay=null;
+      for(let attempt=0; attempt<3 && navigator.onLine!==false; attempt++){
+        try{
+          const res=await fetch("/finish",{method:"POST", body:fd});
+          if(res.status===429 || res.status>=500){ await new Promise(r=>setTimeout(r, 1000*(attempt+1))); continue; }
+          pay={}; try{ pay=await res.json(); }catch{}
+          break;
+        }catch{ await new Promise(r=>setTimeout(r, 1000*(attempt+1))); }
+      }
+      if(pay===null){
+        // Offline: keep the drill on this device; /finish/bulk applies it (same key) once we reconnect
+        QF.queueFinish({idem_key:finishKey, created_at:new Date().toISOString(), drill_type:drill.type,
+          elapsed_ms:elapsed, settings_human:fd.get("settings_human"), question_count:drill.target, score:correctFirstTry,
+          qlog, seed:(plan && drill.seed) ? drill.seed : null, plan_level:(plan && drill.seed) ? drill.level : null});
+        pay={fail_msg:"Saved on this device — it will sync when you're back online."};
+      }else{
+        QF.syncPending();
+      }
+      QF.prefetchPlan(drill.type);
 
       // Hide the last problem completely and show the celebration screen
       if(document.getElementById("equation")) document.getElementById("equation").classList.add("hidden");
@@ -82,7 +117,7 @@
       const aside = document.querySelector('.news-col'); if(aside) aside.classList.add('reveal');
 
       QF.apiStats().then(s=>QF.renderStats(document.getElementById("stats-list"),s));
-      QF.apiFeed().then(f=>QF.renderFeed(document.getElementById("feed-list"), f.items));
+      QF.apiFeed().then(f=>QF.renderFeed(document.getElementById("feed-list"), f.items, f.next_cursor));
 
       const gotStar = !!(pay && (pay.star || (Array.isArray(pay.awards) && pay.awards.join(" ").toLowerCase().includes("star"))));
       if(gotStar) QF.starSound();
@@ -158,7 +193,7 @@
 
       if(val===current.answer){
         QF.ding();
-        qlog.push({prompt:current.prompt, a:+parsed.a, b:+parsed.b, correct_answer:current.answer, given_answer:val, correct:true, started_at:currentStart.toISOString(), elapsed_ms:elapsed});
+        qlog.push({i:current.i, prompt:current.prompt, a:+parsed.a, b:+parsed.b, correct_answer:current.answer, given_answer:val, correct:true, started_at:currentStart.toISOString(), elapsed_ms:elapsed});
         done+=1; document.getElementById("q-done").textContent=String(done);
         lastPrompt=current.prompt;
         if(done>=drill.target){ await finish(); return; }
@@ -168,7 +203,7 @@
         misses += 1;
 
         QF.say(current.tts);
-        qlog.push({prompt:current.prompt, a:+parsed.a, b:+parsed.b, correct_answer:current.answer, given_answer:val, correct:false, started_at:currentStart.toISOString(), elapsed_ms:elapsed});
+        qlog.push({i:current.i, prompt:current.prompt, a:+parsed.a, b:+parsed.b, correct_answer:current.answer, given_answer:val, correct:false, started_at:currentStart.toISOString(), elapsed_ms:elapsed});
         const html = `${QF.digitsToHTML(parsed.a)} <span class="op">${parsed.op}</span> ${QF.digitsToHTML(parsed.b)} = ${QF.digitsToHTML(String(current.answer))}`;
         overlayContent.innerHTML = html;
         overlay.classList.remove("hidden");
@@ -190,12 +225,34 @@
       }
     });
 
+    // Restart in place from a prefetched plan (used when the server can't be reached)
+    function begin(p){
+      plan=p.plan; planIdx=1; drill.seed=p.seed; drill.level=p.level; finishKey=newKey();
+      queue=[{...plan[0], i:0}]; done=0; misses=0; qlog.length=0; lastPrompt=null;
+      const sh=document.getElementById("settings-human"); if(sh) sh.textContent=p.label;
+      const ln=document.getElementById("level-num"); if(ln) QF.setDigits(ln, String(p.level));
+      document.getElementById("q-done").textContent="0";
+      const eq=document.getElementById("equation"); if(eq) eq.classList.remove("hidden");
+      formEl.classList.remove("hidden");
+      const cele=document.getElementById("celebrate"); if(cele) cele.classList.add("hidden");
+      if(helper) helper.textContent="";
+      running=true; start=performance.now(); requestAnimationFrame(tick);
+      showCurrent(); topUpQueue();
+    }
+
     if(playAgainBtn && againForm){
-      playAgainBtn.addEventListener("click", (e)=>{ e.preventDefault(); againForm.submit(); });
+      playAgainBtn.addEventListener("click", async (e)=>{
+        e.preventDefault();
+        // Only leave the page if the server answers; a failed or slow probe restarts from the prefetched plan
+        if(navigator.onLine!==false && await QF.prefetchPlan(drill.type, PLAN_PROBE_MS)){ againForm.submit(); return; }
+        const p=QF.takePlan(drill.type); if(p && Array.isArray(p.plan) && p.plan.length){ begin(p); return; }
+        againForm.submit();
+      });
     }
 
     renderEq(queue[0].prompt);
     topUpQueue(); ansEl.focus();
+    QF.prefetchPlan(drill.type);
   }
 
   document.addEventListener("DOMContentLoaded", ()=>{ 
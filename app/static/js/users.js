@@ -0,0 +1,46 @@
+(function(){
+  // Incremental user directory: search + "more" pages from /users/search (keyset cursors)
+  const esc = s => String(s).replace(/[&<>"']/g, c=>({"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[c]));
+  const cap = s => s ? s[0].toUpperCase()+s.slice(1) : "";
+
+  function loginTile(u){
+    const r=u.last;
+    let sub='<div class="user-sub muted">No drills yet — be the first!</div>';
+    if(r){
+      const lvl = r.level ? ` • Level <span class="lvl-num" data-level="${r.level}">${r.level}</span>` : "";
+      const mins=Math.floor(r.elapsed_ms/60000), secs=String(Math.floor(r.elapsed_ms/1000)%60).padStart(2,"0");
+      const star = r.star ? ' • <span class="user-star" title="Star earned">★</span>' : "";
+      sub=`<div class="user-sub user-sub1">Last: ${esc(cap(r.type))}${lvl}</div><div class="user-sub user-sub2">${mins}:${secs}${star}</div>`;
+    }
+    return `<form method="post" action="/login" class="user-tile-form"><input type="hidden" name="user_id" value="${u.id}">
+      <button class="user-card" type="submit"><div class="user-name">${esc(u.display_name)}</div>${sub}</button></form>`;
+  }
+  function adminRow(u){
+    const name=esc(u.display_name);
+    return `<li class="row space-between">
+      <label><input type="checkbox" form="bulk-delete" name="user_id" value="${u.id}"> ${name}</label>
+      <form method="post" action="/admin/delete_user" onsubmit="return confirm(${esc(JSON.stringify("Delete "+u.display_name+"?"))});">
+        <input type="hidden" name="user_id" value="${u.id}"><button class="btn btn-danger">Delete</button></form></li>`;
+  }
+
+  function initDirectory(root){
+    const login = root.dataset.mode === "login";
+    const list=root.querySelector("[data-list]"), more=root.querySelector("[data-more]"), search=root.querySelector("[data-search]");
+    let cursor=root.dataset.next || null, q="", seq=0, timer=null;
+    async function load(reset){
+      const my=++seq;
+      const p=new URLSearchParams({order: root.dataset.order || "recent"});
+      if(login) p.set("recent","1");
+      if(q) p.set("q", q);
+      if(!reset && cursor) p.set("cursor", cursor);
+      const r=await fetch(`/users/search?${p}`); if(!r.ok || my!==seq) return;
+      const d=await r.json();
+      const html=d.items.map(login ? loginTile : adminRow).join("");
+      if(reset) list.innerHTML=html; else list.insertAdjacentHTML("beforeend", html);
+      cursor=d.next_cursor; if(more) more.hidden=!cursor;
+    }
+    if(more) more.addEventListener("click", ()=>load(false));
+    if(search) search.addEventListener("input", ()=>{ clearTimeout(timer); timer=setTimeout(()=>{ q=search.value.trim(); cursor=null; load(true); }, 200); });
+  }
+  document.querySelectorAll("[data-directory]").forEach(initDirectory);
+})();
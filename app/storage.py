@@ -1,4 +1,5 @@
 from contextlib import contextmanager
+from typing import Iterator
 from sqlmodel import SQLModel, Session, create_engine
 from sqlalchemy.engine import URL
 import os
@@ -17,11 +18,56 @@ db_url = URL.create(
 engine = create_engine(db_url, connect_args={"check_same_thread": False})
 
 
+def _add_missing_columns():
+    """create_all never alters existing tables; add columns declared since that are
+    nullable or NOT NULL with a server default."""
+    with engine.connect() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            have = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            for col in table.columns:
+                if col.name in have:
+                    continue
+                ddl = col.type.compile(dialect=engine.dialect)
+                if col.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {col.server_default.arg}"
+                elif not col.nullable:
+                    continue
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {ddl}')
+        conn.commit()
+
+
+# Indexes an older schema created that a composite index now covers.
+_DROPPED_INDEXES = ("ix_drillresult_user_id",)
+
+
 def init_db():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    # create_all only indexes brand-new tables; add indexes declared since then.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        for name in _DROPPED_INDEXES:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+        conn.commit()
+    from .utils.activity import backfill_if_empty
+    from .utils.user_directory import ensure_directory
+    with engine.connect() as conn:
+        backfill_if_empty(conn)
+        ensure_directory(conn)
 
 
 @contextmanager
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+def request_session() -> Iterator[Session]:
+    """FastAPI dependency (see ``deps.DbSession``): one session per request, so a
+    request checks out one connection and runs one transaction. Committed when
+    the route returns, rolled back if it raises. Helpers take it as ``s``."""
+    with Session(engine) as session:
+        yield session
+        session.commit()
@@ -0,0 +1,132 @@
+"""Per-user activity rollups (drills per UTC hour and type).
+
+``finish_drill`` bumps one row per drill; ``/stats`` and ``/activity`` read
+the rollup instead of scanning DrillResult. Hour buckets serve every whole-hour
+``tz_offset`` exactly; for half-hour zones the two partial edge hours of the
+day are counted from DrillResult directly.
+"""
+from datetime import datetime, timedelta, date
+from typing import Dict, Any, Iterable, Optional
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+from ..models import ActivityRollup, DrillResult, DrillTypeEnum
+
+HOUR = timedelta(hours=1)
+
+
+def _floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def record_drill(s: Session, uid: int, drill_type: DrillTypeEnum, created_at: datetime) -> None:
+    """Count one finished drill (caller commits)."""
+    table = ActivityRollup.__table__
+    stmt = sqlite_insert(table).values(
+        user_id=uid, hour_utc=_floor_hour(created_at), drill_type=drill_type, drills=1,
+    ).on_conflict_do_update(
+        index_elements=["user_id", "hour_utc", "drill_type"],
+        set_={"drills": table.c.drills + 1},
+    )
+    s.exec(stmt)
+
+
+def rebuild_activity(conn: Connection, user_ids: Optional[Iterable[int]] = None) -> None:
+    """Recompute rollup rows from DrillResult (all users, or just ``user_ids``)."""
+    where = ""
+    if user_ids is not None:
+        ids = sorted(set(int(u) for u in user_ids))
+        if not ids:
+            return
+        where = f"WHERE user_id IN ({', '.join(str(i) for i in ids)})"
+    conn.exec_driver_sql(f"DELETE FROM activityrollup {where}")
+    # Same text format SQLAlchemy uses for DateTime on SQLite.
+    conn.exec_driver_sql(
+        "INSERT INTO activityrollup (user_id, hour_utc, drill_type, drills) "
+        "SELECT user_id, strftime('%Y-%m-%d %H:00:00.000000', created_at), drill_type, COUNT(*) "
+        f"FROM drillresult {where} GROUP BY 1, 2, 3"
+    )
+
+
+def backfill_if_empty(conn: Connection) -> None:
+    """First boot after upgrade: build the rollup from existing history."""
+    has_rollup = conn.exec_driver_sql("SELECT 1 FROM activityrollup LIMIT 1").first()
+    has_results = conn.exec_driver_sql("SELECT 1 FROM drillresult LIMIT 1").first()
+    if has_results and not has_rollup:
+        rebuild_activity(conn)
+        conn.commit()
+
+
+def local_day_window(tz_offset_min: int, day: Optional[date] = None) -> tuple[datetime, datetime]:
+    if day is None:
+        day = (datetime.utcnow() - timedelta(minutes=tz_offset_min)).date()
+    start_utc = datetime(day.year, day.month, day.day) + timedelta(minutes=tz_offset_min)
+    return start_utc, start_utc + timedelta(days=1)
+
+
+def counts_between(s: Session, uid: int, start_utc: datetime, end_utc: datetime) -> Dict[str, int]:
+    """Drills per type in [start_utc, end_utc): whole hours from the rollup, edges from DrillResult."""
+    counts = {dt.value: 0 for dt in DrillTypeEnum}
+    first_full = _floor_hour(start_utc) + (HOUR if start_utc != _floor_hour(start_utc) else timedelta(0))
+    last_full = _floor_hour(end_utc)
+    rows = s.exec(
+        select(ActivityRollup.drill_type, func.sum(ActivityRollup.drills))
+        .where(ActivityRollup.user_id == uid)
+        .where(ActivityRollup.hour_utc >= first_full)
+        .where(ActivityRollup.hour_utc < last_full)
+        .group_by(ActivityRollup.drill_type)
+    ).all()
+    for dt, n in rows:
+        counts[dt.value] += int(n or 0)
+    for lo, hi in ((start_utc, first_full), (last_full, end_utc)):
+        if lo >= hi:
+            continue
+        for dt, n in s.exec(
+            select(DrillResult.drill_type, func.count())
+            .where(DrillResult.user_id == uid)
+            .where(DrillResult.created_at >= lo)
+            .where(DrillResult.created_at < hi)
+            .group_by(DrillResult.drill_type)
+        ).all():
+            counts[dt.value] += int(n)
+    return counts
+
+
+def activity_calendar(s: Session, uid: int, tz_offset_min: int, days: int = 365) -> Dict[str, Any]:
+    """Drills per local day for the last ``days`` days plus current/longest streaks.
+
+    Hours are assigned to the local day their start falls on, so in half-hour
+    zones the hour straddling midnight lands on one side.
+    """
+    today = (datetime.utcnow() - timedelta(minutes=tz_offset_min)).date()
+    first = today - timedelta(days=days - 1)
+    start_utc, _ = local_day_window(tz_offset_min, first)
+    per_day: Dict[date, int] = {}
+    offset = timedelta(minutes=tz_offset_min)
+    for hour, n in s.exec(
+        select(ActivityRollup.hour_utc, func.sum(ActivityRollup.drills))
+        .where(ActivityRollup.user_id == uid)
+        .where(ActivityRollup.hour_utc >= _floor_hour(start_utc))
+        .group_by(ActivityRollup.hour_utc)
+    ).all():
+        d = (hour - offset).date()
+        if first <= d <= today:
+            per_day[d] = per_day.get(d, 0) + int(n)
+
+    calendar = []
+    longest = run = 0
+    for i in range(days):
+        d = first + timedelta(days=i)
+        n = per_day.get(d, 0)
+        calendar.append({"date": d.isoformat(), "drills": n})
+        run = run + 1 if n else 0
+        longest = max(longest, run)
+    # Current streak: consecutive active days ending today (or yesterday, if today is still empty)
+    current = 0
+    i = days - 1 if per_day.get(today) else days - 2
+    while i >= 0 and calendar[i]["drills"]:
+        current += 1
+        i -= 1
+    return {"days": calendar, "current_streak": current, "longest_streak": longest,
+            "active_days": len(per_day)}
@@ -0,0 +1,93 @@
+"""Per-user token buckets (429 before the database) and single-flight
+coalescing of identical concurrent requests, for /next and /finish."""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+import orjson
+from fastapi import HTTPException
+
+RATE_PER_SEC = float(os.getenv("APP_RATE_PER_SEC", "5"))   # 0 disables the limiter
+BURST = int(os.getenv("APP_RATE_BURST", "30"))
+MAX_BUCKETS = 10_000
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float = RATE_PER_SEC, burst: int = BURST, max_keys: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, ts)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 if admitted, else seconds until it would be."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - ts) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)   # idle buckets are full anyway
+            return wait
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.rejected = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return fut.result()
+        try:
+            res = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(res)
+            return res
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+def form_key(*parts: Any) -> str:
+    """Stable digest of request fields, for single-flight keys."""
+    return hashlib.sha1(orjson.dumps(parts, default=str)).hexdigest()
+
+
+def check_rate(uid: int, cost: float = 1.0) -> None:
+    wait = limiter.acquire(uid, cost)
+    if wait:
+        raise HTTPException(429, "Too many requests", headers={"Retry-After": str(max(1, round(wait)))})
+
+
+limiter = TokenBucketLimiter()
+inflight = SingleFlight()
@@ -0,0 +1,204 @@
+"""Online backups with SQLite's backup API.
+
+``run_backup`` copies the live database with ``sqlite3.Connection.backup`` in
+steps of ``PAGES_PER_STEP`` pages and sleeps ``STEP_SLEEP_MS`` between steps
+(in the progress callback), so the read lock is dropped between steps and
+writers keep committing. A write from another connection makes SQLite start
+the copy over; each restart quadruples the step size, and after
+``MAX_RESTARTS`` the copy is done in one step (one read lock for the whole
+copy, writers wait on their busy timeout), so a busy database still gets
+backed up.
+
+Each copy is checked with ``PRAGMA integrity_check`` before it is
+gzip-compressed into ``BACKUP_DIR`` as ``quickfire-<UTC stamp>.sqlite.gz``;
+only the newest ``KEEP`` snapshots are kept. Runs start from /admin/backups or,
+when APP_BACKUP_INTERVAL_HOURS is set (e.g. 24 in the Dockerfile), from
+``scheduler`` every ``INTERVAL_HOURS`` (counted from the newest snapshot). Timings and sizes of recent runs are kept in memory for the admin
+page.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+from ..storage import DB_PATH
+
+BACKUP_DIR = os.getenv("APP_BACKUP_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "backups"))
+KEEP = int(os.getenv("APP_BACKUP_KEEP", "7"))
+INTERVAL_HOURS = float(os.getenv("APP_BACKUP_INTERVAL_HOURS", "0"))   # opt-in; 0 = no schedule
+PAGES_PER_STEP = int(os.getenv("APP_BACKUP_PAGES", "256"))
+STEP_SLEEP_MS = float(os.getenv("APP_BACKUP_SLEEP_MS", "20"))
+MAX_RESTARTS = 3
+
+_NAME_RE = re.compile(r"^quickfire-(\d{8}-\d{6}-\d{6})\.sqlite\.gz$")
+_lock = threading.Lock()
+_runs: deque = deque(maxlen=20)
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+def run_backup(db_path: Optional[str] = None) -> dict:
+    """Take one snapshot; returns its metrics (also kept for ``recent_runs``).
+    Raises BackupError if another run is active or the copy fails its check."""
+    if not _lock.acquire(blocking=False):
+        raise BackupError("a backup is already running")
+    try:
+        run = {"started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "ok": False, "error": None}
+        _runs.appendleft(run)
+        try:
+            run.update(_snapshot(db_path or DB_PATH))
+            run["ok"] = True
+        except BackupError as e:
+            run["error"] = str(e)
+            raise
+        except Exception as e:
+            run["error"] = str(e)
+            raise BackupError(str(e)) from e
+        _prune()
+        return run
+    finally:
+        _lock.release()
+
+
+def _snapshot(db_path: str) -> dict:
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    name = f"quickfire-{datetime.now(timezone.utc):%Y%m%d-%H%M%S-%f}.sqlite.gz"
+    raw = os.path.join(BACKUP_DIR, f".{name}.partial")
+    out = os.path.join(BACKUP_DIR, name)
+    t0 = time.perf_counter()
+    stats = {"steps": 0, "restarts": 0, "pages": 0}
+    left = float("inf")
+
+    def progress(status, remaining, total):
+        nonlocal left
+        stats["steps"] += 1
+        stats["pages"] = total
+        if remaining > left:
+            raise _Restarted()   # the source changed under us; SQLite started over
+        left = remaining
+        if remaining and STEP_SLEEP_MS > 0:
+            time.sleep(STEP_SLEEP_MS / 1000.0)
+
+    try:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(raw)
+        try:
+            step = PAGES_PER_STEP
+            while True:
+                left = float("inf")
+                try:
+                    src.backup(dst, pages=step if stats["restarts"] < MAX_RESTARTS else -1, progress=progress)
+                    break
+                except _Restarted:
+                    stats["restarts"] += 1
+                    step *= 4
+            t1 = time.perf_counter()
+            check = [r[0] for r in dst.execute("PRAGMA integrity_check")]
+            t2 = time.perf_counter()
+        finally:
+            dst.close()
+            src.close()
+        if check != ["ok"]:
+            raise BackupError("integrity_check failed: " + "; ".join(check[:5]))
+        with open(raw, "rb") as fin, gzip.open(out + ".tmp", "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        os.replace(out + ".tmp", out)
+        t3 = time.perf_counter()
+        db_bytes = os.path.getsize(raw)
+    finally:
+        for leftover in (raw, out + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {
+        "name": name, **stats,
+        "db_bytes": db_bytes, "gz_bytes": os.path.getsize(out),
+        "copy_ms": round((t1 - t0) * 1000, 1), "verify_ms": round((t2 - t1) * 1000, 1),
+        "compress_ms": round((t3 - t2) * 1000, 1), "duration_ms": round((t3 - t0) * 1000, 1),
+    }
+
+
+def _prune() -> None:
+    names = sorted(n for n in os.listdir(BACKUP_DIR) if _NAME_RE.match(n))
+    for old in names[:-KEEP] if KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(BACKUP_DIR, old))
+        except OSError:
+            pass
+
+
+def list_backups() -> List[dict]:
+    """Newest first: {name, taken_at (UTC datetime), bytes}."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    out = []
+    for n in os.listdir(BACKUP_DIR):
+        m = _NAME_RE.match(n)
+        if m:
+            out.append({"name": n, "bytes": os.path.getsize(os.path.join(BACKUP_DIR, n)),
+                        "taken_at": datetime.strptime(m.group(1), "%Y%m%d-%H%M%S-%f").replace(tzinfo=timezone.utc)})
+    return sorted(out, key=lambda b: b["name"], reverse=True)
+
+
+def backup_path(name: str) -> Optional[str]:
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.join(BACKUP_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def recent_runs() -> List[dict]:
+    return list(_runs)
+
+
+class BackupScheduler:
+    """Daemon thread that takes a snapshot once the newest one is ``INTERVAL_HOURS`` old."""
+
+    def __init__(self, interval_hours: float = INTERVAL_HOURS):
+        self.interval = interval_hours * 3600.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="qf-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _due_in(self) -> float:
+        """Seconds until the next snapshot; with none yet, one interval after boot."""
+        newest = list_backups()[:1]
+        last = newest[0]["taken_at"].timestamp() if newest else time.time()
+        return max(0.0, last + self.interval - time.time())
+
+    def _loop(self) -> None:
+        while True:
+            if self._stop.wait(self._due_in()):
+                return
+            try:
+                run_backup()
+            except BackupError:
+                self._stop.wait(60)   # already running, or failed (see recent_runs)
+
+
+scheduler = BackupScheduler()
@@ -0,0 +1,238 @@
+"""Bulk import of the NDJSON export (``/admin/export/all``).
+
+Reads line by line and inserts with ``executemany`` in batches of
+``batch_size``, committing every ``commit_every`` batches so a running app
+can still write between them. SQLite allocates every id; the old → new id
+map for users and results lives in a temp table, and children are remapped
+through it. A failed load deletes exactly the rows it inserted.
+
+``drop_indexes`` (CLI ``--drop-indexes``) drops the secondary indexes for the
+load and recreates them afterwards; only use it with the app stopped.
+``remap=False`` keeps ids, to restore into an empty database.
+
+CLI::
+
+    python -m app.utils.bulk_import export.ndjson.gz [--batch 5000] [--commit-every 20] [--no-remap] [--drop-indexes]
+"""
+import argparse
+import base64
+import gzip
+from datetime import datetime
+from typing import IO, Dict, Iterable, List, Optional
+import orjson
+from sqlalchemy import DateTime, LargeBinary
+from sqlalchemy.engine import Connection
+from ..storage import engine
+from ..models import User, UserProgress, DrillResult, DrillQuestion, DrillAward
+from .fragment_cache import fragments
+from .progress import preset_cache
+from .activity import rebuild_activity
+from .latency import rebuild_latency
+from .user_directory import backfill_last_active
+
+BATCH_SIZE = 5000
+COMMIT_EVERY = 20   # batches per transaction
+
+TABLES = {
+    "users": User.__table__,
+    "progress": UserProgress.__table__,
+    "results": DrillResult.__table__,
+    "questions": DrillQuestion.__table__,
+    "awards": DrillAward.__table__,
+}
+
+# FK column and parent table, remapped through the id map when ``remap`` is on.
+_PARENT = {"progress": ("user_id", "users"), "results": ("user_id", "users"),
+           "questions": ("drill_result_id", "results"), "awards": ("drill_result_id", "results")}
+_LOOKUP_CHUNK = 500
+
+
+def open_maybe_gzip(fp: IO[bytes]) -> IO[bytes]:
+    head = fp.peek(2)[:2] if hasattr(fp, "peek") else fp.read(2)
+    if not hasattr(fp, "peek"):
+        fp.seek(0)
+    return gzip.GzipFile(fileobj=fp, mode="rb") if head == b"\x1f\x8b" else fp
+
+
+def _dt_columns(table) -> List[str]:
+    return [c.name for c in table.columns if isinstance(c.type, DateTime)]
+
+
+def _blob_columns(table) -> List[str]:
+    return [c.name for c in table.columns if isinstance(c.type, LargeBinary)]
+
+
+class _Loader:
+    def __init__(self, conn: Connection, batch_size: int, commit_every: int, remap: bool):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.remap = remap
+        self.pending: Dict[str, List[dict]] = {name: [] for name in TABLES}
+        self.old_ids: Dict[str, List[Optional[int]]] = {name: [] for name in TABLES}
+        self.dt_cols = {name: _dt_columns(t) for name, t in TABLES.items()}
+        self.blob_cols = {name: _blob_columns(t) for name, t in TABLES.items()}
+        self.counts: Dict[str, int] = {name: 0 for name in TABLES}
+        self.batches = 0
+        # Every row this import inserted: (table, old id, new id). Committed with the rows.
+        conn.exec_driver_sql("DROP TABLE IF EXISTS temp.import_ids")
+        conn.exec_driver_sql("CREATE TEMP TABLE import_ids (tbl TEXT NOT NULL, old INTEGER, new INTEGER NOT NULL)")
+        conn.exec_driver_sql("CREATE INDEX temp.import_ids_old ON import_ids (tbl, old)")
+        conn.commit()
+
+    def add(self, name: str, rec: dict) -> None:
+        for col in self.dt_cols[name]:
+            v = rec.get(col)
+            if isinstance(v, str):
+                rec[col] = datetime.fromisoformat(v)
+        for col in self.blob_cols[name]:
+            v = rec.get(col)
+            if isinstance(v, str):
+                rec[col] = base64.b64decode(v)
+        self.old_ids[name].append(rec.pop("id", None) if self.remap else rec.get("id"))
+        buf = self.pending[name]
+        buf.append(rec)
+        if len(buf) >= self.batch_size:
+            self.flush()
+
+    def _new_ids(self, name: str, old: Iterable[int]) -> Dict[int, int]:
+        old = sorted(set(old))
+        found: Dict[int, int] = {}
+        for k in range(0, len(old), _LOOKUP_CHUNK):
+            part = old[k:k + _LOOKUP_CHUNK]
+            found.update(self.conn.exec_driver_sql(
+                f"SELECT old, new FROM temp.import_ids WHERE tbl = ? AND old IN ({', '.join('?' * len(part))})",
+                (name, *part)).all())
+        missing = [o for o in old if o not in found]
+        if missing:
+            raise ValueError(f"{name} id {missing[0]} is referenced but was not imported before")
+        return found
+
+    def flush(self) -> None:
+        # Parents first, so children can be remapped and each commit leaves no dangling FKs.
+        for n in TABLES:
+            rows = self.pending[n]
+            if not rows:
+                continue
+            if self.remap and n in _PARENT:
+                col, parent = _PARENT[n]
+                ids = self._new_ids(parent, (r[col] for r in rows))
+                for r in rows:
+                    r[col] = ids[r[col]]
+            table = TABLES[n]
+            new = self.conn.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                                    rows).scalars().all()
+            self.conn.exec_driver_sql("INSERT INTO temp.import_ids (tbl, old, new) VALUES (?, ?, ?)",
+                                      [(n, old, nid) for old, nid in zip(self.old_ids[n], new)])
+            self.counts[n] += len(rows)
+            self.pending[n], self.old_ids[n] = [], []
+            self.batches += 1
+            if self.batches % self.commit_every == 0:
+                self.conn.commit()
+
+    def user_ids(self) -> List[int]:
+        return [r[0] for r in self.conn.exec_driver_sql("SELECT new FROM temp.import_ids WHERE tbl = 'users'")]
+
+    def discard(self) -> None:
+        """Delete the rows this import committed so far (children first)."""
+        self.conn.rollback()
+        for name in reversed(TABLES):
+            self.conn.exec_driver_sql(
+                f'DELETE FROM "{TABLES[name].name}" WHERE id IN (SELECT new FROM temp.import_ids WHERE tbl = ?)',
+                (name,))
+        self.conn.commit()
+        self.close()
+
+    def close(self) -> None:
+        self.conn.exec_driver_sql("DROP TABLE IF EXISTS temp.import_ids")
+        self.conn.commit()
+
+
+def _iter_records(lines: Iterable[bytes], default_table: Optional[str]):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        rec = orjson.loads(line)
+        name = rec.pop("_table", None) or default_table
+        if name not in TABLES:
+            raise ValueError(f"unknown table for record: {name!r}")
+        yield name, rec
+
+
+def _drop_indexes(conn: Connection) -> List[str]:
+    names = ", ".join(f"'{t.name}'" for t in TABLES.values())
+    rows = conn.exec_driver_sql(
+        f"SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL AND tbl_name IN ({names})"
+    ).all()
+    for idx, _ in rows:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{idx}"')
+    return [sql for _, sql in rows]
+
+
+def rebuild_derived(conn: Connection, user_ids: Iterable[int]) -> None:
+    """Recompute data derived from imported history, then refresh planner stats."""
+    rebuild_activity(conn, user_ids)
+    rebuild_latency(conn, user_ids)
+    backfill_last_active(conn)
+    conn.exec_driver_sql("ANALYZE")
+
+
+def import_ndjson(fp: IO[bytes], batch_size: int = BATCH_SIZE, commit_every: int = COMMIT_EVERY,
+                  remap: bool = True, default_table: Optional[str] = None,
+                  drop_indexes: bool = False) -> Dict[str, int]:
+    """Load an export stream; returns inserted row counts per table. On error
+    the rows already inserted are deleted again and the error re-raised."""
+    fp = open_maybe_gzip(fp)
+    with engine.connect() as conn:
+        sync = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        conn.commit()
+        index_sql: List[str] = []
+        loader = _Loader(conn, batch_size, commit_every, remap)
+        try:
+            if drop_indexes:
+                index_sql = _drop_indexes(conn)
+            for name, rec in _iter_records(fp, default_table):
+                loader.add(name, rec)
+            loader.flush()
+            conn.commit()
+        except BaseException:
+            loader.discard()
+            raise
+        finally:
+            conn.rollback()
+            for sql in index_sql:
+                conn.exec_driver_sql(sql)
+            conn.commit()
+            conn.exec_driver_sql(f"PRAGMA synchronous={int(sync)}")
+        try:
+            rebuild_derived(conn, loader.user_ids())
+            conn.commit()
+        finally:
+            loader.close()
+    fragments.clear()
+    preset_cache.clear()
+    return loader.counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Import a Quickfire Math NDJSON export.")
+    ap.add_argument("path")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE, help="rows per executemany")
+    ap.add_argument("--commit-every", type=int, default=COMMIT_EVERY, help="batches per transaction")
+    ap.add_argument("--no-remap", action="store_true", help="keep ids (restore into an empty DB)")
+    ap.add_argument("--table", choices=sorted(TABLES), help="table for untagged single-dataset files")
+    ap.add_argument("--drop-indexes", action="store_true",
+                    help="drop secondary indexes during the load (faster); only with the app stopped")
+    args = ap.parse_args(argv)
+    from ..storage import init_db
+    init_db()
+    with open(args.path, "rb") as raw:
+        counts = import_ndjson(raw, args.batch, args.commit_every, remap=not args.no_remap,
+                               default_table=args.table, drop_indexes=args.drop_indexes)
+    print("[Quickfire] Imported " + ", ".join(f"{n}={c}" for n, c in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
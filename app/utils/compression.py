@@ -0,0 +1,120 @@
+"""Response compression (brotli when available, gzip otherwise)."""
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+# SSE must flush event by event; gzip downloads are already compressed.
+_SKIP_TYPES = ("text/event-stream", "application/gzip")
+
+
+def _accepted(accept: str) -> dict:
+    """Accept-Encoding as {coding: q}; a coding listed with q=0 is refused."""
+    out = {}
+    for part in accept.lower().split(","):
+        coding, *params = (p.strip() for p in part.split(";"))
+        if not coding:
+            continue
+        q = 1.0
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        out[coding] = q
+    return out
+
+
+def _pick_encoding(accept: str) -> Optional[str]:
+    codings = _accepted(accept)
+    star = codings.get("*", 0.0)
+    options = [enc for enc in ("br", "gzip") if enc != "br" or brotli is not None]
+    q, enc = max(((codings.get(enc, star), enc) for enc in options), key=lambda t: t[0])
+    return enc if q > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """GZipMiddleware plus brotli; streamed chunks are flushed as they arrive."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        state = {"passthrough": False, "comp": None}
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                ctype = headers.get("content-type", "")
+                if "content-encoding" in headers or ctype.startswith(_SKIP_TYPES):
+                    state["passthrough"] = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            comp: Optional[_Compressor] = state["comp"]
+            if comp is None:
+                if not more and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                comp = state["comp"] = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                payload = comp.chunk(body) if more else comp.finish(body)
+                if not more:
+                    headers["Content-Length"] = str(len(payload))
+                await send(start)
+                await send({"type": "http.response.body", "body": payload, "more_body": more})
+                return
+            payload = comp.chunk(body) if more else comp.finish(body)
+            await send({"type": "http.response.body", "body": payload, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,19 @@
+"""Opaque keyset-pagination cursors: url-safe base64 of [kind, sort key, id]."""
+import base64
+from typing import Any, Tuple
+import orjson
+
+
+def encode_cursor(kind: str, key: Any, row_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([kind, key, row_id])).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str) -> Tuple[Any, int]:
+    """Returns (sort key, id); ValueError for malformed cursors or ones of another kind."""
+    try:
+        k, key, row_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("bad cursor")
+    if k != kind or not isinstance(row_id, int):
+        raise ValueError("bad cursor")
+    return key, row_id
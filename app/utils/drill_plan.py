@@ -0,0 +1,62 @@
+"""Seeded drill plans.
+
+A drill started at ``level`` with ``seed`` always sees the same problem list:
+``plan_problems`` runs ``generate_batch`` over the level preset. On finish the
+client sends plan indexes; ``attempts_from_qlog`` checks them against the plan
+and the drawn questions are stored packed (question_pack.py), so reading a
+finished drill never regenerates its plan.
+"""
+import secrets
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from ..levels import get_preset
+from ..logic import generate_batch
+from ..models import DrillTypeEnum
+
+PLAN_SIZE = 60   # 20 questions + room to skip repeats next to re-queued misses
+
+_WORDS = {
+    DrillTypeEnum.addition: ("+", "plus"),
+    DrillTypeEnum.subtraction: ("−", "minus"),
+    DrillTypeEnum.multiplication: ("×", "times"),
+    DrillTypeEnum.division: ("÷", "divided by"),
+}
+
+Problem = Tuple[str, int, str, int, int]  # prompt, answer, tts, a, b
+
+
+def new_seed() -> int:
+    return secrets.randbits(62)
+
+
+@lru_cache(maxsize=512)
+def plan_problems(drill_type: DrillTypeEnum, level: int, seed: int, n: int = PLAN_SIZE) -> Tuple[Problem, ...]:
+    batch = generate_batch(drill_type, get_preset(drill_type, level), n, seed=seed)
+    sym, word = _WORDS[drill_type]
+    out = []
+    for a, b, ans in zip(batch.a.tolist(), batch.b.tolist(), batch.answer.tolist()):
+        out.append((f"{a} {sym} {b}", ans, f"{a} {word} {b} equals {ans}", a, b))
+    return tuple(out)
+
+
+def attempts_from_qlog(drill_type: DrillTypeEnum, level: int, seed: int, logs: List[dict]) -> Optional[List[dict]]:
+    """Validate a client qlog against the plan; returns qlog-style attempts or None."""
+    plan = plan_problems(drill_type, level, seed)
+    out = []
+    for e in logs:
+        try:
+            idx = int(e["i"])
+            given = int(e.get("given_answer", 0))
+            started = datetime.fromisoformat(str(e.get("started_at")).replace("Z", ""))
+            elapsed = int(e.get("elapsed_ms", 0))
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not 0 <= idx < len(plan) or not -2**31 <= given < 2**31:
+            return None
+        prompt, ans, _, a, b = plan[idx]
+        out.append({
+            "prompt": prompt, "a": a, "b": b, "correct_answer": ans, "given_answer": given,
+            "correct": given == ans, "started_at": started, "elapsed_ms": elapsed,
+        })
+    return out or None
@@ -1,34 +1,57 @@
-from typing import List, Dict, Any, Set
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set
 import re
-from datetime import datetime, timedelta
+from sqlalchemy import tuple_
 from sqlmodel import select
-from ..storage import get_session
 from ..models import DrillResult, DrillAward
+from .activity import local_day_window, counts_between
+from .cursors import encode_cursor, decode_cursor
+from .read_models import DrillRow, select_drills, drill_rows
 
-def fetch_results_with_stars(uid: int, limit: int = 25) -> tuple[list[DrillResult], set[int]]:
-    with get_session() as s:
-        results: List[DrillResult] = s.exec(
-            select(DrillResult)
-            .where(DrillResult.user_id == uid)
-            .order_by(DrillResult.created_at.desc())
-            .limit(limit)
-        ).all()
-        res_ids = [r.id for r in results]
-        star_ids: Set[int] = set()
-        if res_ids:
-            rows = s.exec(
-                select(DrillAward.drill_result_id)
-                .where(DrillAward.drill_result_id.in_(res_ids))
-                .where(DrillAward.award_type == "star")
-            ).all()
-            for row in rows:
-                if isinstance(row, (list, tuple)):
-                    star_ids.add(int(row[0]))
-                else:
-                    star_ids.add(int(row))
+HISTORY_PAGE = 25
+MAX_HISTORY_PAGE = 100
+
+def fetch_history_page(s, uid: int, limit: int = HISTORY_PAGE, cursor: Optional[str] = None
+                       ) -> tuple[list[DrillRow], set[int], Optional[str]]:
+    """One page of a user's drills, newest first, plus their star ids and the next cursor.
+
+    Keyset pagination on (created_at, id): each page is an index seek from the
+    cursor, so page 50 costs the same as page 1. Raises ValueError for a bad cursor.
+    """
+    limit = max(1, min(int(limit), MAX_HISTORY_PAGE))
+    q = select_drills().where(DrillResult.user_id == uid)
+    if cursor:
+        key, rid = decode_cursor(cursor, "history")
+        try:
+            ts = datetime.fromisoformat(key)
+        except (TypeError, ValueError):
+            raise ValueError("bad cursor")
+        q = q.where(tuple_(DrillResult.created_at, DrillResult.id) < (ts, rid))
+    q = q.order_by(DrillResult.created_at.desc(), DrillResult.id.desc()).limit(limit + 1)
+    results = drill_rows(s, q)
+    nxt = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        nxt = encode_cursor("history", last.created_at.isoformat(), last.id)
+    star_ids = _star_ids(s, [r.id for r in results])
+    return results, star_ids, nxt
+
+def _star_ids(s, res_ids: List[int]) -> Set[int]:
+    if not res_ids:
+        return set()
+    rows = s.exec(
+        select(DrillAward.drill_result_id)
+        .where(DrillAward.drill_result_id.in_(res_ids))
+        .where(DrillAward.award_type == "star")
+    ).all()
+    return {int(row[0]) if isinstance(row, (list, tuple)) else int(row) for row in rows}
+
+def fetch_results_with_stars(s, uid: int, limit: int = 25) -> tuple[list[DrillRow], set[int]]:
+    results, star_ids, _ = fetch_history_page(s, uid, limit)
     return results, star_ids
 
-def build_feed_items(results: List[DrillResult], star_ids: Set[int]) -> list[dict[str, Any]]:
+def build_feed_items(results: List[DrillRow], star_ids: Set[int]) -> list[dict[str, Any]]:
     items = []
     for r in results:
         m = re.match(r"^\[L(\d+)\]\s+(.*)$", r.settings_snapshot or "")
@@ -50,22 +73,8 @@ def build_feed_items(results: List[DrillResult], star_ids: Set[int]) -> list[dic
         })
     return items
 
-def today_counts(uid: int, tz_offset_min: int) -> Dict[str, Any]:
-    local_now = datetime.utcnow() - timedelta(minutes=tz_offset_min)
-    local_start = datetime(local_now.year, local_now.month, local_now.day)
-    local_end = local_start + timedelta(days=1)
-    start_utc = local_start + timedelta(minutes=tz_offset_min)
-    end_utc = local_end + timedelta(minutes=tz_offset_min)
-
-    with get_session() as s:
-        q = s.exec(
-            select(DrillResult)
-            .where(DrillResult.user_id == uid)
-            .where(DrillResult.created_at >= start_utc)
-            .where(DrillResult.created_at < end_utc)
-        )
-        rows = q.all()
-    counts: Dict[str, Any] = {"total": len(rows), "addition": 0, "subtraction": 0, "multiplication": 0, "division": 0}
-    for r in rows:
-        counts[r.drill_type.value] += 1
+def today_counts(s, uid: int, tz_offset_min: int) -> Dict[str, Any]:
+    start_utc, end_utc = local_day_window(tz_offset_min)
+    by_type = counts_between(s, uid, start_utc, end_utc)
+    counts: Dict[str, Any] = {"total": sum(by_type.values()), **by_type}
     return counts
@@ -0,0 +1,80 @@
+"""In-process cache for rendered HTML fragments, keyed by (name, scope) and
+invalidated by ``bump(scope)``. Entries are an LRU bounded by bytes."""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+MAX_BYTES = int(os.getenv("APP_FRAGMENT_CACHE_BYTES", str(4 * 1024 * 1024)))
+MAX_SCOPES = 1024
+
+USERS_SCOPE = "users"  # the login page user grid: bumped when a user is added, renamed or deleted
+
+
+class FragmentCache:
+    def __init__(self, max_bytes: int = MAX_BYTES, max_scopes: int = MAX_SCOPES):
+        self.max_bytes = max_bytes
+        self.max_scopes = max_scopes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, str]]" = OrderedDict()
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = 0
+        self._floor = 0   # version of scopes never bumped or evicted from _versions
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, scope: str) -> int:
+        return self._versions.get(scope, self._floor)
+
+    def bump(self, *scopes: str) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._counter += 1
+                self._versions[scope] = self._counter
+                self._versions.move_to_end(scope)
+            while len(self._versions) > self.max_scopes:
+                # Forgetting a version must not revive entries tagged with it
+                self._versions.popitem(last=False)
+                self._counter += 1
+                self._floor = self._counter
+
+    def get_or_render(self, name: str, scope: str, render: Callable[[], str],
+                      max_age: Optional[float] = None) -> str:
+        """Cached HTML while the scope is unchanged (and, with ``max_age``, fresh enough)."""
+        key = (name, scope)
+        with self._lock:
+            ver = self.version(scope)
+            hit = self._entries.get(key)
+            if hit and hit[0] == ver and (max_age is None or time.monotonic() - hit[1] < max_age):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[2]
+            self.misses += 1
+        html = render()
+        with self._lock:
+            # A writer may have bumped while we rendered; don't cache stale HTML.
+            if self.version(scope) == ver:
+                self._store(key, ver, html)
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _store(self, key, ver: int, html: str) -> None:
+        old = self._entries.pop(key, None)
+        if old:
+            self._size -= len(old[2])
+        if len(html) > self.max_bytes:
+            return
+        self._entries[key] = (ver, time.monotonic(), html)
+        self._size += len(html)
+        while self._size > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+fragments = FragmentCache()
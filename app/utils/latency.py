@@ -0,0 +1,228 @@
+"""Per-(user, drill type, fact) response-time sketches (DDSketch-style log
+buckets) for the speed heatmap. Rebuild from history with
+``python -m app.utils.latency [user_id ...]``."""
+import argparse
+import math
+import struct
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+from ..models import DrillTypeEnum, FactLatency
+from .question_pack import unpack_questions
+
+ALPHA = 0.04   # relative error of returned quantiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+_LOG_GAMMA = math.log(GAMMA)
+MAX_WEIGHT = 64   # counts are halved past this, so sketches follow recent speed
+MAX_MS = 10 * 60 * 1000
+
+SKETCH_VERSION = 1
+_HEAD = struct.Struct("<BhH")   # version, first bucket index, bucket count; then <H counts
+
+
+
+class LatencySketch:
+    __slots__ = ("offset", "counts")
+
+    def __init__(self, offset: int = 0, counts: Optional[List[int]] = None):
+        self.offset = offset
+        self.counts = counts or []
+
+    @staticmethod
+    def bucket(ms: float) -> int:
+        return math.ceil(math.log(min(max(ms, 1.0), MAX_MS)) / _LOG_GAMMA)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def add(self, ms: float, weight: int = 1) -> None:
+        if self.total + weight > MAX_WEIGHT:
+            self._halve()
+        self._add_bucket(self.bucket(ms), weight)
+
+    def _add_bucket(self, i: int, weight: int) -> None:
+        if not self.counts:
+            self.offset, self.counts = i, [0]
+        elif i < self.offset:
+            self.counts[:0] = [0] * (self.offset - i)
+            self.offset = i
+        elif i >= self.offset + len(self.counts):
+            self.counts.extend([0] * (i - self.offset - len(self.counts) + 1))
+        self.counts[i - self.offset] += weight
+
+    def _halve(self) -> None:
+        # Halve the counts at or above each bucket, rounding half up, rather than each
+        # bucket alone: flooring every count drops the single-count slow tail.
+        halved, above, total = [], 0, 0
+        for c in reversed(self.counts):
+            total += c
+            kept = (total + 1) // 2
+            halved.append(kept - above)
+            above = kept
+        self.counts = halved[::-1]
+        while self.counts and not self.counts[-1]:
+            self.counts.pop()
+        lead = next((k for k, c in enumerate(self.counts) if c), len(self.counts))
+        self.offset += lead
+        del self.counts[:lead]
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        for k, c in enumerate(other.counts):
+            if c:
+                self._add_bucket(other.offset + k, c)
+        return self
+
+    def quantile(self, q: float) -> Optional[int]:
+        total = self.total
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for k, c in enumerate(self.counts):
+            seen += c
+            if seen > rank:
+                return round(2 * GAMMA ** (self.offset + k) / (GAMMA + 1))
+        return None
+
+    def to_bytes(self) -> bytes:
+        return _HEAD.pack(SKETCH_VERSION, self.offset, len(self.counts)) + struct.pack(
+            f"<{len(self.counts)}H", *(min(c, 0xFFFF) for c in self.counts))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "LatencySketch":
+        version, offset, n = _HEAD.unpack_from(blob)
+        if version != SKETCH_VERSION:
+            raise ValueError(f"unknown latency sketch version {version}")
+        return cls(offset, list(struct.unpack_from(f"<{n}H", blob, _HEAD.size)))
+
+
+def fact_axes(drill_type: DrillTypeEnum, a: int, b: int) -> Tuple[int, int]:
+    if drill_type == DrillTypeEnum.division:
+        return (a // b if b else 0), b
+    return a, b
+
+
+def _correct_times(drill_type: DrillTypeEnum, logs: Iterable[dict]) -> Dict[Tuple[int, int], List[int]]:
+    out: Dict[Tuple[int, int], List[int]] = {}
+    for e in logs:
+        try:
+            if not e.get("correct"):
+                continue
+            key = fact_axes(drill_type, int(e.get("a", 0)), int(e.get("b", 0)))
+            ms = int(e.get("elapsed_ms", 0))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        if ms > 0:
+            out.setdefault(key, []).append(ms)
+    return out
+
+
+def record_latencies(s: Session, uid: int, drill_type: DrillTypeEnum, logs: Iterable[dict],
+                     now: Optional[datetime] = None) -> None:
+    """Fold one drill's correct answers into the user's fact sketches (caller commits)."""
+    per_fact = _correct_times(drill_type, logs)
+    if not per_fact:
+        return
+    rows = {(r.x, r.y): r for r in s.exec(select(FactLatency).where(
+        FactLatency.user_id == uid, FactLatency.drill_type == drill_type,
+        tuple_(FactLatency.x, FactLatency.y).in_(list(per_fact)),
+    )).all()}
+    now = now or datetime.utcnow()
+    for (x, y), times in per_fact.items():
+        row = rows.get((x, y))
+        sk = LatencySketch.from_bytes(row.sketch) if row else LatencySketch()
+        for ms in times:
+            sk.add(ms)
+        if row is None:
+            row = FactLatency(user_id=uid, drill_type=drill_type, x=x, y=y, attempts=0, sketch=b"")
+        row.attempts += len(times)
+        row.sketch = sk.to_bytes()
+        row.updated_at = now
+        s.add(row)
+
+
+def speed_report(s: Session, uid: int, drill_type: DrillTypeEnum, lo: int, hi: int, step: int) -> dict:
+    """{labels_from, labels_to, step, grid: {x: {y: {p50, p90, n}}}}; times in ms."""
+    cells: Dict[Tuple[int, int], list] = {}
+    for x, y, attempts, blob in s.exec(
+        select(FactLatency.x, FactLatency.y, FactLatency.attempts, FactLatency.sketch)
+        .where(FactLatency.user_id == uid, FactLatency.drill_type == drill_type)
+        .where(FactLatency.x.between(lo, hi), FactLatency.y.between(lo, hi))
+    ).all():
+        key = (lo + ((x - lo) // step) * step, lo + ((y - lo) // step) * step)
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [LatencySketch.from_bytes(blob), attempts]
+        else:
+            cell[0].merge(LatencySketch.from_bytes(blob))
+            cell[1] += attempts
+    grid: Dict[int, Dict[int, dict]] = {}
+    for (bx, by), (sk, n) in cells.items():
+        grid.setdefault(bx, {})[by] = {"p50": sk.quantile(0.5), "p90": sk.quantile(0.9), "n": n}
+    last = lo + ((hi - lo) // step) * step
+    return {"labels_from": lo, "labels_to": last, "step": step, "grid": grid}
+
+
+def _rebuild_user(conn: Connection, uid: int, now: datetime) -> None:
+    conn.exec_driver_sql("DELETE FROM factlatency WHERE user_id = ?", (uid,))
+    timeline: Dict[tuple, List[tuple]] = {}
+    for dt, a, b, ms, ts in conn.exec_driver_sql(
+        "SELECT q.drill_type, q.a, q.b, q.elapsed_ms, q.started_at FROM drillquestion q "
+        "JOIN drillresult r ON r.id = q.drill_result_id "
+        "WHERE r.user_id = ? AND q.correct = 1 AND q.elapsed_ms > 0", (uid,)
+    ):
+        dt = DrillTypeEnum[dt]
+        timeline.setdefault((dt, *fact_axes(dt, a, b)), []).append((str(ts), ms))
+    for dt, packed in conn.exec_driver_sql(
+        "SELECT drill_type, packed_questions FROM drillresult WHERE user_id = ? AND packed_questions IS NOT NULL",
+        (uid,)
+    ):
+        dt = DrillTypeEnum[dt]
+        for e in unpack_questions(dt, packed):
+            if e["correct"] and e["elapsed_ms"] > 0:
+                ts = e["started_at"].isoformat(sep=" ", timespec="microseconds")
+                timeline.setdefault((dt, *fact_axes(dt, e["a"], e["b"])), []).append((ts, e["elapsed_ms"]))
+    rows = []
+    for (dt, x, y), answers in timeline.items():
+        answers.sort()
+        sk = LatencySketch()
+        for _, ms in answers:
+            sk.add(ms)
+        rows.append({"user_id": uid, "drill_type": dt, "x": x, "y": y, "attempts": len(answers),
+                     "sketch": sk.to_bytes(), "updated_at": now})
+    if rows:
+        conn.execute(FactLatency.__table__.insert(), rows)
+
+
+def rebuild_latency(conn: Connection, user_ids: Optional[Iterable[int]] = None,
+                    commit_each: bool = False) -> None:
+    """Recompute sketches from question history, one user at a time (all users, or ``user_ids``)."""
+    if user_ids is None:
+        conn.exec_driver_sql("DELETE FROM factlatency")
+        ids = [r[0] for r in conn.exec_driver_sql("SELECT DISTINCT user_id FROM drillresult ORDER BY user_id")]
+    else:
+        ids = sorted(set(int(u) for u in user_ids))
+    now = datetime.utcnow()
+    for uid in ids:
+        _rebuild_user(conn, uid, now)
+        if commit_each:
+            conn.commit()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Rebuild per-fact response-time sketches from history.")
+    ap.add_argument("user_ids", nargs="*", type=int, help="only these users (default: everyone)")
+    args = ap.parse_args(argv)
+    from ..storage import engine, init_db
+    init_db()
+    with engine.connect() as conn:
+        rebuild_latency(conn, args.user_ids or None, commit_each=True)
+        conn.commit()
+    print("[Quickfire] Rebuilt response-time sketches")
+
+
+if __name__ == "__main__":
+    main()
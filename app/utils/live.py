@@ -0,0 +1,122 @@
+"""In-process pub/sub for the admin live monitor (/admin/live, Server-Sent Events).
+
+``apply_finish`` queues one event per drill on its session; the event goes out
+only once that session commits (rolled-back or replayed drills publish
+nothing). ``publish`` encodes the SSE frame once and hands it to every
+subscriber's event loop with ``call_soon_threadsafe``, so the worker thread
+that finished the drill never waits on a browser.
+
+Each subscriber has a bounded queue; when it is full the oldest frame is
+dropped and counted, and the stream tells the browser how many it missed.
+With no subscribers, publishing is skipped before any work is done.
+"""
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set
+import orjson
+from sqlalchemy import event
+
+QUEUE_SIZE = int(os.getenv("APP_LIVE_QUEUE", "100"))
+HEARTBEAT_SEC = 15.0   # keeps proxies from closing an idle stream
+
+
+def sse(data: dict, kind: Optional[str] = None) -> bytes:
+    head = f"event: {kind}\n".encode() if kind else b""
+    return head + b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, frame: bytes) -> None:
+        """Runs on the subscriber's loop: drop-oldest when full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+class LiveBus:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subs)
+
+    def subscribe(self) -> Subscriber:
+        """Call from the loop that will read the queue."""
+        sub = Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, data: dict) -> None:
+        """Thread-safe; never blocks on subscribers."""
+        with self._lock:
+            subs = list(self._subs)
+        if not subs:
+            return
+        frame = sse(data, "drill")
+        self.published += 1
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.put, frame)
+            except RuntimeError:   # loop closed under a dead stream
+                self.unsubscribe(sub)
+
+
+async def stream(is_disconnected: Callable[[], Awaitable[bool]],
+                 heartbeat: float = HEARTBEAT_SEC) -> AsyncIterator[bytes]:
+    """SSE frames for a new subscriber until the client goes away."""
+    sub = bus.subscribe()
+    reported = 0
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                frame = await asyncio.wait_for(sub.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                frame = b": ping\n\n"
+            if await is_disconnected():
+                break
+            if sub.dropped > reported:
+                yield sse({"dropped": sub.dropped - reported}, "lag")
+                reported = sub.dropped
+            yield frame
+    finally:
+        bus.unsubscribe(sub)
+
+
+def publish_on_commit(s, data: dict) -> None:
+    """Queue ``data`` on session ``s``; it is published after ``s`` commits."""
+    pending = s.info.get("live_events")
+    if pending is None:
+        pending = s.info["live_events"] = []
+        event.listen(s, "after_commit", _flush)
+        event.listen(s, "after_rollback", _discard)
+    pending.append(data)
+
+
+def _flush(s) -> None:
+    pending, s.info["live_events"] = s.info.get("live_events") or [], []
+    for data in pending:
+        bus.publish(data)
+
+
+def _discard(s) -> None:
+    s.info["live_events"] = []
+
+
+bus = LiveBus()
@@ -0,0 +1,166 @@
+"""Sampling profiler for admin requests sent with ``X-Profile: 1`` (or the
+``qf_profile`` cookie); keeps the last ``KEEP`` as speedscope JSON files."""
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from ..storage import DB_PATH
+from .session import is_admin
+
+PROFILE_DIR = os.getenv("APP_PROFILE_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "profiles"))
+KEEP = int(os.getenv("APP_PROFILE_KEEP", "50"))
+INTERVAL_MS = float(os.getenv("APP_PROFILE_INTERVAL_MS", "2"))
+MAX_SAMPLES = int(os.getenv("APP_PROFILE_MAX_SAMPLES", "20000"))
+COOKIE = "qf_profile"
+# Never profiled: the profile pages themselves, static files and streaming responses.
+_SKIP = ("/admin/profiles", "/static", "/admin/live", "/admin/export")
+
+# Leaf frames of threads that are parked, not working.
+_IDLE = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"),
+         ("thread.py", "_worker"), ("_base.py", "wait"), ("base_events.py", "_run_once")}
+_NAME_RE = re.compile(r"^(\d+)_(\d+)_([A-Z]+)_(.+)\.speedscope\.json$")
+
+
+class Sampler:
+    def __init__(self, interval_ms: float = INTERVAL_MS, max_samples: int = MAX_SAMPLES):
+        self.interval = interval_ms / 1000.0
+        self.max_samples = max_samples
+        self.frames: Dict[tuple, int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qf-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.t0 = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        fid = self.frames.get(key)
+        if fid is None:
+            fid = self.frames[key] = len(self.frames)
+        return fid
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval) and len(self.samples) < self.max_samples:
+            now = time.perf_counter()
+            weight = (now - last) * 1000.0
+            last = now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()   # speedscope wants root first
+                self.samples.append(stack)
+                self.weights.append(weight)
+
+    def speedscope(self, name: str, duration_ms: float) -> dict:
+        frames = [{"name": n, "file": f, "line": ln} for (n, f, ln) in self.frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "milliseconds",
+                "startValue": 0, "endValue": round(duration_ms, 3),
+                "samples": self.samples, "weights": [round(w, 3) for w in self.weights],
+            }],
+            "name": name,
+            "exporter": "quickfire-math",
+        }
+
+
+def wants_profile(scope) -> bool:
+    # Cheap byte scan first; almost no request carries either marker.
+    raw = [v for k, v in scope.get("headers", ()) if k == b"x-profile" or (k == b"cookie" and COOKIE.encode() in v)]
+    if not raw:
+        return False
+    req = Request(scope)
+    flagged = req.headers.get("x-profile") == "1" or req.cookies.get(COOKIE) == "1"
+    return flagged and is_admin(req) and not req.url.path.startswith(_SKIP)
+
+
+def save(ts_ms: int, method: str, path: str, sampler: Sampler, duration_ms: float) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{ts_ms}_{int(duration_ms)}_{method}_{quote(path[:120], safe='')}.speedscope.json"
+    with open(os.path.join(PROFILE_DIR, name), "wb") as f:
+        f.write(orjson.dumps(sampler.speedscope(f"{method} {path}", duration_ms)))
+    _prune()
+    return name
+
+
+def _prune() -> None:
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if _NAME_RE.match(n))
+    for old in names[:-KEEP] if KEEP > 0 else names:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[dict]:
+    """Newest first: {name, ts (epoch ms), duration_ms, method, route}."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for n in os.listdir(PROFILE_DIR):
+        m = _NAME_RE.match(n)
+        if m:
+            out.append({"name": n, "ts": int(m.group(1)), "duration_ms": int(m.group(2)),
+                        "method": m.group(3), "route": unquote(m.group(4))})
+    return sorted(out, key=lambda p: p["ts"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path for a listed file name, or for the id sent in ``X-Profile-Id``."""
+    if name.isdigit():
+        name = next((p["name"] for p in list_profiles() if str(p["ts"]) == name), "")
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfileMiddleware:
+    """Profiles admin requests that ask for it; adds ``X-Profile-Id`` to the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        sampler = Sampler()
+        ts = int(time.time() * 1000)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(ts).encode())]
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration = sampler.stop()
+            await run_in_threadpool(save, ts, scope["method"], scope["path"], sampler, duration)
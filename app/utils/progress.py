@@ -1,52 +1,106 @@
-from typing import Dict
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from sqlmodel import select
-from ..storage import get_session
 from ..models import DrillTypeEnum, UserProgress
 from ..levels import thresholds_for_level, clamp_level, level_label, get_preset
 from .stars import need_hint_text
 
-def ensure_progress_rows(uid: int) -> None:
-    with get_session() as s:
-        for dt in DrillTypeEnum:
-            prog = s.exec(select(UserProgress).where(
-                UserProgress.user_id == uid, UserProgress.drill_type == dt
-            )).first()
-            if not prog:
-                _, _, _, _, TMAX = thresholds_for_level(1)
-                s.add(UserProgress(user_id=uid, drill_type=dt, level=1, target_time_sec=TMAX))
-        s.commit()
-
-def level_info(uid: int, dt: DrillTypeEnum) -> tuple[int, str, dict]:
-    ensure_progress_rows(uid)
-    with get_session() as s:
-        prog = s.exec(select(UserProgress).where(
-            UserProgress.user_id == uid, UserProgress.drill_type == dt
-        )).first()
-    lvl = clamp_level(dt, prog.level if prog else 1)
+MAX_PRESETS = 10_000
+
+def ensure_progress_rows(s, uid: int) -> None:
+    """Add any missing progress rows (flushed; the caller's session commits)."""
+    have = set(s.exec(select(UserProgress.drill_type).where(UserProgress.user_id == uid)).all())
+    missing = [dt for dt in DrillTypeEnum if dt not in have]
+    if not missing:
+        return
+    _, _, _, _, TMAX = thresholds_for_level(1)
+    for dt in missing:
+        s.add(UserProgress(user_id=uid, drill_type=dt, level=1, target_time_sec=TMAX))
+    s.flush()
+
+def level_info(s, uid: int, dt: DrillTypeEnum) -> tuple[int, str, dict]:
+    level = s.exec(select(UserProgress.level).where(
+        UserProgress.user_id == uid, UserProgress.drill_type == dt
+    )).first()
+    if level is None:
+        ensure_progress_rows(s, uid)
+    lvl = clamp_level(dt, level or 1)
     return lvl, level_label(dt, lvl), get_preset(dt, lvl)
 
-def progress_payload(uid: int) -> Dict[str, dict]:
-    ensure_progress_rows(uid)
+def progress_payload(s, uid: int) -> Dict[str, dict]:
     out: Dict[str, dict] = {}
-    with get_session() as s:
-        for dt in DrillTypeEnum:
-            prog = s.exec(select(UserProgress).where(
-                UserProgress.user_id == uid, UserProgress.drill_type == dt
-            )).first()
-            if not prog:
-                out[dt.value] = {
-                    "level": 1, "label": level_label(dt, 1),
-                    "last5": "", "ready_if_star": False,
-                    "need_msg": "Get 3 of your last 5 stars to level up"
-                }
-            else:
-                sr = (prog.stars_recent or "")[-5:]
-                out[dt.value] = {
-                    "level": prog.level,
-                    "label": level_label(dt, prog.level),
-                    "last5": sr,
-                    "ready_if_star": False,
-                    # On dashboard, do not include a hypothetical current drill
-                    "need_msg": need_hint_text(sr, None),
-                }
+    rows = {dt: (level, stars) for dt, level, stars in s.exec(
+        select(UserProgress.drill_type, UserProgress.level, UserProgress.stars_recent)
+        .where(UserProgress.user_id == uid)
+    ).all()}
+    if len(rows) < len(DrillTypeEnum):
+        ensure_progress_rows(s, uid)
+    for dt in DrillTypeEnum:
+        prog = rows.get(dt)
+        if not prog:
+            out[dt.value] = {
+                "level": 1, "label": level_label(dt, 1),
+                "last5": "", "ready_if_star": False,
+                "need_msg": "Get 3 of your last 5 stars to level up"
+            }
+        else:
+            level, stars = prog
+            sr = (stars or "")[-5:]
+            out[dt.value] = {
+                "level": level,
+                "label": level_label(dt, level),
+                "last5": sr,
+                "ready_if_star": False,
+                # On dashboard, do not include a hypothetical current drill
+                "need_msg": need_hint_text(sr, None),
+            }
     return out
+
+
+class PresetCache:
+    """(uid, drill type) -> preset of the user's current level, for GET /next.
+
+    finish_drill and user deletion call ``invalidate(uid)``, so a level-up is
+    never served stale. ``load`` only stores if no invalidation happened
+    during its database read.
+    """
+
+    def __init__(self, max_keys: int = MAX_PRESETS):
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[Tuple[int, DrillTypeEnum], dict]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, uid: int, dt: DrillTypeEnum) -> Optional[dict]:
+        with self._lock:
+            hit = self._entries.get((uid, dt))
+            if hit is not None:
+                self._entries.move_to_end((uid, dt))
+            return hit
+
+    def load(self, s, uid: int, dt: DrillTypeEnum) -> dict:
+        gen = self._generation
+        _, _, preset = level_info(s, uid, dt)
+        with self._lock:
+            if gen != self._generation:
+                return preset
+            self._entries[(uid, dt)] = preset
+            self._entries.move_to_end((uid, dt))
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        return preset
+
+    def invalidate(self, uid: int) -> None:
+        with self._lock:
+            self._generation += 1
+            for dt in DrillTypeEnum:
+                self._entries.pop((uid, dt), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+preset_cache = PresetCache()
@@ -0,0 +1,199 @@
+"""Monte Carlo simulator for level progression.
+
+Runs synthetic learners through the real ``LEVELS`` presets and the real
+progression rules (``thresholds_for_level``, ``star_decision``,
+``levelup_decision``, ``next_level`` / ``next_target_sec``) and reports how
+many drills each level takes. Per drill step, problems for every learner at a
+level are drawn with one ``generate_batch`` call and answers/times are
+sampled as (learners × questions) arrays; only the per-learner rule calls are
+scalar. Learners are split into chunks that run on a process pool.
+
+Learner model (all knobs on ``SimConfig``):
+
+- first-try correctness: ``sigmoid(skill + learn_rate * drills_at_level - difficulty * h)``,
+  with ``skill ~ N(skill_mean, skill_sd)`` per learner and ``h`` a per-problem
+  hardness (operand digits, plus carries/borrows);
+- seconds per answer: ``speed * (1 + h) / (1 + speedup * drills_at_level)``
+  with log-normal noise, ``speed ~ LogNormal(log(speed_mean), speed_sd)``;
+  every miss costs one more answer (misses are re-queued in the drill).
+
+CLI::
+
+    python -m app.utils.progression_sim [--learners 2000] [--types addition,multiplication] [--workers 4] [--json]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, List, Optional
+import numpy as np
+import orjson
+from ..levels import get_preset, thresholds_for_level, next_level, next_target_sec, level_label, TARGET_FACTOR
+from ..logic import generate_batch, star_decision, levelup_decision
+from ..models import DrillTypeEnum
+
+CHUNK = 250   # learners per pool task
+
+
+@dataclass(frozen=True)
+class SimConfig:
+    learners: int = 1000
+    question_count: int = 20
+    max_drills: int = 300         # per learner and drill type; unfinished levels are reported as censored
+    skill_mean: float = 3.0
+    skill_sd: float = 1.0
+    learn_rate: float = 0.15
+    difficulty: float = 1.0
+    speed_mean: float = 4.0       # seconds per answer on a 1-digit problem, first drill at a level
+    speed_sd: float = 0.35
+    speed_noise: float = 0.3
+    speedup: float = 0.05
+    target_factor: float = TARGET_FACTOR
+    # UserProgress has no target_time_sec column, so finish_drill's 1.5× target is
+    # dropped and every level is gated at TMAX; True simulates the rule as intended.
+    best_time_target: bool = False
+    seed: int = 0
+
+
+def hardness(drill_type: DrillTypeEnum, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Rough per-problem difficulty: digits of the larger operand, +0.5 for a carry/borrow."""
+    big = np.maximum(np.abs(a), np.abs(b))
+    h = np.log10(big + 1.0)
+    if drill_type == DrillTypeEnum.addition:
+        h = h + 0.5 * ((a % 10) + (b % 10) >= 10)
+    elif drill_type == DrillTypeEnum.subtraction:
+        h = h + 0.5 * ((a % 10) < (b % 10))
+    return h
+
+
+def _simulate(drill_type: DrillTypeEnum, cfg: SimConfig, n: int, seed_seq: np.random.SeedSequence) -> Dict[int, List[int]]:
+    """Simulate ``n`` learners; returns {level: [drills to level up, negative if censored]}."""
+    rng = np.random.default_rng(seed_seq)
+    q = cfg.question_count
+    skill = rng.normal(cfg.skill_mean, cfg.skill_sd, n)
+    speed = np.exp(rng.normal(np.log(cfg.speed_mean), cfg.speed_sd, n))
+    level = np.ones(n, dtype=int)
+    at_level = np.zeros(n, dtype=int)
+    target = np.full(n, float(thresholds_for_level(1)[4]))
+    best_ms = np.full(n, np.inf)
+    stars = [""] * n
+    active = np.ones(n, dtype=bool)
+    out: Dict[int, List[int]] = {}
+
+    for _ in range(cfg.max_drills):
+        idx_all = np.flatnonzero(active)
+        if idx_all.size == 0:
+            break
+        for lv in np.unique(level[idx_all]).tolist():
+            idx = idx_all[level[idx_all] == lv]
+            k = idx.size
+            batch = generate_batch(drill_type, get_preset(drill_type, lv), k * q,
+                                   seed=int(rng.integers(2**63)), avoid_repeats=False)
+            h = hardness(drill_type, batch.a, batch.b).reshape(k, q)
+            m = at_level[idx][:, None]
+            p = 1.0 / (1.0 + np.exp(-(skill[idx][:, None] + cfg.learn_rate * m - cfg.difficulty * h)))
+            correct = rng.random((k, q)) < p
+            per_q = (speed[idx][:, None] * (1.0 + h) / (1.0 + cfg.speedup * m)
+                     * np.exp(rng.normal(0.0, cfg.speed_noise, (k, q))))
+            elapsed = (per_q * np.where(correct, 1.0, 2.0)).sum(axis=1) * 1000.0
+            acc = correct.mean(axis=1)
+
+            for j, i in enumerate(idx.tolist()):
+                at_level[i] += 1
+                ms = int(elapsed[j])
+                star, _ = star_decision({"items": q, "acc": float(acc[j])}, ms, float(target[i]))
+                best_ms[i] = min(best_ms[i], ms)
+                up = levelup_decision(stars[i], star)
+                stars[i] = (stars[i] + ("1" if star else "0"))[-6:]
+                if not up:
+                    continue
+                out.setdefault(lv, []).append(int(at_level[i]))
+                nxt = next_level(drill_type, lv)
+                if nxt == lv:
+                    active[i] = False
+                    continue
+                target[i] = (next_target_sec(nxt, best_ms[i] / 1000.0, cfg.target_factor)
+                             if cfg.best_time_target else thresholds_for_level(nxt)[4])
+                level[i], at_level[i], best_ms[i], stars[i] = nxt, 0, np.inf, ""
+
+    for i in np.flatnonzero(active).tolist():
+        out.setdefault(int(level[i]), []).append(-int(at_level[i]))
+    return out
+
+
+def _run_chunk(args) -> Dict[int, List[int]]:
+    dt_name, cfg_dict, n, seed_seq = args
+    return _simulate(DrillTypeEnum[dt_name], SimConfig(**cfg_dict), n, seed_seq)
+
+
+def _summarise(drill_type: DrillTypeEnum, per_level: Dict[int, List[int]]) -> List[dict]:
+    rows = []
+    for lv in sorted(per_level):
+        vals = np.asarray(per_level[lv])
+        done = vals[vals > 0]
+        row = {"level": lv, "label": level_label(drill_type, lv), "learners": int(vals.size),
+               "censored": int((vals <= 0).sum())}
+        if done.size:
+            p10, p50, p90 = np.percentile(done, [10, 50, 90]).tolist()
+            row.update(mean=round(float(done.mean()), 2), p10=p10, p50=p50, p90=p90, max=int(done.max()))
+        rows.append(row)
+    return rows
+
+
+def run(cfg: SimConfig = SimConfig(), drill_types: Optional[List[DrillTypeEnum]] = None,
+        workers: Optional[int] = None) -> Dict[str, List[dict]]:
+    """Simulate ``cfg.learners`` per drill type; returns {drill_type: [per-level summary rows]}.
+
+    ``workers=1`` runs inline; otherwise chunks of ``CHUNK`` learners go to a process pool.
+    """
+    drill_types = drill_types or list(DrillTypeEnum)
+    root = np.random.SeedSequence(cfg.seed)
+    tasks = []
+    for dt, ss in zip(drill_types, root.spawn(len(drill_types))):
+        sizes = [min(CHUNK, cfg.learners - off) for off in range(0, cfg.learners, CHUNK)]
+        for size, child in zip(sizes, ss.spawn(len(sizes))):
+            tasks.append((dt.name, asdict(cfg), size, child))
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1:
+        results = [_run_chunk(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    merged: Dict[str, Dict[int, List[int]]] = {dt.value: {} for dt in drill_types}
+    for (dt_name, _, _, _), res in zip(tasks, results):
+        tgt = merged[DrillTypeEnum[dt_name].value]
+        for lv, vals in res.items():
+            tgt.setdefault(lv, []).extend(vals)
+    return {dt.value: _summarise(dt, merged[dt.value]) for dt in drill_types}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Simulate level progression for synthetic learners.")
+    ap.add_argument("--types", default="", help="comma-separated drill types (default: all)")
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    ap.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    defaults = SimConfig()
+    for name, val in asdict(defaults).items():
+        if isinstance(val, bool):
+            ap.add_argument("--" + name.replace("_", "-"), action="store_true")
+        else:
+            ap.add_argument("--" + name.replace("_", "-"), type=type(val), default=val)
+    args = ap.parse_args(argv)
+    cfg = replace(defaults, **{k: getattr(args, k) for k in asdict(defaults)})
+    types = [DrillTypeEnum(t) for t in args.types.split(",") if t] or None
+    report = run(cfg, types, args.workers)
+    if args.json:
+        print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+        return
+    for dt, rows in report.items():
+        print(f"\n{dt}")
+        print(f"{'lvl':>4} {'p10':>6} {'p50':>6} {'p90':>6} {'mean':>7} {'cens':>5}  label")
+        for r in rows:
+            if "p50" in r:
+                print(f"{r['level']:>4} {r['p10']:>6.1f} {r['p50']:>6.1f} {r['p90']:>6.1f} {r['mean']:>7.2f} {r['censored']:>5}  {r['label']}")
+            else:
+                print(f"{r['level']:>4} {'-':>6} {'-':>6} {'-':>6} {'-':>7} {r['censored']:>5}  {r['label']}")
+
+
+if __name__ == "__main__":
+    main()
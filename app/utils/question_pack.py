@@ -0,0 +1,163 @@
+"""Packed per-drill question storage.
+
+Finished seeded drills, and unseeded ones with ``APP_PACK_QUESTIONS=1``, keep
+their attempts in one blob on ``DrillResult.packed_questions`` instead of one
+DrillQuestion row each. The layout is columnar and zlib-compressed:
+
+    header  <BBIQ  format version, flags, attempt count, first start (epoch µs, UTC)
+    body    <q a, b, correct answer, given answer, start offset µs   (one column each)
+            <i elapsed ms, <B correct
+            prompts (only if FLAG_PROMPTS): <H byte lengths, then UTF-8 text
+
+Prompts are left out when every prompt is the canonical ``"a × b"`` form, and
+rebuilt on read. Nothing is lost against a DrillQuestion row apart from its id.
+
+The export, the report and the latency rebuild decode blobs only when they
+read the drill, and handle both storage forms, so the flag can be switched
+either way at any time and history needs no migration. ``pack_history``
+moves existing DrillQuestion rows into packed blobs; it rewrites the whole
+history, so it only runs from the CLI (one short transaction per batch)::
+
+    python -m app.utils.question_pack [--batch 500] [--vacuum]
+"""
+import argparse
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy.engine import Connection
+from ..models import DrillTypeEnum
+from .drill_plan import _WORDS
+
+PACK_QUESTIONS = os.getenv("APP_PACK_QUESTIONS", "0") == "1"
+PACK_BATCH = 500   # results per migration transaction
+
+PACK_VERSION = 1
+FLAG_ZLIB = 1
+FLAG_PROMPTS = 2
+
+_HEAD = struct.Struct("<BBIQ")
+_EPOCH = datetime(1970, 1, 1)
+_I32 = 2**31 - 1
+
+
+def _us(ts: datetime) -> int:
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+
+def _prompt(drill_type: DrillTypeEnum, a: int, b: int) -> str:
+    return f"{a} {_WORDS[drill_type][0]} {b}"
+
+
+def pack_questions(drill_type: DrillTypeEnum, questions: Sequence[dict]) -> bytes:
+    """questions: dicts with DrillQuestion's fields (a, b, prompt, correct_answer,
+    given_answer, correct, started_at, elapsed_ms), in answer order."""
+    n = len(questions)
+    start = min(q["started_at"] for q in questions) if n else _EPOCH
+    cols = [struct.pack(f"<{n}q", *(int(q[k]) for q in questions))
+            for k in ("a", "b", "correct_answer", "given_answer")]
+    cols.append(struct.pack(f"<{n}q", *(_us(q["started_at"]) - _us(start) for q in questions)))
+    cols.append(struct.pack(f"<{n}i", *(max(-_I32, min(int(q["elapsed_ms"]), _I32)) for q in questions)))
+    cols.append(bytes(1 if q["correct"] else 0 for q in questions))
+    flags = FLAG_ZLIB
+    if any(q["prompt"] != _prompt(drill_type, q["a"], q["b"]) for q in questions):
+        flags |= FLAG_PROMPTS
+        texts = [q["prompt"].encode()[:0xFFFF] for q in questions]
+        cols.append(struct.pack(f"<{n}H", *(len(t) for t in texts)))
+        cols.extend(texts)
+    return _HEAD.pack(PACK_VERSION, flags, n, max(0, _us(start))) + zlib.compress(b"".join(cols), 6)
+
+
+def unpack_questions(drill_type: DrillTypeEnum, blob: bytes) -> List[dict]:
+    """Attempts as qlog-style dicts (same keys as DrillQuestion), in answer order."""
+    version, flags, n, start_us = _HEAD.unpack_from(blob)
+    if version != PACK_VERSION:
+        raise ValueError(f"unknown question pack version {version}")
+    body = blob[_HEAD.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    q64 = struct.Struct(f"<{n}q")
+    a, b, answer, given, offset = (q64.unpack_from(body, k * q64.size) for k in range(5))
+    pos = 5 * q64.size
+    elapsed = struct.unpack_from(f"<{n}i", body, pos)
+    pos += 4 * n
+    correct = body[pos:pos + n]
+    pos += n
+    if flags & FLAG_PROMPTS:
+        lengths = struct.unpack_from(f"<{n}H", body, pos)
+        pos += 2 * n
+        prompts = []
+        for size in lengths:
+            prompts.append(body[pos:pos + size].decode())
+            pos += size
+    else:
+        prompts = [_prompt(drill_type, a[i], b[i]) for i in range(n)]
+    start = _EPOCH + timedelta(microseconds=start_us)
+    return [{
+        "prompt": prompts[i], "a": a[i], "b": b[i], "correct_answer": answer[i],
+        "given_answer": given[i], "correct": bool(correct[i]),
+        "started_at": start + timedelta(microseconds=offset[i]), "elapsed_ms": elapsed[i],
+    } for i in range(n)]
+
+
+# ---------- migration ----------
+
+def pack_history(conn: Connection, batch_size: int = PACK_BATCH) -> int:
+    """Move DrillQuestion rows into packed blobs on their results, ``batch_size``
+    results per transaction; returns how many results were packed. Safe to stop
+    and rerun: each batch commits its blobs and row deletes together."""
+    packed, after = 0, 0
+    while True:
+        ids = [r[0] for r in conn.exec_driver_sql(
+            "SELECT DISTINCT drill_result_id FROM drillquestion WHERE drill_result_id > ? "
+            "ORDER BY drill_result_id LIMIT ?", (after, batch_size))]
+        if not ids:
+            return packed
+        after = ids[-1]
+        marks = ", ".join("?" * len(ids))
+        results = {rid: (DrillTypeEnum[dt], blob) for rid, dt, blob in conn.exec_driver_sql(
+            f"SELECT id, drill_type, packed_questions FROM drillresult WHERE id IN ({marks})", tuple(ids))}
+        rows: Dict[int, List[dict]] = {}
+        for rid, a, b, prompt, answer, given, ok, started, elapsed in conn.exec_driver_sql(
+            "SELECT drill_result_id, a, b, prompt, correct_answer, given_answer, correct, started_at, elapsed_ms "
+            f"FROM drillquestion WHERE drill_result_id IN ({marks}) ORDER BY drill_result_id, id", tuple(ids)
+        ):
+            rows.setdefault(rid, []).append({
+                "a": a, "b": b, "prompt": prompt, "correct_answer": answer, "given_answer": given,
+                "correct": bool(ok), "started_at": datetime.fromisoformat(str(started)), "elapsed_ms": elapsed,
+            })
+        updates = []
+        for rid, questions in rows.items():
+            if rid not in results:   # orphaned rows; left alone
+                continue
+            dt, existing = results[rid]
+            if existing:
+                questions = unpack_questions(dt, existing) + questions
+            updates.append((pack_questions(dt, questions), rid))
+        if updates:
+            conn.exec_driver_sql("UPDATE drillresult SET packed_questions = ? WHERE id = ?", updates)
+            done = [rid for _, rid in updates]
+            conn.exec_driver_sql(
+                f"DELETE FROM drillquestion WHERE drill_result_id IN ({', '.join('?' * len(done))})", tuple(done))
+            conn.commit()
+            packed += len(done)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Pack DrillQuestion rows into per-drill blobs.")
+    ap.add_argument("--batch", type=int, default=PACK_BATCH, help="results per transaction")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return freed pages")
+    args = ap.parse_args(argv)
+    from ..storage import engine, init_db
+    init_db()
+    with engine.connect() as conn:
+        n = pack_history(conn, args.batch)
+        if args.vacuum:
+            conn.commit()
+            conn.exec_driver_sql("VACUUM")
+    print(f"[Quickfire] Packed questions of {n} drills")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Read models for list-heavy pages and JSON feeds.
+
+Read paths select only the columns they render into these frozen
+``__slots__`` dataclasses instead of loading ORM entities: no identity map,
+no change tracking, and no ``DrillResult.packed_questions`` blob pulled
+along. The records have the same attribute names as the models, so
+templates read them unchanged, and orjson serialises dataclasses natively.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from sqlmodel import select
+from ..models import DrillResult, DrillTypeEnum
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    id: int
+    display_name: str
+
+
+@dataclass(frozen=True, slots=True)
+class DrillRow:
+    id: int
+    drill_type: DrillTypeEnum
+    settings_snapshot: str
+    elapsed_ms: int
+    created_at: datetime
+
+
+@dataclass(frozen=True, slots=True)
+class LastDrill:
+    """A user's latest drill, as shown on the login grid."""
+    type: str
+    level: Optional[int]
+    elapsed_ms: int
+    star: bool
+    snapshot: str
+    score: Optional[str] = None
+
+
+DRILL_COLUMNS = (DrillResult.id, DrillResult.drill_type, DrillResult.settings_snapshot,
+                 DrillResult.elapsed_ms, DrillResult.created_at)
+
+
+def select_drills():
+    """``select`` over ``DRILL_COLUMNS``; add filters/ordering, then pass to ``drill_rows``."""
+    return select(*DRILL_COLUMNS)
+
+
+def drill_rows(s, stmt) -> List[DrillRow]:
+    return [DrillRow(*r) for r in s.exec(stmt).all()]
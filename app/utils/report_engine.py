@@ -0,0 +1,145 @@
+"""Per-fact error-rate reports computed inside SQLite.
+
+For each fact (x, y) the last ``last_n`` attempts are picked with
+``ROW_NUMBER() OVER (PARTITION BY x, y ORDER BY started_at DESC)`` and only the
+aggregated cells come back, so cost follows the grid size, not the history.
+Axes per drill type: x = a, y = b, except division where x is the quotient
+(a ÷ b) and y the divisor, so every type fits a times-table style grid.
+
+Seeded and packed drills (attempts kept on DrillResult, see
+question_pack.py) have no DrillQuestion rows; the newest ``STORED_SCAN`` of
+them are decoded and merged in Python, so a report never decodes more than
+that many drills however long the history.
+"""
+import math
+from typing import Dict, Any, Optional
+from sqlalchemy import text
+from sqlmodel import Session
+from ..models import DrillTypeEnum, UserProgress
+from ..levels import LEVELS, get_preset
+from .question_pack import unpack_questions
+
+MAX_AXIS_CELLS = 21   # beyond this, facts are bucketed
+LAST_N = 5
+STORED_SCAN = 200   # newest seeded/packed drills merged into a report
+
+_AXES = {
+    DrillTypeEnum.division: ("(q.a / NULLIF(q.b, 0))", "q.b"),
+}
+_DEFAULT_AXES = ("q.a", "q.b")
+
+_SQL = """
+WITH facts AS (
+    SELECT {x} AS x, {y} AS y, q.correct AS ok,
+           ROW_NUMBER() OVER (PARTITION BY {x}, {y} ORDER BY q.started_at DESC) AS rn
+    FROM drillquestion q
+    JOIN drillresult r ON r.id = q.drill_result_id
+    WHERE r.user_id = :uid AND q.drill_type = :dt
+      AND {x} BETWEEN :lo AND :hi AND {y} BETWEEN :lo AND :hi
+)
+SELECT :lo + ((x - :lo) / :step) * :step AS bx,
+       :lo + ((y - :lo) / :step) * :step AS by_,
+       SUM(1 - ok) AS wrong, COUNT(*) AS n
+FROM facts
+WHERE rn <= :last_n
+GROUP BY bx, by_
+"""
+
+
+_SQL_FACTS = """
+SELECT x, y, ok, started_at FROM (
+    SELECT {x} AS x, {y} AS y, q.correct AS ok, q.started_at AS started_at,
+           ROW_NUMBER() OVER (PARTITION BY {x}, {y} ORDER BY q.started_at DESC) AS rn
+    FROM drillquestion q
+    JOIN drillresult r ON r.id = q.drill_result_id
+    WHERE r.user_id = :uid AND q.drill_type = :dt
+      AND {x} BETWEEN :lo AND :hi AND {y} BETWEEN :lo AND :hi
+) WHERE rn <= :last_n
+"""
+
+
+def default_range(drill_type: DrillTypeEnum, level: int) -> tuple[int, int]:
+    """Axis range covering what the user has practised up to ``level``."""
+    if drill_type in (DrillTypeEnum.multiplication, DrillTypeEnum.division):
+        return 1, 12
+    hi = max(int(get_preset(drill_type, lv).get("max", 20)) for lv in range(1, level + 1))
+    return 0, max(20, hi)
+
+
+def auto_step(lo: int, hi: int) -> int:
+    return max(1, math.ceil((hi - lo + 1) / MAX_AXIS_CELLS))
+
+
+def resolve_axes(s: Session, uid: int, drill_type: DrillTypeEnum, lo: Optional[int],
+                 hi: Optional[int], step: Optional[int]) -> tuple[int, int, int]:
+    """Fill in the level's default range and an automatic step where not given."""
+    if lo is None or hi is None:
+        prog = s.exec(text("SELECT level FROM userprogress WHERE user_id = :uid AND drill_type = :dt"),
+                      params={"uid": uid, "dt": drill_type.name}).first()
+        level = min(int(prog[0]) if prog else 1, len(LEVELS[drill_type]))
+        d_lo, d_hi = default_range(drill_type, level)
+        lo = d_lo if lo is None else lo
+        hi = d_hi if hi is None else hi
+    return lo, hi, step or auto_step(lo, hi)
+
+
+def fact_report(s: Session, uid: int, drill_type: DrillTypeEnum, lo: Optional[int] = None,
+                hi: Optional[int] = None, step: Optional[int] = None, last_n: int = LAST_N) -> Dict[str, Any]:
+    """Return {labels_from, labels_to, step, grid} with only non-empty cells in ``grid``."""
+    lo, hi, step = resolve_axes(s, uid, drill_type, lo, hi, step)
+    x, y = _AXES.get(drill_type, _DEFAULT_AXES)
+    params = {"uid": uid, "dt": drill_type.name, "lo": lo, "hi": hi, "step": step, "last_n": last_n}
+    grid: Dict[int, Dict[int, float]] = {}
+    if not _has_stored(s, uid, drill_type):
+        for bx, by, wrong, n in s.exec(text(_SQL.format(x=x, y=y)), params=params).all():
+            grid.setdefault(int(bx), {})[int(by)] = (wrong or 0) / n
+    else:
+        _merge_stored(s, grid, drill_type, params, x, y)
+    last = lo + ((hi - lo) // step) * step
+    return {"labels_from": lo, "labels_to": last, "step": step, "grid": grid}
+
+
+def _has_stored(s: Session, uid: int, drill_type: DrillTypeEnum) -> bool:
+    return s.exec(text(
+        "SELECT 1 FROM drillresult WHERE user_id = :uid AND drill_type = :dt "
+        "AND packed_questions IS NOT NULL LIMIT 1"
+    ), params={"uid": uid, "dt": drill_type.name}).first() is not None
+
+
+def _merge_stored(s: Session, grid, drill_type: DrillTypeEnum, params: dict, x: str, y: str) -> None:
+    """Last-N per fact across DrillQuestion rows (newest N per fact, from SQL) and
+    seeded or packed drills, whose attempts are decoded here."""
+    lo, hi, step, last_n = params["lo"], params["hi"], params["step"], params["last_n"]
+    per_fact: Dict[tuple, list] = {}
+    for fx, fy, ok, ts in s.exec(text(_SQL_FACTS.format(x=x, y=y)), params=params).all():
+        per_fact.setdefault((int(fx), int(fy)), []).append((str(ts), bool(ok)))
+    stored = s.exec(text(
+        "SELECT packed_questions FROM drillresult "
+        "WHERE user_id = :uid AND drill_type = :dt AND packed_questions IS NOT NULL "
+        "ORDER BY id DESC LIMIT :scan"
+    ), params={**params, "scan": STORED_SCAN}).all()
+    for (packed,) in stored:
+        for e in unpack_questions(drill_type, packed):
+            fx, fy = e["a"], e["b"]
+            if drill_type == DrillTypeEnum.division:
+                fx = fx // fy if fy else 0
+            if lo <= fx <= hi and lo <= fy <= hi:
+                # Same text form SQLite returns for DrillQuestion.started_at, so they sort together
+                per_fact.setdefault((fx, fy), []).append((e["started_at"].isoformat(sep=" ", timespec="microseconds"), e["correct"]))
+    cells: Dict[tuple, list] = {}
+    for (fx, fy), attempts in per_fact.items():
+        attempts.sort(reverse=True)
+        recent = attempts[:last_n]
+        key = (lo + ((fx - lo) // step) * step, lo + ((fy - lo) // step) * step)
+        acc = cells.setdefault(key, [0, 0])
+        acc[0] += sum(1 for _, ok in recent if not ok)
+        acc[1] += len(recent)
+    for (bx, by), (wrong, n) in cells.items():
+        grid.setdefault(bx, {})[by] = wrong / n
+
+
+def compact_rows(report: Dict[str, Any]) -> list[list[Optional[float]]]:
+    """Dense rows[i][j] for labels lo + i*step / lo + j*step (None where empty)."""
+    lo, hi, step, grid = report["labels_from"], report["labels_to"], report["step"], report["grid"]
+    axis = range(lo, hi + 1, step)
+    return [[grid.get(a, {}).get(b) for b in axis] for a in axis]
@@ -0,0 +1,150 @@
+"""Slow query log for ``storage.engine``.
+
+Cursor events time every statement; ones over ``THRESHOLD_MS`` are grouped by
+a normalised fingerprint (literals -> ?, IN lists collapsed) with count,
+total/max time and the routes that issued them. The first time a shape is
+seen its ``EXPLAIN QUERY PLAN`` is captured on the same connection and
+full-table ``SCAN`` steps are flagged. Everything lives in this process and
+is shown on /admin/slow_queries.
+
+The calling route comes from ``RouteContextMiddleware``, which puts the ASGI
+scope in a context variable; the threadpool that runs sync routes copies the
+context, so the hook sees it from any worker thread.
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+THRESHOLD_MS = float(os.getenv("APP_SLOW_QUERY_MS", "50"))   # negative disables
+MAX_SHAPES = 300
+
+_scope: contextvars.ContextVar = contextvars.ContextVar("qf_request_scope", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def fingerprint(statement: str) -> str:
+    s = _STRING.sub("?", statement)
+    s = _NUMBER.sub("?", s)
+    s = _SPACE.sub(" ", s).strip()
+    return _IN_LIST.sub("(...)", s)
+
+
+def current_route() -> str:
+    scope = _scope.get()
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}".strip()
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = THRESHOLD_MS, max_shapes: int = MAX_SHAPES):
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self._shapes: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, ms: float, route: str, explain) -> None:
+        fp = fingerprint(statement)
+        with self._lock:
+            shape = self._shapes.get(fp)
+            if shape is None:
+                if len(self._shapes) >= self.max_shapes:
+                    del self._shapes[min(self._shapes, key=lambda k: self._shapes[k]["total_ms"])]
+                shape = self._shapes[fp] = {
+                    "fingerprint": fp, "statement": statement, "count": 0, "total_ms": 0.0,
+                    "max_ms": 0.0, "routes": Counter(), "plan": None, "scans": [],
+                }
+                first = True
+            else:
+                first = False
+            shape["count"] += 1
+            shape["total_ms"] += ms
+            shape["max_ms"] = max(shape["max_ms"], ms)
+            shape["routes"][route] += 1
+            shape["last_at"] = time.time()
+        if first:
+            plan = explain()
+            with self._lock:
+                shape["plan"] = plan
+                shape["scans"] = [d for d in (plan or []) if d.startswith("SCAN") and "CONSTANT ROW" not in d]
+
+    def report(self) -> List[dict]:
+        """Shapes by total time, heaviest first."""
+        with self._lock:
+            rows = [{**v, "routes": v["routes"].most_common(5),
+                     "avg_ms": v["total_ms"] / v["count"]} for v in self._shapes.values()]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+
+
+def _explain(cursor, statement: str, parameters, executemany: bool) -> Optional[List[str]]:
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    params = parameters[0] if executemany and parameters else parameters
+    try:
+        rows = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, params or ()).fetchall()
+    except Exception:
+        return None
+    return [str(r[3]) for r in rows]
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("qf_query_start", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("qf_query_start")
+    if not started:
+        return
+    ms = (time.perf_counter() - started.pop()) * 1000.0
+    if log.threshold_ms < 0 or ms < log.threshold_ms:
+        return
+    log.record(statement, ms, current_route(), lambda: _explain(cursor, statement, parameters, executemany))
+
+
+def _error(ctx):
+    started = ctx.connection.info.get("qf_query_start") if ctx.connection is not None else None
+    if started:
+        started.pop()
+
+
+def install(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+        event.listen(engine, "handle_error", _error)
+
+
+class RouteContextMiddleware:
+    """Makes the current request's scope visible to the query hook."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
+
+
+log = SlowQueryLog()
@@ -0,0 +1,128 @@
+"""Batched user deletion that never holds the SQLite write lock for long.
+
+Each user's drill history is removed in chunks of ``batch_size`` results, one
+short transaction per chunk, with a pause between chunks so in-flight drills
+can commit. When the schema declares ``ON DELETE CASCADE`` (databases created
+since the FKs gained it) child rows go with their results via SQLite's FK
+enforcement on the deleting connection; older schemas get explicit chunked
+child deletes instead.
+"""
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select, delete
+from ..storage import engine
+from ..models import User, UserSettings, UserProgress, DrillResult, DrillQuestion, DrillAward, ActivityRollup, FinishReceipt, FactLatency
+from .fragment_cache import fragments, USERS_SCOPE
+from .progress import preset_cache
+
+BATCH_SIZE = 200      # drill results per transaction (~20 questions each)
+PAUSE_SEC = 0.02      # yield the write lock between chunks
+
+_CHILD_TABLES = ("drillquestion", "drillaward")
+
+MAX_FINISHED_JOBS = 20  # finished jobs kept for the admin page
+
+_jobs: Dict[int, dict] = {}
+_job_ids = itertools.count(1)
+_jobs_lock = threading.Lock()
+
+
+def _cascade_ready(conn: Connection) -> bool:
+    for table in _CHILD_TABLES:
+        fks = conn.exec_driver_sql(f"PRAGMA foreign_key_list({table})").all()
+        # row: (id, seq, table, from, to, on_update, on_delete, match)
+        if not any(fk[2] == "drillresult" and fk[6] == "CASCADE" for fk in fks):
+            return False
+    return True
+
+
+def _delete_chunk(s: Session, res_ids: List[int], cascade: bool) -> int:
+    n = 0
+    if not cascade:
+        n += s.exec(delete(DrillQuestion).where(DrillQuestion.drill_result_id.in_(res_ids))).rowcount
+        n += s.exec(delete(DrillAward).where(DrillAward.drill_result_id.in_(res_ids))).rowcount
+    n += s.exec(delete(DrillResult).where(DrillResult.id.in_(res_ids))).rowcount
+    return n
+
+
+def delete_user_data(uid: int, batch_size: Optional[int] = None, pause_sec: Optional[float] = None,
+                     progress: Optional[dict] = None) -> int:
+    """Delete one user and everything they own; returns rows removed (cascaded children not counted)."""
+    batch_size = batch_size or BATCH_SIZE
+    pause_sec = PAUSE_SEC if pause_sec is None else pause_sec
+    removed = 0
+    with engine.connect() as conn:
+        cascade = _cascade_ready(conn)
+        if cascade:
+            # Per-connection, and only takes effect outside a transaction.
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+        conn.commit()
+        try:
+            with Session(bind=conn) as s:
+                while True:
+                    res_ids = list(s.exec(
+                        select(DrillResult.id).where(DrillResult.user_id == uid).limit(batch_size)
+                    ).all())
+                    if not res_ids:
+                        break
+                    removed += _delete_chunk(s, res_ids, cascade)
+                    s.commit()
+                    if progress is not None:
+                        progress["rows"] = progress.get("rows", 0) + len(res_ids)
+                    if pause_sec:
+                        time.sleep(pause_sec)
+                removed += s.exec(delete(ActivityRollup).where(ActivityRollup.user_id == uid)).rowcount
+                removed += s.exec(delete(FinishReceipt).where(FinishReceipt.user_id == uid)).rowcount
+                removed += s.exec(delete(FactLatency).where(FactLatency.user_id == uid)).rowcount
+                removed += s.exec(delete(UserSettings).where(UserSettings.user_id == uid)).rowcount
+                removed += s.exec(delete(UserProgress).where(UserProgress.user_id == uid)).rowcount
+                removed += s.exec(delete(User).where(User.id == uid)).rowcount
+                s.commit()
+        finally:
+            if cascade:
+                conn.rollback()
+                conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+                conn.commit()
+    preset_cache.invalidate(uid)
+    fragments.bump(USERS_SCOPE)
+    return removed
+
+
+# ----------------- Background jobs (admin page progress) -----------------
+def start_job(user_ids: Iterable[int]) -> int:
+    ids = sorted(set(int(u) for u in user_ids))
+    with _jobs_lock:
+        finished = [i for i in sorted(_jobs) if _jobs[i]["state"] in ("done", "failed")]
+        for i in finished[:-MAX_FINISHED_JOBS]:
+            del _jobs[i]
+        job_id = next(_job_ids)
+        _jobs[job_id] = {"id": job_id, "state": "queued", "users_total": len(ids),
+                         "users_done": 0, "rows": 0, "user_ids": ids, "error": None}
+    return job_id
+
+
+def run_job(job_id: int, batch_size: Optional[int] = None, pause_sec: Optional[float] = None) -> None:
+    job = _jobs[job_id]
+    job["state"] = "running"
+    try:
+        for uid in job["user_ids"]:
+            delete_user_data(uid, batch_size=batch_size, pause_sec=pause_sec, progress=job)
+            job["users_done"] += 1
+        job["state"] = "done"
+    except Exception as e:  # surfaced on the admin page
+        job["state"] = "failed"
+        job["error"] = str(e)
+
+
+def job_status(job_id: int) -> Optional[dict]:
+    job = _jobs.get(job_id)
+    return {k: v for k, v in job.items() if k != "user_ids"} if job else None
+
+
+def recent_jobs(limit: int = 5) -> List[dict]:
+    with _jobs_lock:
+        ids = sorted(_jobs, reverse=True)[:limit]
+    return [job_status(i) for i in ids]
@@ -0,0 +1,118 @@
+"""Paginated, searchable user directory (login grid, admin list, /users/search).
+
+- Ordering is "recent" (``User.last_active_at`` desc, bumped by every finished
+  drill) or "name"; both use keyset pagination on (sort key, id) so page N
+  costs the same as page 1. Cursors are opaque url-safe tokens.
+- Search uses an FTS5 index over ``display_name`` (external content on
+  ``user``, kept in sync by triggers); every query word is a prefix match,
+  so "al jo" finds "Alice Jones".
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text, update, or_
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+from ..models import User
+from .cursors import encode_cursor, decode_cursor
+from .read_models import UserRow, LastDrill
+
+PAGE_SIZE = 24
+MAX_PAGE = 100
+ORDERS = ("recent", "name")
+
+_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+           display_name, content='user', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON "user" BEGIN
+           INSERT INTO user_fts(rowid, display_name) VALUES (new.id, new.display_name); END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON "user" BEGIN
+           INSERT INTO user_fts(user_fts, rowid, display_name) VALUES ('delete', old.id, old.display_name); END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF display_name ON "user" BEGIN
+           INSERT INTO user_fts(user_fts, rowid, display_name) VALUES ('delete', old.id, old.display_name);
+           INSERT INTO user_fts(rowid, display_name) VALUES (new.id, new.display_name); END""",
+]
+
+
+def ensure_directory(conn: Connection) -> None:
+    """Create the FTS index (built from existing users the first time) and fill
+    ``last_active_at`` for users from before the column existed."""
+    fresh = not conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_fts'").first()
+    for ddl in _FTS_DDL:
+        conn.exec_driver_sql(ddl)
+    if fresh:
+        conn.exec_driver_sql("INSERT INTO user_fts(user_fts) VALUES ('rebuild')")
+    backfill_last_active(conn)
+    conn.commit()
+
+
+def backfill_last_active(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        'UPDATE "user" SET last_active_at = COALESCE('
+        '(SELECT MAX(r.created_at) FROM drillresult r WHERE r.user_id = "user".id), created_at) '
+        "WHERE last_active_at IS NULL"
+    )
+
+
+def touch(s: Session, uid: int, ts: datetime) -> None:
+    """Move a user up the recent ordering (caller commits)."""
+    s.exec(update(User).where(User.id == uid)
+           .where(or_(User.last_active_at.is_(None), User.last_active_at < ts))
+           .values(last_active_at=ts))
+
+
+def fts_query(q: str) -> Optional[str]:
+    words = re.findall(r"\w+", q or "")
+    return " ".join(f'"{w}"*' for w in words) or None
+
+
+def search_users(s: Session, q: Optional[str] = None, cursor: Optional[str] = None,
+                 limit: int = PAGE_SIZE, order: str = "recent") -> Tuple[List[UserRow], Optional[str]]:
+    """One page of users; returns (rows, next cursor or None)."""
+    if order not in ORDERS:
+        raise ValueError("bad order")
+    limit = max(1, min(int(limit), MAX_PAGE))
+    col = "u.last_active_at" if order == "recent" else "u.display_name"
+    direction = "DESC" if order == "recent" else "ASC"
+    sql = [f'SELECT u.id, u.display_name, {col} AS k FROM "user" u']
+    where, params = [], {"limit": limit + 1}
+    match = fts_query(q) if q else None
+    if match:
+        sql.append("JOIN user_fts f ON f.rowid = u.id")
+        where.append("user_fts MATCH :match")
+        params["match"] = match
+    if cursor:
+        params["ck"], params["cid"] = decode_cursor(cursor, order)
+        where.append(f"({col}, u.id) {'<' if direction == 'DESC' else '>'} (:ck, :cid)")
+    if where:
+        sql.append("WHERE " + " AND ".join(where))
+    sql.append(f"ORDER BY {col} {direction}, u.id {direction} LIMIT :limit")
+    rows = s.exec(text(" ".join(sql)), params=params).all()
+    page = [UserRow(r[0], r[1]) for r in rows[:limit]]
+    nxt = encode_cursor(order, rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+    return page, nxt
+
+
+def last_drills(s: Session, user_ids: List[int]) -> Dict[int, LastDrill]:
+    """Latest drill per user (type, level, time, star) for a page of users, in one query."""
+    if not user_ids:
+        return {}
+    ids = ", ".join(str(int(u)) for u in user_ids)
+    rows = s.exec(text(
+        "SELECT r.id, r.user_id, r.drill_type, r.elapsed_ms, r.settings_snapshot, "
+        "EXISTS (SELECT 1 FROM drillaward a WHERE a.drill_result_id = r.id AND a.award_type = 'star') "
+        "FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS rn "
+        f"      FROM drillresult WHERE user_id IN ({ids})) r WHERE r.rn = 1"
+    )).all()
+    out = {}
+    for _rid, uid, dt, elapsed, snap, star in rows:
+        level_num = None
+        snap = snap or ""
+        if snap.startswith("[L"):
+            try:
+                level_num = int(snap.split("[")[1].split("]")[0].lstrip("L"))
+            except Exception:
+                level_num = None
+        out[uid] = LastDrill(str(dt), level_num, elapsed, bool(star), snap)
+    return out
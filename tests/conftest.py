@@ -25,6 +25,8 @@ def test_client(monkeypatch):
 
     # Import after setting env so storage binds to this DB
     from app.main import create_app
+    from app.utils.admission import limiter
+    limiter.reset()   # user ids restart with each DB; don't carry their token buckets over
     app = create_app()
     with TestClient(app) as client:
         yield client
@@ -68,3 +68,157 @@ def test_next_problem_duplicate_avoidance(test_client: TestClient):
     assert r.status_code == 200
     data = r.json()
     assert data["prompt"] != avoid
+
+
+def _admin_login(client: TestClient) -> None:
+    from app.storage import get_session
+    from app.models import AdminConfig
+    with get_session() as s:
+        pwd = s.exec(__import__('sqlmodel').select(AdminConfig)).first().admin_password_plain
+    client.post("/admin/login", data={"password": pwd}, allow_redirects=False)
+
+
+def test_bulk_delete_users_in_batches(test_client: TestClient, monkeypatch):
+    from tests.test_drill_flow import _finish_payload
+    from app.storage import get_session
+    from app.models import User, DrillResult, DrillQuestion, DrillAward
+    import app.utils.user_delete as ud
+    create_user = __import__("tests.conftest", fromlist=["create_user"]).create_user
+    uids = [create_user(test_client, n) for n in ("Lena", "Milo", "Nora")]
+    for uid in uids:
+        test_client.cookies.set("uid", str(uid))
+        for _ in range(3):
+            test_client.post("/finish", data=_finish_payload("addition", items=5, correct=5, elapsed_ms=5000))
+    _admin_login(test_client)
+    monkeypatch.setattr(ud, "BATCH_SIZE", 2)
+
+    # Fresh schema deletes children through ON DELETE CASCADE
+    assert test_client.post("/admin/delete_user", data={"user_id": uids[0]}).status_code == 200
+    # Legacy schema path: explicit chunked child deletes; several users in one job
+    monkeypatch.setattr(ud, "_cascade_ready", lambda conn: False)
+    r = test_client.post("/admin/delete_user", data={"user_id": uids[1:]}, allow_redirects=False)
+    job_id = int(r.headers["location"].split("job=")[1])
+    status = test_client.get(f"/admin/delete_jobs/{job_id}").json()
+    assert status["state"] == "done" and status["users_done"] == 2 and status["rows"] == 6
+    # Only the newest finished jobs are kept
+    monkeypatch.setattr(ud, "MAX_FINISHED_JOBS", 1)
+    for _ in range(2):
+        ud.run_job(ud.start_job([]))
+    assert ud.job_status(job_id) is None and len(ud.recent_jobs()) == 2
+
+    with get_session() as s:
+        sel = __import__('sqlmodel').select
+        assert s.exec(sel(User)).all() == []
+        assert s.exec(sel(DrillResult)).all() == []
+        assert s.exec(sel(DrillQuestion)).all() == []
+        assert s.exec(sel(DrillAward)).all() == []
+
+
+def test_admin_request_profiling_ring(test_client: TestClient, monkeypatch, tmp_path):
+    from app.utils import profiler
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiler, "KEEP", 2)
+    # Not an admin: the header is ignored
+    assert "x-profile-id" not in test_client.get("/progress", headers={"X-Profile": "1"}).headers
+    _admin_login(test_client)
+    ids = [test_client.get("/admin", headers={"X-Profile": "1"}).headers["x-profile-id"] for _ in range(3)]
+    listed = profiler.list_profiles()
+    assert len(listed) == 2 and listed[0]["route"] == "/admin" and listed[0]["method"] == "GET"
+
+    prof = test_client.get(f"/admin/profiles/{ids[-1]}").json()
+    assert prof["profiles"][0]["type"] == "sampled" and prof["profiles"][0]["unit"] == "milliseconds"
+    assert test_client.get(f"/admin/profiles/{ids[0]}").status_code == 404   # pushed out of the ring
+    assert "GET /admin" in test_client.get("/admin/profiles").text
+
+    # Streaming routes are skipped; routes with hyphens list back unchanged; samples are capped
+    headers = [(b"x-profile", b"1"), (b"cookie", b"is_admin=1")]
+    assert profiler.wants_profile({"type": "http", "path": "/admin", "headers": headers})
+    assert not profiler.wants_profile({"type": "http", "path": "/admin/live", "headers": headers})
+    assert not profiler.wants_profile({"type": "http", "path": "/admin/export/drills", "headers": headers})
+    sampler = profiler.Sampler(interval_ms=0.1, max_samples=5)
+    sampler.start()
+    __import__("time").sleep(0.05)
+    profiler.save(1, "GET", "/a-b/c_d", sampler, sampler.stop())
+    assert len(sampler.samples) <= 5
+    assert [p["route"] for p in profiler.list_profiles() if p["ts"] == 1] == ["/a-b/c_d"]
+
+
+def test_slow_query_log_fingerprints_and_flags_scans(test_client: TestClient, monkeypatch):
+    from app.utils import slow_queries
+    assert slow_queries.fingerprint("SELECT * FROM t WHERE a = 5 AND b IN (1, 2, 3) AND c = 'x'") == \
+        "SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ?"
+    monkeypatch.setattr(slow_queries, "log", slow_queries.SlowQueryLog(threshold_ms=0))
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Quin")
+    test_client.get("/progress")
+    test_client.get("/progress")
+    shapes = slow_queries.log.report()
+    prog = [q for q in shapes if "FROM userprogress" in q["fingerprint"]]
+    assert prog and any(r.startswith("GET /progress") for q in prog for r, _ in q["routes"])
+    assert all(q["plan"] is not None for q in prog)
+    # The login grid's user listing has no usable index: flagged as a scan
+    assert any(q["scans"] for q in shapes if 'FROM "user"' in q["fingerprint"] or "FROM user" in q["fingerprint"])
+    _admin_login(test_client)
+    assert "Slow queries" in test_client.get("/admin/slow_queries").text
+
+
+def test_admin_live_stream_fans_out_finished_drills(test_client: TestClient, monkeypatch):
+    import asyncio
+    import json
+    from app.utils import live
+    from tests.test_drill_flow import _finish_payload
+    assert test_client.get("/admin/live").status_code == 403
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Rae")
+    monkeypatch.setattr(live.bus, "queue_size", 2)
+
+    async def no():
+        return False
+
+    async def watch():
+        a, b = live.stream(no), live.stream(no)
+        assert await a.__anext__() == await b.__anext__() == b"retry: 3000\n\n"
+        await asyncio.to_thread(test_client.post, "/finish", data=_finish_payload("addition", correct=20, elapsed_ms=20000))
+        frames = [await a.__anext__(), await b.__anext__()]
+        # A slow watcher keeps only the newest events and is told how many it missed
+        for i in range(5):
+            await asyncio.to_thread(live.bus.publish, {"n": i})
+        await asyncio.sleep(0.05)
+        lag, kept = await a.__anext__(), await a.__anext__()
+        await a.aclose()
+        await b.aclose()
+        return frames, lag, kept
+
+    frames, lag, kept = asyncio.run(watch())
+    assert frames[0] == frames[1] and frames[0].startswith(b"event: drill\ndata: ")
+    ev = json.loads(frames[0].split(b"data: ", 1)[1])
+    assert ev["name"] == "Rae" and ev["drill_type"] == "addition" and ev["star"] is True and ev["acc"] == 1.0
+    assert lag == b'event: lag\ndata: {"dropped":3}\n\n' and json.loads(kept.split(b"data: ", 1)[1]) == {"n": 3}
+    assert not live.bus.has_subscribers
+
+
+def test_online_backup_snapshots_rotate_and_verify(test_client: TestClient, monkeypatch, tmp_path):
+    import gzip
+    import sqlite3
+    from app.utils import backup
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    monkeypatch.setattr(backup, "KEEP", 2)
+    monkeypatch.setattr(backup, "PAGES_PER_STEP", 1)
+    monkeypatch.setattr(backup, "STEP_SLEEP_MS", 0)
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Sol")
+    assert test_client.post("/admin/backups/run").status_code == 403
+    _admin_login(test_client)
+    for _ in range(3):
+        assert test_client.post("/admin/backups/run", allow_redirects=False).status_code == 303
+
+    runs = backup.recent_runs()[:3]
+    assert all(r["ok"] and r["steps"] >= r["pages"] > 1 and 0 < r["gz_bytes"] < r["db_bytes"] for r in runs)
+    snaps = backup.list_backups()
+    assert [s["name"] for s in snaps] == [r["name"] for r in runs[:2]]   # oldest rotated out
+    raw = tmp_path / "restored.sqlite"
+    raw.write_bytes(gzip.decompress(test_client.get(f"/admin/backups/{snaps[0]['name']}").content))
+    con = sqlite3.connect(raw)
+    assert con.execute('SELECT display_name FROM "user"').fetchall() == [("Sol",)]
+    con.close()
+    assert "Back up now" in test_client.get("/admin/backups").text
+    assert test_client.get("/admin/backups/../test.sqlite").status_code == 404
+    # The schedule is opt-in: a default app (like this test client) starts no backup thread
+    assert backup.scheduler.interval == 0 and backup.scheduler._thread is None
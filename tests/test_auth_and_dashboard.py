@@ -23,3 +23,60 @@ def test_dashboard_requires_login_and_renders(test_client: TestClient):
     r = test_client.get("/dashboard")
     assert r.status_code == 200
     assert "Choose a drill" in r.text
+
+
+def test_login_grid_cached_until_data_changes(test_client: TestClient):
+    from app.utils.fragment_cache import fragments
+    create_user = __import__("tests.conftest", fromlist=["create_user"]).create_user
+    create_user(test_client, "Dev")
+    test_client.get("/")
+    hits = fragments.hits
+    assert "Dev" in test_client.get("/").text
+    assert fragments.hits == hits + 1
+    # A finished drill leaves the grid cached; adding a user invalidates it
+    from tests.test_drill_flow import _finish_payload
+    test_client.post("/finish", data=_finish_payload("addition"))
+    test_client.get("/")
+    assert fragments.hits == hits + 2
+    create_user(test_client, "Emma")
+    r = test_client.get("/")
+    assert "Dev" in r.text and "Emma" in r.text
+
+
+def test_fragment_cache_versions_and_max_age():
+    from app.utils.fragment_cache import FragmentCache
+    cache = FragmentCache(max_scopes=2)
+    cache.get_or_render("f", "a", lambda: "a1")
+    assert cache.get_or_render("f", "a", lambda: "a2") == "a1"
+    assert cache.get_or_render("f", "a", lambda: "a2", max_age=0) == "a2"
+    cache.bump("a")
+    assert cache.get_or_render("f", "a", lambda: "a3") == "a3"
+    # Evicting a's version must not bring back entries cached under it
+    cache.bump("b", "c")
+    assert len(cache._versions) == 2 and cache.get_or_render("f", "a", lambda: "a4") == "a4"
+
+
+def test_user_directory_search_and_keyset_pages(test_client: TestClient):
+    from tests.conftest import create_user
+    from tests.test_drill_flow import _finish_payload
+    for name in ["Alice Jones", "Albert Stone", "Bob Allen", "Carla Jo"]:
+        create_user(test_client, name)
+    # Alice (logged in again) just finished a drill, so she heads the "recent" ordering
+    alice = test_client.get("/users/search", params={"q": "alice"}).json()["items"][0]["id"]
+    test_client.post("/login", data={"user_id": alice}, allow_redirects=False)
+    test_client.post("/finish", data=_finish_payload("addition"))
+
+    first = test_client.get("/users/search", params={"limit": 3, "recent": 1}).json()
+    assert first["items"][0]["display_name"] == "Alice Jones" and first["items"][0]["last"]["type"] == "addition"
+    assert first["items"][1]["last"] is None
+    names = [u["display_name"] for u in first["items"]]
+    rest = test_client.get("/users/search", params={"limit": 3, "cursor": first["next_cursor"]}).json()
+    assert rest["next_cursor"] is None
+    assert sorted(names + [u["display_name"] for u in rest["items"]]) == ["Albert Stone", "Alice Jones", "Bob Allen", "Carla Jo"]
+
+    by_name = test_client.get("/users/search", params={"order": "name", "limit": 2}).json()
+    assert [u["display_name"] for u in by_name["items"]] == ["Albert Stone", "Alice Jones"]
+    hits = test_client.get("/users/search", params={"q": "al", "order": "name"}).json()["items"]
+    assert [u["display_name"] for u in hits] == ["Albert Stone", "Alice Jones", "Bob Allen"]
+    assert [u["display_name"] for u in test_client.get("/users/search", params={"q": "jo c"}).json()["items"]] == ["Carla Jo"]
+    assert test_client.get("/users/search", params={"cursor": "junk"}).status_code == 400
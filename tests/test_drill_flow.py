@@ -104,3 +104,486 @@ def test_reports_endpoints(test_client: TestClient):
     assert a["labels_from"] == 0 and isinstance(a["grid"], dict)
     assert s["labels_from"] == 0 and isinstance(s["grid"], dict)
 
+
+
+def test_report_compact_layout_and_compression(test_client: TestClient):
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Iris")
+    test_client.post("/finish", data=_finish_payload("multiplication", items=20, correct=15, elapsed_ms=30000))
+    r = test_client.get("/report/addition", params={"compact": 1}, headers={"Accept-Encoding": "gzip"})
+    assert r.headers.get("content-encoding") == "gzip"
+    assert len(r.json()["grid"]) == 21
+    m = test_client.get("/report/multiplication", params={"compact": 1}).json()
+    assert m["layout"] == "rows" and len(m["grid"]) == 12 and all(len(row) == 12 for row in m["grid"])
+    # Tiny payloads go out uncompressed
+    r = test_client.get("/stats", params={"tz_offset": 0}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+    # Codings refused with q=0 are never used
+    from app.utils.compression import _pick_encoding
+    r = test_client.get("/report/addition", params={"compact": 1}, headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in r.headers
+    assert _pick_encoding("br;q=0, gzip") == "gzip"
+    assert _pick_encoding("*;q=0") is None and _pick_encoding("identity") is None
+    assert _pick_encoding("*") in ("br", "gzip") and _pick_encoding("GZIP; q=0.5") == "gzip"
+
+
+def test_stats_and_activity_from_rollup(test_client: TestClient):
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Jon")
+    for dt in ("addition", "addition", "division"):
+        test_client.post("/finish", data=_finish_payload(dt, items=5, correct=5, elapsed_ms=5000))
+    # Whole-hour and half-hour offsets both count every drill finished just now
+    for tz in (0, -330):
+        stats = test_client.get("/stats", params={"tz_offset": tz}).json()
+        assert stats["total"] == 3 and stats["addition"] == 2 and stats["division"] == 1
+    act = test_client.get("/activity", params={"tz_offset": 0, "days": 30}).json()
+    assert len(act["days"]) == 30 and act["days"][-1]["drills"] == 3
+    assert act["current_streak"] == 1 and act["longest_streak"] == 1
+
+
+def _qlog_payload(drill_type: str, attempts):
+    qlog = [{
+        "prompt": f"{a} ? {b}", "a": a, "b": b, "correct_answer": 0, "given_answer": 0,
+        "correct": ok, "started_at": f"2024-01-01T00:00:{i:02d}", "elapsed_ms": 100,
+    } for i, (a, b, ok) in enumerate(attempts)]
+    return {"drill_type": drill_type, "elapsed_ms": "9000", "settings_human": "x",
+            "question_count": str(len(qlog)), "score": "0", "qlog": json.dumps(qlog)}
+
+
+def test_report_engine_last_n_buckets_and_division(test_client: TestClient):
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Kai")
+    # 6 attempts at 3+4: only the newest 5 count (oldest wrong one drops out)
+    attempts = [(3, 4, False)] + [(3, 4, True)] * 4 + [(3, 4, False)] + [(150, 40, False)]
+    test_client.post("/finish", data=_qlog_payload("addition", attempts))
+    rep = test_client.get("/report/addition").json()
+    assert rep["grid"] == {"3": {"4": 0.2}}  # out-of-range 150+40 not in the level-1 grid
+    wide = test_client.get("/report/addition", params={"lo": 0, "hi": 199}).json()
+    assert wide["step"] == 10 and wide["grid"]["150"]["40"] == 1.0 and wide["grid"]["0"]["0"] == 0.2
+
+    test_client.post("/finish", data=_qlog_payload("division", [(56, 7, False), (56, 7, True)]))
+    div = test_client.get("/report/division").json()
+    assert div["labels_from"] == 1 and div["labels_to"] == 12
+    assert div["grid"] == {"8": {"7": 0.5}}
+    assert test_client.get("/report/addition", params={"last_n": 100}).json()["grid"]["3"]["4"] == 2 / 6
+
+
+def test_seeded_drill_stores_packed_attempts(test_client: TestClient):
+    from app.models import DrillTypeEnum
+    from app.utils.drill_plan import plan_problems
+    from app.utils.question_pack import unpack_questions
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Sol")
+    r = test_client.post("/start", data={"drill_type": "addition"})
+    assert "plan: [" in r.text
+
+    seed = 12345
+    plan = plan_problems(DrillTypeEnum.addition, 1, seed)
+    qlog = [{"i": i, "given_answer": plan[i][1] if i else plan[i][1] + 1,
+             "started_at": f"2024-01-01T00:00:{i:02d}", "elapsed_ms": 400} for i in range(3)]
+    pay = test_client.post("/finish", data={
+        "drill_type": "addition", "elapsed_ms": "9000", "settings_human": "x", "question_count": "3",
+        "score": "2", "qlog": json.dumps(qlog), "seed": str(seed), "plan_level": "1",
+    }).json()
+    assert pay["ok"] is True
+
+    from app.storage import get_session
+    from app.models import DrillResult, DrillQuestion
+    from sqlmodel import select
+    with get_session() as s:
+        rec = s.exec(select(DrillResult).order_by(DrillResult.id.desc())).first()
+        assert rec.seed == seed and rec.level == 1
+        assert s.exec(select(DrillQuestion).where(DrillQuestion.drill_result_id == rec.id)).first() is None
+        stored = unpack_questions(rec.drill_type, rec.packed_questions)
+    assert [(q["a"], q["b"], q["correct"]) for q in stored] == [(p[3], p[4], i > 0) for i, p in enumerate(plan[:3])]
+
+    rep = test_client.get("/report/addition").json()
+    a0, b0 = plan[0][3], plan[0][4]
+    assert rep["grid"][str(a0)][str(b0)] == 1.0
+
+
+def test_seeded_plans_repeat_and_round_trip(test_client: TestClient):
+    from datetime import datetime, timedelta
+    from app.levels import LEVELS
+    from app.models import DrillTypeEnum
+    from app.utils.drill_plan import plan_problems, attempts_from_qlog
+    from app.utils.question_pack import pack_questions, unpack_questions
+    start = datetime(2024, 1, 1, 8, 30)
+    for dt in DrillTypeEnum:
+        for level in (1, len(LEVELS[dt])):
+            plan = plan_problems(dt, level, 20240101)
+            plan_problems.cache_clear()
+            assert plan_problems(dt, level, 20240101) == plan   # same seed, same plan
+            qlog = [{"i": i, "given_answer": plan[i][1] + i % 2,
+                     "started_at": (start + timedelta(seconds=i, microseconds=7)).isoformat(), "elapsed_ms": 300 + i}
+                    for i in range(0, len(plan), 3)]
+            attempts = attempts_from_qlog(dt, level, 20240101, qlog)
+            assert [(e["a"], e["b"], e["correct"]) for e in attempts] == \
+                [(plan[e["i"]][3], plan[e["i"]][4], e["i"] % 2 == 0) for e in qlog]
+            assert unpack_questions(dt, pack_questions(dt, attempts)) == attempts
+    assert attempts_from_qlog(DrillTypeEnum.addition, 1, 1, [{"i": 999, "started_at": start.isoformat()}]) is None
+
+
+def test_finish_idempotency_key_replays_original_response(test_client: TestClient):
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Ida")
+    data = {**_finish_payload("addition", correct=20, elapsed_ms=20000), "idem_key": "drill-1"}
+    first = test_client.post("/finish", data=data)
+    again = test_client.post("/finish", data={**data, "elapsed_ms": "1"})
+    hdr = test_client.post("/finish", data=_finish_payload("addition"), headers={"Idempotency-Key": "drill-1"})
+    assert first.json()["star"] is True and again.content == first.content == hdr.content
+
+    from app.storage import get_session
+    from app.models import DrillResult, UserProgress
+    from sqlmodel import select
+    with get_session() as s:
+        assert len(s.exec(select(DrillResult).where(DrillResult.user_id == uid)).all()) == 1
+        prog = s.exec(select(UserProgress).where(UserProgress.user_id == uid,
+                                                 UserProgress.drill_type == "addition")).first()
+        assert prog.stars_recent == "1"
+
+
+def test_finish_receipts_expire(test_client: TestClient):
+    from datetime import datetime
+    from app.storage import get_session
+    from app.models import FinishReceipt
+    from app.routers.drills import RECEIPT_TTL
+    from sqlmodel import select
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Rex")
+    test_client.post("/finish", data={**_finish_payload("addition"), "idem_key": "old"})
+    with get_session() as s:
+        rec = s.exec(select(FinishReceipt).where(FinishReceipt.key == "old")).one()
+        rec.created_at = datetime.utcnow() - RECEIPT_TTL
+        s.add(rec)
+        s.commit()
+    new = test_client.post("/finish", data={**_finish_payload("addition"), "idem_key": "new"})
+    assert test_client.post("/finish", data={**_finish_payload("addition"), "idem_key": "new"}).content == new.content
+    with get_session() as s:
+        assert s.exec(select(FinishReceipt.key).where(FinishReceipt.user_id == uid)).all() == ["new"]
+
+
+def test_rate_limit_and_single_flight(test_client: TestClient, monkeypatch):
+    import threading
+    from app.utils import admission
+    __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Max")
+    monkeypatch.setattr(admission, "limiter", admission.TokenBucketLimiter(rate=0.01, burst=2))
+    assert test_client.post("/next", data={"drill_type": "addition"}).status_code == 200
+    assert test_client.post("/next", data={"drill_type": "addition"}).status_code == 200
+    r = test_client.post("/next", data={"drill_type": "addition"})
+    assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1
+
+    sf = admission.SingleFlight()
+    gate, calls, results = threading.Event(), [], []
+    def slow():
+        calls.append(1); gate.wait(2); return "done"
+    threads = [threading.Thread(target=lambda: results.append(sf.do("k", slow))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(2000):
+        if sf.coalesced == 3:
+            break
+        threading.Event().wait(0.001)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert calls == [1] and results == ["done"] * 4
+
+
+def test_plan_prefetch_and_bulk_finish_sync(test_client: TestClient):
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Ola")
+    pl = test_client.get("/plan/addition").json()
+    assert pl["level"] == 1 and len(pl["plan"]) > 20 and int(pl["seed"]) > 0
+
+    base = _finish_payload("addition", correct=20, elapsed_ms=20000)
+    drills = [{"idem_key": f"k{i}", "created_at": f"2024-01-0{i}T10:00:00Z", "drill_type": "addition",
+               "elapsed_ms": 20000, "settings_human": "Level 1", "question_count": 20, "score": 20,
+               "qlog": json.loads(base["qlog"])} for i in (3, 1, 2)]
+    r = test_client.post("/finish/bulk", json={"drills": drills})
+    res = r.json()["results"]
+    assert [x["idem_key"] for x in res] == ["k3", "k1", "k2"]
+    # Applied oldest first: the third drill (k3) is the one that levels up
+    assert res[0]["level_up"] is True and not res[1]["level_up"] and not res[2]["level_up"]
+
+    again = test_client.post("/finish/bulk", json={"drills": drills[:1]}).json()["results"]
+    assert again[0] == res[0]
+    from app.storage import get_session
+    from app.models import DrillResult
+    from sqlmodel import select
+    with get_session() as s:
+        rows = s.exec(select(DrillResult).where(DrillResult.user_id == uid).order_by(DrillResult.created_at)).all()
+    assert [r.created_at.day for r in rows] == [1, 2, 3]
+    assert test_client.post("/finish/bulk", json={"drills": [{"idem_key": ""}]}).status_code == 422
+
+
+def test_history_keyset_pages(test_client: TestClient):
+    from datetime import datetime, timedelta
+    from app.storage import get_session
+    from app.models import DrillResult, DrillAward, DrillTypeEnum
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Quinn")
+    t0 = datetime(2024, 3, 1, 12, 0, 0)
+    with get_session() as s:
+        # Pairs share a timestamp, so the id tie-break has to hold pages together
+        rows = [DrillResult(user_id=uid, drill_type=DrillTypeEnum.addition, settings_snapshot=f"[L1] Drill {i}",
+                            elapsed_ms=1000 + i, created_at=t0 + timedelta(minutes=i // 2)) for i in range(57)]
+        s.add_all(rows)
+        s.flush()
+        s.add(DrillAward(drill_result_id=rows[3].id, award_type="star", payload="Star"))
+        s.commit()
+
+    first = test_client.get("/feed").json()
+    seen, cursor = [it["time_ms"] for it in first["items"]], first["next_cursor"]
+    assert len(seen) == 25 and cursor
+    while cursor:
+        page = test_client.get("/history", params={"cursor": cursor, "limit": 10}).json()
+        seen += [it["time_ms"] for it in page["items"]]
+        stars = [it["time_ms"] for it in page["items"] if it["star"]]
+        assert stars in ([], [1003])
+        cursor = page["next_cursor"]
+    assert seen == [1000 + i for i in sorted(range(57), key=lambda i: (i // 2, i), reverse=True)]
+    assert test_client.get("/history", params={"cursor": "garbage"}).status_code == 400
+    # Pages are column projections into slotted records, not ORM entities
+    from app.utils.feed_builders import fetch_results_with_stars
+    from app.utils.read_models import DrillRow
+    with get_session() as s:
+        rows, stars = fetch_results_with_stars(s, uid, limit=3)
+    assert all(type(r) is DrillRow and not hasattr(r, "__dict__") for r in rows) and stars == set()
+
+
+def test_speed_report_from_latency_sketches(test_client: TestClient):
+    import numpy as np
+    from app.utils.latency import LatencySketch, ALPHA, MAX_WEIGHT, rebuild_latency
+    from app.storage import engine
+
+    vals = np.random.default_rng(5).lognormal(np.log(2500), 0.5, MAX_WEIGHT)
+    sk = LatencySketch()
+    for v in vals:
+        sk.add(float(v))
+    for q in (0.5, 0.9):
+        exact = np.quantile(vals, q, method="lower")
+        assert abs(sk.quantile(q) - exact) <= 2 * ALPHA * exact
+    sk = LatencySketch.from_bytes(sk.to_bytes())
+    assert sk.total == MAX_WEIGHT and len(sk.to_bytes()) < 100
+    for _ in range(MAX_WEIGHT):
+        sk.add(800)   # practice makes fast: old answers decay away
+    assert sk.total <= MAX_WEIGHT and abs(sk.quantile(0.5) - 800) <= 2 * ALPHA * 800
+
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Rio")
+    test_client.post("/finish", data=_finish_payload("addition", items=6, correct=4))
+    rep = test_client.get("/report/addition/speed", params={"lo": 0, "hi": 20, "step": 1}).json()
+    assert sorted((x, y) for x, row in rep["grid"].items() for y in row) == [(str(i), str(i)) for i in range(1, 5)]
+    cell = rep["grid"]["1"]["1"]
+    assert cell["n"] == 1 and abs(cell["p50"] - 100) <= 2 * ALPHA * 100 and cell["p90"] == cell["p50"]
+    # Bucketed cells merge their facts' sketches
+    wide = test_client.get("/report/addition/speed", params={"lo": 0, "hi": 20, "step": 5}).json()
+    assert wide["grid"]["0"]["0"]["n"] == 4
+
+    with engine.connect() as conn:
+        rebuild_latency(conn, [uid])
+        conn.commit()
+    assert test_client.get("/report/addition/speed", params={"lo": 0, "hi": 20, "step": 1}).json() == rep
+    assert test_client.get("/report/addition/speed", params={"compact": 1}).json()["layout"] == "rows"
+
+
+def test_latency_sketch_decay_keeps_the_tail():
+    import numpy as np
+    from app.utils.latency import LatencySketch, ALPHA
+    ratios = []
+    for seed in range(60):
+        vals = np.random.default_rng(seed).lognormal(np.log(2500), 0.5, 800)
+        sk = LatencySketch()
+        for v in vals:
+            sk.add(float(v))   # halves a dozen times
+        ratios.append(sk.quantile(0.9) / (2500 * np.exp(1.2816 * 0.5)))
+    assert abs(np.median(ratios) - 1) <= ALPHA
+
+
+def test_latency_rebuild_cli(test_client: TestClient):
+    from app.utils.latency import main
+    from app.storage import engine, init_db
+
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Ola")
+    test_client.post("/finish", data=_finish_payload("addition", items=3, correct=3))
+
+    def facts():
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT user_id, x, y, attempts FROM factlatency ORDER BY x").all()
+
+    live = facts()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("DELETE FROM factlatency")
+        conn.commit()
+    init_db()   # startup no longer scans history to rebuild them
+    assert facts() == []
+    main([])
+    assert facts() == live == [(uid, i, i, 1) for i in (1, 2, 3)]
+    main([str(uid)])
+    assert facts() == live
+
+
+def test_progress_cas_retries_on_concurrent_update(test_client: TestClient, monkeypatch):
+    from sqlalchemy import update
+    from app.routers import drills
+    from app.storage import engine, get_session
+    from app.models import UserProgress
+    from sqlmodel import select
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Cas")
+    where = (UserProgress.user_id == uid, UserProgress.drill_type == "addition")
+
+    def bump():
+        # Another finish commits between our read and our write
+        with engine.begin() as conn:
+            conn.execute(update(UserProgress).where(*where).values(
+                stars_recent=UserProgress.stars_recent + "0", version=UserProgress.version + 1))
+
+    read, reads = drills._read_progress, []
+    def racing_read(s, u, dt):
+        row = read(s, u, dt)
+        reads.append(row.version)
+        if len(reads) == 1:
+            bump()
+        return row
+    monkeypatch.setattr(drills, "_read_progress", racing_read)
+    pay = test_client.post("/finish", data=_finish_payload("addition", correct=20, elapsed_ms=20000)).json()
+    assert pay["star"] is True and reads == [0, 1]
+    with get_session() as s:
+        prog = s.exec(select(UserProgress).where(*where)).first()
+        assert (prog.stars_recent, prog.version) == ("01", 2)
+
+    def always_stale(s, u, dt):
+        return (*read(s, u, dt)[:-1], 0)
+    monkeypatch.setattr(drills, "_read_progress", always_stale)
+    r = test_client.post("/finish", data=_finish_payload("addition"))
+    assert r.status_code == 409
+    with get_session() as s:
+        prog = s.exec(select(UserProgress).where(*where)).first()
+        assert (prog.stars_recent, prog.version) == ("01", 2)
+
+
+def test_request_uses_one_session(test_client: TestClient):
+    from sqlalchemy import delete, event
+    from sqlmodel import select
+    from app.storage import engine, get_session
+    from app.models import UserProgress, DrillTypeEnum
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Una")
+    with get_session() as s:
+        s.exec(delete(UserProgress).where(UserProgress.user_id == uid))
+        s.commit()
+    checkouts = []
+    listener = lambda *a: checkouts.append(1)
+    event.listen(engine, "checkout", listener)
+    try:
+        for call in (lambda: test_client.get("/progress"),
+                     lambda: test_client.post("/next", data={"drill_type": "addition"}),
+                     lambda: test_client.post("/start", data={"drill_type": "division"})):
+            checkouts.clear()
+            assert call().status_code == 200
+            assert checkouts == [1]
+    finally:
+        event.remove(engine, "checkout", listener)
+    with get_session() as s:
+        # Rows created inside the request were committed with it
+        assert len(s.exec(select(UserProgress.id).where(UserProgress.user_id == uid)).all()) == len(DrillTypeEnum)
+
+
+def test_fast_next_query_params_and_preset_cache(test_client: TestClient, monkeypatch):
+    from sqlalchemy import event
+    from app.routers import drills
+    from app.storage import engine
+    from app.levels import get_preset
+    from app.models import DrillTypeEnum
+    from app.utils.progress import preset_cache
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Vic")
+    mul = DrillTypeEnum.multiplication
+    r = test_client.get("/next", params={"drill_type": "multiplication"})
+    assert r.status_code == 200 and r.headers["cache-control"] == "no-store"
+    assert set(r.json()) == {"prompt", "answer", "tts"}
+    assert preset_cache.get(uid, mul) == get_preset(mul, 1)
+
+    checkouts = []
+    listener = lambda *a: checkouts.append(1)
+    event.listen(engine, "checkout", listener)
+    try:
+        for _ in range(5):
+            nxt = test_client.get("/next", params={"drill_type": "multiplication", "avoid_prompt": r.json()["prompt"]}).json()
+            assert nxt["prompt"] != r.json()["prompt"]
+    finally:
+        event.remove(engine, "checkout", listener)
+    assert checkouts == []   # served from the preset cache
+
+    assert test_client.get("/next", params={"drill_type": "nope"}).status_code == 422
+    # Coalesced with concurrent POST /next calls under the same key
+    keys, do = [], drills.inflight.do
+    monkeypatch.setattr(drills.inflight, "do", lambda key, fn: keys.append(key) or do(key, fn))
+    test_client.get("/next", params={"drill_type": "multiplication", "avoid_pair": "2x3"})
+    test_client.post("/next", data={"drill_type": "multiplication", "avoid_pair": "2x3"})
+    assert keys == [("next", uid, mul, None, "2x3")] * 2
+
+    for _ in range(3):
+        pay = test_client.post("/finish", data=_finish_payload("multiplication", correct=19, elapsed_ms=25000)).json()
+    assert pay["level_up"] is True and preset_cache.get(uid, mul) is None
+    test_client.get("/next", params={"drill_type": "multiplication"})
+    assert preset_cache.get(uid, mul) == get_preset(mul, pay["new_level"])
+
+    # A drill that outran its plan mixes in /next items (no `i`): stored unseeded
+    from app.utils.drill_plan import plan_problems
+    plan = plan_problems(mul, 1, 99)
+    qlog = [{"i": 0, "prompt": plan[0][0], "a": plan[0][3], "b": plan[0][4], "correct_answer": plan[0][1],
+             "given_answer": plan[0][1], "correct": True, "started_at": "2024-01-01T00:00:00", "elapsed_ms": 300},
+            {"prompt": nxt["prompt"], "a": 1, "b": 1, "correct_answer": nxt["answer"], "given_answer": 0,
+             "correct": False, "started_at": "2024-01-01T00:00:01", "elapsed_ms": 300}]
+    test_client.post("/finish", data={**_finish_payload("multiplication"), "qlog": json.dumps(qlog),
+                                      "seed": "99", "plan_level": "1", "question_count": "2"})
+    from app.storage import get_session
+    from app.models import DrillResult, DrillQuestion
+    from sqlmodel import select
+    with get_session() as s:
+        rec = s.exec(select(DrillResult).order_by(DrillResult.id.desc())).first()
+        assert rec.seed is None and rec.packed_questions is None
+        assert len(s.exec(select(DrillQuestion).where(DrillQuestion.drill_result_id == rec.id)).all()) == 2
+
+
+def test_packed_questions_storage_and_migration(test_client: TestClient, monkeypatch):
+    from datetime import datetime
+    from sqlmodel import select
+    from app.routers import drills
+    from app.storage import engine, get_session
+    from app.models import DrillQuestion, DrillResult, DrillTypeEnum
+    from app.utils.question_pack import pack_questions, unpack_questions, pack_history
+    add = DrillTypeEnum.addition
+
+    def result_attempts(rec):
+        return unpack_questions(rec.drill_type, rec.packed_questions) if rec.packed_questions else None
+
+    qs = [{"a": 3, "b": 4, "prompt": "3 + 4", "correct_answer": 7, "given_answer": 6, "correct": False,
+           "started_at": datetime(2024, 1, 1, 0, 0, 0, 123456), "elapsed_ms": 900},
+          {"a": 3, "b": 4, "prompt": "3 + 4", "correct_answer": 7, "given_answer": 7, "correct": True,
+           "started_at": datetime(2024, 1, 1, 0, 0, 1, 5), "elapsed_ms": 400}]
+    assert unpack_questions(add, pack_questions(add, qs)) == qs
+    odd = [{**qs[0], "prompt": "three plus four ✓"}, qs[1]]
+    assert unpack_questions(add, pack_questions(add, odd)) == odd
+
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Pax")
+    test_client.post("/finish", data=_finish_payload("addition", correct=18))   # rows
+    before = test_client.get("/report/addition").json()
+    monkeypatch.setattr(drills, "PACK_QUESTIONS", True)
+    test_client.post("/finish", data=_finish_payload("addition", correct=20))   # packed
+    with get_session() as s:
+        old, new = s.exec(select(DrillResult).where(DrillResult.user_id == uid).order_by(DrillResult.id)).all()
+        assert old.packed_questions is None and result_attempts(old) is None
+        assert not s.exec(select(DrillQuestion).where(DrillQuestion.drill_result_id == new.id)).all()
+        attempts = result_attempts(new)
+        assert len(attempts) == 20 and all(e["correct"] for e in attempts)
+        rows = [dict(a=q.a, b=q.b, prompt=q.prompt, correct_answer=q.correct_answer, given_answer=q.given_answer,
+                     correct=q.correct, started_at=q.started_at, elapsed_ms=q.elapsed_ms)
+                for q in s.exec(select(DrillQuestion).where(DrillQuestion.drill_result_id == old.id)
+                                .order_by(DrillQuestion.id)).all()]
+    # Report reads both forms; the newest attempt per fact is the packed drill's
+    assert test_client.get("/report/addition", params={"last_n": 1}).json()["grid"]["1"]["1"] == 0
+    mixed = test_client.get("/report/addition").json()
+
+    with engine.connect() as conn:
+        assert pack_history(conn, batch_size=1) == 1
+    with get_session() as s:
+        assert not s.exec(select(DrillQuestion)).all()
+        assert result_attempts(s.get(DrillResult, old.id)) == rows
+    assert test_client.get("/report/addition").json() == mixed != before
+    # Only the newest STORED_SCAN stored drills are merged: here just the all-correct one
+    from app.utils import report_engine
+    monkeypatch.setattr(report_engine, "STORED_SCAN", 1)
+    grid = test_client.get("/report/addition").json()["grid"]
+    assert grid and all(v == 0 for row in grid.values() for v in row.values())
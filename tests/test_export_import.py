@@ -0,0 +1,186 @@
+import csv
+import gzip
+import io
+import json
+from fastapi.testclient import TestClient
+
+from tests.test_drill_flow import _finish_payload
+from tests.test_admin_and_utils import _admin_login
+
+
+def _seed(client: TestClient, names=("Olly", "Pia")):
+    create_user = __import__("tests.conftest", fromlist=["create_user"]).create_user
+    uids = []
+    for n in names:
+        uids.append(create_user(client, n))
+        client.post("/finish", data=_finish_payload("addition", items=5, correct=4, elapsed_ms=9000))
+    return uids
+
+
+def test_export_requires_admin(test_client: TestClient):
+    assert test_client.get("/admin/export/users").status_code == 403
+
+
+def test_export_ndjson_csv_and_gzip(test_client: TestClient):
+    uids = _seed(test_client)
+    _admin_login(test_client)
+
+    r = test_client.get("/admin/export/questions", params={"user_id": uids[0]})
+    rows = [json.loads(l) for l in r.text.splitlines()]
+    assert len(rows) == 5 and rows[0]["drill_type"] == "addition"
+
+    r = test_client.get("/admin/export/users", params={"format": "csv"})
+    table = list(csv.DictReader(io.StringIO(r.text)))
+    assert [t["display_name"] for t in table] == ["Olly", "Pia"]
+
+    r = test_client.get("/admin/export/all", params={"gzip": 1})
+    assert r.headers["content-type"].startswith("application/gzip")
+    lines = gzip.decompress(r.content).decode().splitlines()
+    tables = {json.loads(l)["_table"] for l in lines}
+    assert tables == {"users", "progress", "results", "questions", "awards"}
+
+    # Date filter excludes everything before the range
+    r = test_client.get("/admin/export/results", params={"since": "2999-01-01"})
+    assert r.text == ""
+
+
+def test_import_roundtrip_remaps_ids(test_client: TestClient):
+    from app.storage import get_session
+    from app.models import User, DrillResult, DrillQuestion
+    from sqlmodel import select
+    _seed(test_client)
+    _admin_login(test_client)
+    dump = test_client.get("/admin/export/all", params={"gzip": 1}).content
+
+    r = test_client.post("/admin/import", files={"file": ("all.ndjson.gz", dump)}, allow_redirects=False)
+    assert r.status_code == 303 and "imported=" in r.headers["location"]
+    with get_session() as s:
+        users = s.exec(select(User).order_by(User.id)).all()
+        assert [u.display_name for u in users] == ["Olly", "Pia", "Olly", "Pia"]
+        copy = users[2]
+        res = s.exec(select(DrillResult).where(DrillResult.user_id == copy.id)).all()
+        assert len(res) == 1
+        qs = s.exec(select(DrillQuestion).where(DrillQuestion.drill_result_id == res[0].id)).all()
+        assert len(qs) == 5 and all(q.drill_type.value == "addition" for q in qs)
+
+
+def test_import_cli_small_batches(test_client: TestClient, tmp_path):
+    from app.utils.bulk_import import main
+    from app.storage import get_session
+    from app.models import DrillQuestion
+    from sqlmodel import select
+    _seed(test_client)
+    _admin_login(test_client)
+    path = tmp_path / "q.ndjson"
+    path.write_bytes(test_client.get("/admin/export/all").content)
+    main([str(path), "--batch", "3", "--commit-every", "2"])
+    with get_session() as s:
+        assert len(s.exec(select(DrillQuestion)).all()) == 20
+
+
+def test_import_error_removes_committed_rows_and_keeps_indexes(test_client: TestClient):
+    import pytest
+    from app.storage import engine
+    from app.utils.bulk_import import import_ndjson
+    _seed(test_client)
+    _admin_login(test_client)
+    dump = test_client.get("/admin/export/all").content
+
+    def snapshot():
+        with engine.connect() as conn:
+            counts = [conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{t}"').scalar()
+                      for t in ("user", "userprogress", "drillresult", "drillquestion", "drillaward")]
+            indexes = sorted(r[0] for r in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='index'"))
+        return counts, indexes
+
+    before = snapshot()
+    for drop in (False, True):
+        # Commits after every row, then fails on the last line
+        with pytest.raises(ValueError):
+            import_ndjson(io.BytesIO(dump + b'{"_table": "nope"}\n'), batch_size=1, commit_every=1,
+                          drop_indexes=drop)
+        assert snapshot() == before
+    assert test_client.post("/admin/import", files={"file": ("bad.ndjson", dump + b"{oops\n")}).status_code == 400
+    assert snapshot() == before
+
+
+def test_import_alongside_live_writes(test_client: TestClient):
+    import pytest
+    from app.storage import engine
+    from app.utils.bulk_import import import_ndjson
+    _seed(test_client)
+    _admin_login(test_client)
+    dump = test_client.get("/admin/export/all").content
+
+    class LiveFile(io.BytesIO):
+        # A drill finishes between two committed import batches
+        def __iter__(self):
+            for k, line in enumerate(iter(self.readline, b"")):
+                if k == 3:
+                    assert test_client.post("/finish", data=_finish_payload("addition")).status_code == 200
+                yield line
+
+    def results():
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT COUNT(*) FROM drillresult").scalar()
+
+    counts = import_ndjson(LiveFile(dump), batch_size=1, commit_every=1)
+    assert counts["results"] == 2 and results() == 2 + 1 + 2
+    with pytest.raises(ValueError):
+        import_ndjson(LiveFile(dump + b'{"_table": "nope"}\n'), batch_size=1, commit_every=1)
+    assert results() == 5 + 1   # the live drill stays, the failed import's rows are gone
+
+    # Keeping ids that already exist is a conflict, not a server error
+    r = test_client.post("/admin/import", files={"file": ("all.ndjson", dump)}, data={"keep_ids": "true"})
+    assert r.status_code == 409 and results() == 6
+
+
+def test_export_decodes_packed_questions(test_client: TestClient, monkeypatch):
+    from app.routers import drills
+    uids = _seed(test_client, names=("Rows",))
+    monkeypatch.setattr(drills, "PACK_QUESTIONS", True)
+    uids += _seed(test_client, names=("Packed",))
+    _admin_login(test_client)
+    rows = [json.loads(l) for l in test_client.get("/admin/export/questions").text.splitlines()]
+    assert [r["id"] is None for r in rows] == [False] * 5 + [True] * 5
+    assert rows[5:] == [{**r, "id": None, "drill_result_id": r["drill_result_id"] + 1} for r in rows[:5]]
+    results = [json.loads(l) for l in test_client.get("/admin/export/results").text.splitlines()]
+    assert all("packed_questions" not in r for r in results)
+
+
+def test_export_pages_do_not_hold_read_lock(test_client: TestClient, monkeypatch):
+    import sqlite3
+    from app.routers import export
+    from app.storage import DB_PATH
+    _seed(test_client)
+    monkeypatch.setattr(export, "PAGE_ROWS", 3)
+    rows = export.iter_rows("questions")
+    first = [next(rows) for _ in range(2)]
+    # Mid-download, a writer can still commit (rollback journal: a held SHARED lock would block it)
+    con = sqlite3.connect(DB_PATH, timeout=0.1)
+    con.execute('UPDATE "user" SET display_name = display_name')
+    con.commit()
+    con.close()
+    ids = [r["id"] for r in first + list(rows)]
+    assert ids == sorted(ids) and len(ids) == 10
+
+
+def test_export_includes_seeded_drill_questions(test_client: TestClient):
+    from app.models import DrillTypeEnum
+    from app.utils.drill_plan import plan_problems
+    uid = __import__("tests.conftest", fromlist=["create_user"]).create_user(test_client, "Seed")
+    seed = 424242
+    plan = plan_problems(DrillTypeEnum.addition, 1, seed)
+    qlog = [{"i": i, "given_answer": plan[i][1], "started_at": f"2024-01-01T00:00:{i:02d}", "elapsed_ms": 500}
+            for i in range(4)]
+    test_client.post("/finish", data={
+        "drill_type": "addition", "elapsed_ms": "9000", "settings_human": "x", "question_count": "4",
+        "score": "4", "qlog": json.dumps(qlog), "seed": str(seed), "plan_level": "1",
+    })
+    _admin_login(test_client)
+    r = test_client.get("/admin/export/questions", params={"format": "csv", "user_id": uid})
+    table = list(csv.DictReader(io.StringIO(r.text)))
+    assert [(int(t["a"]), int(t["b"]), t["prompt"]) for t in table] == [(p[3], p[4], p[0]) for p in plan[:4]]
+    assert all(t["correct"] == "True" and t["elapsed_ms"] == "500" for t in table)
+    results = [json.loads(l) for l in test_client.get("/admin/export/results").text.splitlines()]
+    assert results[0]["seed"] == seed and "attempts" not in results[0]
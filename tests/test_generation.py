@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.levels import LEVELS
+from app.logic import generate_batch, batch_prompts, is_commutative_op_key
+from app.models import DrillTypeEnum
+
+
+def test_generate_batch_valid_deterministic_and_no_repeats():
+    for dt, levels in LEVELS.items():
+        for lvl in levels:
+            b1 = generate_batch(dt, lvl.params, 2000, seed=7)
+            b2 = generate_batch(dt, lvl.params, 2000, seed=7)
+            assert np.array_equal(b1.a, b2.a) and np.array_equal(b1.answer, b2.answer)
+            if dt == DrillTypeEnum.multiplication:
+                assert np.array_equal(b1.a * b1.b, b1.answer)
+            elif dt == DrillTypeEnum.addition:
+                assert np.array_equal(b1.a + b1.b, b1.answer)
+                assert b1.a.max() <= lvl.params["max"] and b1.b.min() >= lvl.params["min"]
+            elif dt == DrillTypeEnum.subtraction:
+                assert (b1.answer >= 0).all() and np.array_equal(b1.a - b1.b, b1.answer)
+            else:
+                assert np.array_equal(b1.b * b1.answer, b1.a)
+                assert set(np.unique(b1.b)) <= set(lvl.params["divisor_set"])
+            prompts = batch_prompts(dt, b1)
+            keys = [is_commutative_op_key(p) or p for p in prompts]
+            repeats = sum(k1 == k2 for k1, k2 in zip(keys, keys[1:]))
+            # Single-fact-ish presets (e.g. "÷ by 2, answers 1–5") may keep a stray repeat
+            assert repeats <= 2
+
+
+def test_generate_batch_recap_focus_weighting():
+    # a fixed at 20 so the table operand is identifiable after the random swap
+    preset = {"a_min": 20, "a_max": 20, "b_set": [2, 3], "recap_focus": [3], "recap_weight": 0.7}
+    b = generate_batch(DrillTypeEnum.multiplication, preset, 200_000, seed=1, avoid_repeats=False)
+    table = np.where(b.a == 20, b.b, b.a)
+    assert abs((table == 3).mean() - (0.7 + 0.3 / 2)) < 0.01
+    assert abs((b.a == 20).mean() - 0.5) < 0.01
+
+
+def test_progression_sim_reports_drills_to_level_up():
+    from app.levels import next_level, next_target_sec
+    from app.utils.progression_sim import SimConfig, run
+    # Level 1 skips the recap level right after it; target = 1.5 x best, capped at TMAX
+    assert next_level(DrillTypeEnum.multiplication, 1) == 3
+    assert next_target_sec(3, 100.0) == 150 and next_target_sec(3, 1000.0) == 480
+
+    cfg = SimConfig(learners=40, max_drills=60, seed=7)
+    rep = run(cfg, [DrillTypeEnum.addition], workers=1)
+    assert run(cfg, [DrillTypeEnum.addition], workers=1) == rep
+    rows = rep["addition"]
+    assert rows[0]["level"] == 1 and rows[0]["learners"] == 40
+    assert 3 <= rows[0]["p10"] <= rows[0]["p50"] <= rows[0]["p90"] <= 60
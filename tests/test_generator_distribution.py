@@ -0,0 +1,282 @@
+"""Distribution-equivalence checks for problem generators.
+
+The scalar ``generate_from_preset`` is the reference. For every level in
+LEVELS a large seeded sample was drawn and recorded in REFERENCE_FILE as
+histograms: (a, b) pairs (bucketed on wide ranges), carry/borrow counts and
+answers. A candidate generator passes a level when a two-sample chi-square
+test on the pair and carry/borrow histograms and a two-sample KS test on the
+answers all give p >= P_MIN. Everything is seeded, so results are
+deterministic. The negative controls show the same tolerances catch a
+dropped recap focus, bias_hard or carry/borrow bias.
+
+Re-record the reference only after a deliberate change to the scalar
+generator or LEVELS: ``python tests/test_generator_distribution.py``.
+
+Candidates are compared with ``avoid_repeats=False``: the no-repeat redraw is
+a deliberate change to the sequence, not to the per-problem distribution.
+"""
+import json
+import math
+import pathlib
+import random
+import sys
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from app.levels import LEVELS
+from app.logic import generate_from_preset, generate_batch
+from app.models import DrillTypeEnum
+
+N = 20_000
+N_RECHECK = 4_000   # scalar re-draw checked against the recorded reference
+P_MIN = 1e-4
+MAX_AXIS_BUCKETS = 20
+MIN_CELL = 10   # pooled count below which histogram cells are merged
+REFERENCE_FILE = pathlib.Path(__file__).resolve().parent / "data" / "generator_reference.json"
+
+Sample = Tuple[np.ndarray, np.ndarray, np.ndarray]   # a, b, answer
+
+
+# ---------- statistics (no scipy here) ----------
+
+def _gammaincc(s: float, x: float) -> float:
+    """Regularised upper incomplete gamma Q(s, x)."""
+    if x <= 0:
+        return 1.0
+    log_pre = s * math.log(x) - x - math.lgamma(s)
+    if x < s + 1:   # series for P, then Q = 1 - P
+        term = total = 1.0 / s
+        k = s
+        while abs(term) > abs(total) * 1e-15:
+            k += 1
+            term *= x / k
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_pre))
+    # Continued fraction (modified Lentz)
+    tiny = 1e-300
+    b = x + 1.0 - s
+    c, d = 1.0 / tiny, 1.0 / b
+    h = d
+    for i in range(1, 10_000):
+        an = -i * (i - s)
+        b += 2.0
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return math.exp(log_pre) * h
+
+
+def chi2_sf(stat: float, df: int) -> float:
+    return _gammaincc(df / 2.0, stat / 2.0)
+
+
+def chi2_two_sample(c1: Counter, c2: Counter) -> Tuple[float, int, float]:
+    """Homogeneity test of two histograms; sparse cells are pooled. Returns (stat, df, p)."""
+    keys = sorted(set(c1) | set(c2), key=lambda k: c1[k] + c2[k], reverse=True)
+    cells, rest = [], [0, 0]
+    for k in keys:
+        if c1[k] + c2[k] >= MIN_CELL:
+            cells.append((c1[k], c2[k]))
+        else:
+            rest[0] += c1[k]
+            rest[1] += c2[k]
+    if sum(rest):
+        cells.append(tuple(rest))
+    if len(cells) < 2:
+        return 0.0, 0, 1.0
+    n1, n2 = sum(c[0] for c in cells), sum(c[1] for c in cells)
+    stat = 0.0
+    for o1, o2 in cells:
+        tot = o1 + o2
+        e1, e2 = tot * n1 / (n1 + n2), tot * n2 / (n1 + n2)
+        stat += (o1 - e1) ** 2 / e1 + (o2 - e2) ** 2 / e2
+    df = len(cells) - 1
+    return stat, df, chi2_sf(stat, df)
+
+
+def ks_two_sample(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """Two-sample Kolmogorov–Smirnov (asymptotic p; conservative for discrete data)."""
+    x, y = np.sort(x), np.sort(y)
+    grid = np.union1d(x, y)
+    d = float(np.max(np.abs(np.searchsorted(x, grid, "right") / x.size
+                            - np.searchsorted(y, grid, "right") / y.size)))
+    ne = x.size * y.size / (x.size + y.size)
+    lam = (math.sqrt(ne) + 0.12 + 0.11 / math.sqrt(ne)) * d
+    if lam < 1e-3:
+        return d, 1.0
+    p = 2.0 * sum((-1) ** (j - 1) * math.exp(-2.0 * j * j * lam * lam) for j in range(1, 101))
+    return d, min(1.0, max(0.0, p))
+
+
+# ---------- samples and reference histograms ----------
+
+_OPS = {"×", "+", "−", "÷"}
+
+
+def scalar_sample(drill_type: DrillTypeEnum, preset: dict, n: int, seed: int) -> Sample:
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        rows = []
+        for _ in range(n):
+            prompt, ans, _ = generate_from_preset(drill_type, preset)
+            a, op, b = prompt.split(" ")
+            assert op in _OPS
+            rows.append((int(a), int(b), ans))
+    finally:
+        random.setstate(state)
+    a, b, ans = (np.array(c) for c in zip(*rows))
+    return a, b, ans
+
+
+def batch_sample(drill_type: DrillTypeEnum, preset: dict, n: int, seed: int) -> Sample:
+    batch = generate_batch(drill_type, preset, n, seed=seed, avoid_repeats=False)
+    return batch.a, batch.b, batch.answer
+
+
+def carry_flags(drill_type: DrillTypeEnum, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if drill_type == DrillTypeEnum.addition:
+        return (a % 10) + (b % 10) >= 10
+    if drill_type == DrillTypeEnum.subtraction:
+        return (a % 10) < (b % 10)
+    return np.zeros(a.size, dtype=bool)
+
+
+def histograms(drill_type: DrillTypeEnum, sample: Sample, width: int) -> Dict[str, Counter]:
+    a, b, _ = sample
+    carry = carry_flags(drill_type, a, b)
+    return {
+        "pairs": Counter(zip((a // width).tolist(), (b // width).tolist())),
+        "carry": Counter(carry.tolist()),
+    }
+
+
+def axis_width(drill_type: DrillTypeEnum, preset: dict) -> int:
+    if drill_type in (DrillTypeEnum.addition, DrillTypeEnum.subtraction):
+        return max(1, math.ceil((preset["max"] + 1) / MAX_AXIS_BUCKETS))
+    if drill_type == DrillTypeEnum.division:
+        top = max(preset["divisor_set"]) * preset["q_max"]
+        return max(1, math.ceil((top + 1) / MAX_AXIS_BUCKETS))
+    return 1
+
+
+def record_reference() -> dict:
+    out = {}
+    for dt, lvls in LEVELS.items():
+        out[dt.value] = []
+        for level, lv in enumerate(lvls):
+            sample = scalar_sample(dt, lv.params, N, seed=1000 + level)
+            hist = histograms(dt, sample, axis_width(dt, lv.params))
+            out[dt.value].append({
+                "pairs": sorted([a, b, c] for (a, b), c in hist["pairs"].items()),
+                "carry": sorted([int(k), c] for k, c in hist["carry"].items()),
+                "answers": sorted([int(v), c] for v, c in Counter(sample[2].tolist()).items()),
+            })
+    return out
+
+
+@lru_cache(maxsize=None)
+def _recorded() -> dict:
+    return json.loads(REFERENCE_FILE.read_text())
+
+
+def reference(drill_type: DrillTypeEnum, level: int) -> Tuple[np.ndarray, Dict[str, Counter]]:
+    """Recorded answers (expanded) and histograms for one level."""
+    rec = _recorded()[drill_type.value][level]
+    answers = np.repeat(*np.array(rec["answers"]).T)
+    hist = {
+        "pairs": Counter({(a, b): c for a, b, c in rec["pairs"]}),
+        "carry": Counter({bool(k): c for k, c in rec["carry"]}),
+    }
+    return answers, hist
+
+
+def compare(drill_type: DrillTypeEnum, level: int, candidate: Callable[..., Sample],
+            seed: int = 7, n: int = N) -> Dict[str, float]:
+    """p-values of a candidate against the reference for one level."""
+    preset = LEVELS[drill_type][level].params
+    ref_answers, ref_hist = reference(drill_type, level)
+    cand = candidate(drill_type, preset, n, seed + level)
+    hist = histograms(drill_type, cand, axis_width(drill_type, preset))
+    return {
+        "pairs": chi2_two_sample(ref_hist["pairs"], hist["pairs"])[2],
+        "carry": chi2_two_sample(ref_hist["carry"], hist["carry"])[2],
+        "answers": ks_two_sample(ref_answers, cand[2])[1],
+    }
+
+
+def failures(candidate: Callable[..., Sample], levels=None, n: int = N) -> List[str]:
+    out = []
+    for dt, lvls in LEVELS.items():
+        for i in range(len(lvls)):
+            if levels is not None and (dt, i) not in levels:
+                continue
+            for name, p in compare(dt, i, candidate, n=n).items():
+                if p < P_MIN:
+                    out.append(f"{dt.value} L{i + 1} {name}: p={p:.2e}")
+    return out
+
+
+# ---------- tests ----------
+
+def test_statistics_match_known_values():
+    # chi-square survival: df=2 is exp(-x/2); 95th percentiles of df=1 and df=10
+    assert abs(chi2_sf(4.0, 2) - math.exp(-2.0)) < 1e-12
+    assert abs(chi2_sf(3.841458820694124, 1) - 0.05) < 1e-9
+    assert abs(chi2_sf(18.307038053275146, 10) - 0.05) < 1e-9
+    rng = np.random.default_rng(0)
+    same = ks_two_sample(rng.normal(size=5000), rng.normal(size=5000))[1]
+    shifted = ks_two_sample(rng.normal(size=5000), rng.normal(0.1, size=5000))[1]
+    assert same > 0.01 and shifted < 1e-3
+
+
+def test_reference_is_stable_across_seeds():
+    # Also catches drift between the scalar generator and the recorded reference
+    assert failures(lambda dt, preset, n, seed: scalar_sample(dt, preset, n, seed + 5000), n=N_RECHECK) == []
+
+
+def test_reference_covers_levels():
+    assert {dt: len(_recorded()[dt.value]) for dt in LEVELS} == {dt: len(lvls) for dt, lvls in LEVELS.items()}
+
+
+def test_batch_generator_matches_reference():
+    assert failures(batch_sample) == []
+
+
+def _levels_with(key: str, pred=bool):
+    return {(dt, i) for dt, lvls in LEVELS.items() for i, lv in enumerate(lvls) if pred(lv.params.get(key))}
+
+
+# Mutations that leave the distribution unchanged, so no test can see them
+_NO_OP = {
+    ("recap_focus", DrillTypeEnum.multiplication, 1),   # focus == b_set == [2]
+    ("borrow_bias", DrillTypeEnum.subtraction, 0),      # max 10: a, b >= 10 only for 10 - 10
+}
+
+
+def test_negative_controls_are_detected():
+    def without(key):
+        return lambda dt, preset, n, seed: batch_sample(dt, {k: v for k, v in preset.items() if k != key}, n, seed)
+
+    missed = set()
+    for key in ("recap_focus", "bias_hard", "carry_bias", "borrow_bias"):
+        for dt, i in _levels_with(key, lambda v: bool(v) and v != 0.0):
+            if not failures(without(key), {(dt, i)}):
+                missed.add((key, dt, i))
+    assert missed == _NO_OP
+
+
+if __name__ == "__main__":
+    REFERENCE_FILE.write_text(json.dumps(record_reference(), separators=(",", ":")) + "\n")
+    print(f"wrote {REFERENCE_FILE}")